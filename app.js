@@ -5,6 +5,9 @@ const API_URL = '/api';
 // State
 const state = {
     loans: [],
+    loansVersion: 0, // sync version of state.loans, see fetchLoans
+    loansEtag: null, // ETag of the last /loans sync, sent back as If-None-Match
+    summary: null, // dashboard header totals from /portfolio/summary
     listings: [],
     view: 'auth', // 'auth', 'dashboard', 'create', 'reset', 'marketplace'
     user: JSON.parse(localStorage.getItem('loanLink_user')) || null,
@@ -25,8 +28,10 @@ const getTermUnit = (freq) => {
     return 'mo';
 };
 
-const apiRequest = async (endpoint, method = 'GET', body = null) => {
-    const headers = {};
+// Resolves to null for a 304 Not Modified; options.headers are sent as-is and
+// options.onResponse sees the raw Response (e.g. to read its ETag)
+const apiRequest = async (endpoint, method = 'GET', body = null, options = {}) => {
+    const headers = { ...(options.headers || {}) };
     if (state.token) {
         headers['Authorization'] = `Bearer ${state.token}`;
     }
@@ -45,6 +50,8 @@ const apiRequest = async (endpoint, method = 'GET', body = null) => {
 
     try {
         const response = await fetch(`${API_URL}${endpoint}`, config);
+        if (options.onResponse) options.onResponse(response);
+        if (response.status === 304) return null;
         const contentType = response.headers.get("content-type");
 
         if (contentType && contentType.indexOf("application/json") !== -1) {
@@ -92,6 +99,8 @@ const finishAuth = (data) => {
     state.user = { email: data.email, name: data.name };
     localStorage.setItem('loanLink_token', state.token);
     localStorage.setItem('loanLink_user', JSON.stringify(state.user));
+    state.loansVersion = 0;
+    state.loansEtag = null;
     navigate('dashboard');
     fetchLoans();
 };
@@ -100,18 +109,68 @@ const logout = () => {
     state.token = null;
     state.user = null;
     state.loans = [];
+    state.loansVersion = 0;
+    state.loansEtag = null;
+    state.summary = null;
     localStorage.removeItem('loanLink_token');
     localStorage.removeItem('loanLink_user');
     navigate('auth');
 };
 
 // Loan Actions
+// Only asks for what changed since the last fetch (the first fetch, since=0, gets everything),
+// and revalidates with the last ETag so an unchanged portfolio costs a bodyless 304
+// Header totals come from the server-side summary, so they show before the loan list arrives
+const fetchSummary = async () => {
+    try {
+        state.summary = await apiRequest('/portfolio/summary');
+        renderSummary();
+    } catch (e) {
+        console.error("Failed to fetch portfolio summary", e);
+    }
+};
+
+const renderSummary = () => {
+    const owedEl = document.getElementById('total-owed');
+    const lentEl = document.getElementById('total-lent');
+    if (!owedEl || !lentEl || !state.summary) return;
+    owedEl.textContent = formatMoney(state.summary.total_owed);
+    lentEl.textContent = formatMoney(state.summary.total_lent);
+};
+
 const fetchLoans = async () => {
+    fetchSummary();
     try {
         console.log('Fetching loans...');
-        const loans = await apiRequest('/loans');
-        console.log('Loans fetched:', loans);
-        state.loans = loans;
+        const since = state.loansVersion || 0;
+        let etag = null;
+        const changes = await apiRequest(`/loans?since=${since}`, 'GET', null, {
+            headers: since && state.loansEtag ? { 'If-None-Match': state.loansEtag } : {},
+            onResponse: (response) => { etag = response.headers.get('ETag'); }
+        });
+        if (changes === null) {
+            console.log('Loans unchanged since version', since);
+            return;
+        }
+        console.log('Loan changes fetched:', changes);
+
+        // A full response (first sync, or one older than the server keeps deletions for) replaces the list
+        const byId = new Map(since && !changes.full ? state.loans.map(l => [l.id, l]) : []);
+        changes.deleted.forEach(id => byId.delete(id));
+        changes.loans.forEach(loan => {
+            const previous = byId.get(loan.id);
+            byId.set(loan.id, { ...loan, history: previous ? previous.history : [] });
+        });
+        changes.payments.forEach(payment => {
+            const loan = byId.get(payment.loan_id);
+            if (!loan) return;
+            loan.history = loan.history.filter(p => p.id !== payment.id).concat(payment);
+            loan.history.sort((a, b) => (a.date || '').localeCompare(b.date || ''));
+        });
+
+        state.loans = [...byId.values()].sort((a, b) => (b.created_at || '').localeCompare(a.created_at || ''));
+        state.loansVersion = changes.version;
+        state.loansEtag = etag;
         if (state.view === 'dashboard') renderDashboard();
     } catch (e) {
         console.error("Failed to fetch loans", e);
@@ -166,6 +225,9 @@ const recordPayment = async (loanId, amount, method, date, file) => {
         if (file) {
             formData.append('proof', file);
         }
+        // The server rejects the payment (409) if the loan changed since we loaded it
+        const loan = state.loans.find(l => l.id === loanId);
+        if (loan && loan.version !== undefined) formData.append('version', loan.version);
 
         await apiRequest(`/loans/${loanId}/pay`, 'POST', formData);
         document.getElementById('payment-modal').classList.add('hidden');
@@ -174,6 +236,7 @@ const recordPayment = async (loanId, amount, method, date, file) => {
         alert('Payment recorded!');
     } catch (e) {
         alert("Failed to pay: " + e.message);
+        fetchLoans();
     }
 };
 
@@ -567,8 +630,6 @@ const renderDashboard = () => {
     pendingContainer.innerHTML = '';
     activeContainer.innerHTML = '';
 
-    let totalOwed = 0;
-    let totalLent = 0;
     let hasPending = false;
 
     try {
@@ -624,10 +685,7 @@ const renderDashboard = () => {
                 hasPending = true;
 
             } else if (loan.status === 'active') {
-                // Calculate stats
                 const remaining = loan.total - loan.paid;
-                if (loan.role === 'borrower') totalOwed += remaining;
-                else totalLent += remaining;
 
                 const div = document.createElement('div');
                 div.className = 'loan-item ' + (loan.role === 'borrower' ? 'owed' : '');
@@ -679,8 +737,7 @@ const renderDashboard = () => {
     if (hasPending) pendingSection.classList.remove('hidden');
     else pendingSection.classList.add('hidden');
 
-    document.getElementById('total-owed').textContent = formatMoney(totalOwed);
-    document.getElementById('total-lent').textContent = formatMoney(totalLent);
+    renderSummary();
 };
 
 const renderArchive = () => {
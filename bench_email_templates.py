@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+# Point the server at a throwaway database, uploads dir and static build dir
+# before importing it
+SCRATCH = tempfile.mkdtemp()
+os.environ.setdefault("LOANLINK_DB", os.path.join(SCRATCH, "bench_email.db"))
+os.environ.setdefault("LOANLINK_UPLOADS", os.path.join(SCRATCH, "uploads"))
+os.environ.setdefault("LOANLINK_STATIC_BUILD", os.path.join(SCRATCH, "static"))
+os.environ.setdefault("EMAIL_OUTBOX_WORKERS", "0")
+
+import server
+
+CURRENCY_LOAN = {
+    'asset_type': 'currency', 'amount': 2500, 'rate': 7.5, 'months': 12, 'interest_type': 'amortized',
+    'monthly': 216.89, 'total': 2602.68, 'role': 'lender', 'payment_frequency': 'Monthly',
+    'loan_date': '2026-01-01', 'repayment_start_date': '2026-02-01', 'creator_name': 'Alice <Lender>',
+    'app_url': 'https://loanlink.example/',
+}
+ITEM_LOAN = {
+    **CURRENCY_LOAN, 'asset_type': 'item', 'item_name': 'Cordless Drill & Bits',
+    'item_description': 'Includes case', 'item_condition': 'Good', 'payment_frequency': 'Weekly',
+}
+RESET = {'subject': "Reset Your LoanLink Password", 'reset_url': 'https://loanlink.example/#reset?token=abc'}
+BATCH_SIZE = 1000
+
+def rate(fn, rounds=5, round_seconds=0.3):
+    """Best calls-per-second of fn over several short rounds (less noisy than one long run)."""
+    fn()
+    best = 0.0
+    for _ in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= round_seconds:
+                break
+        best = max(best, calls / elapsed)
+    return best
+
+def run():
+    batch = [server.loan_email_context(ITEM_LOAN if i % 3 == 0 else CURRENCY_LOAN) for i in range(BATCH_SIZE)]
+    return {
+        'loan_request_currency': rate(lambda: server.build_loan_notification_email(CURRENCY_LOAN)),
+        'loan_request_item': rate(lambda: server.build_loan_notification_email(ITEM_LOAN)),
+        'password_reset': rate(lambda: server.render_email('password_reset', RESET)),
+        'loan_request_batch': rate(lambda: server.render_email_batch('loan_request', batch)) * BATCH_SIZE,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Email template renders per second")
+    parser.add_argument('--save', metavar='FILE', help="write results as a JSON baseline")
+    parser.add_argument('--baseline', metavar='FILE', help="compare against a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown vs baseline (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = run()
+    for name, renders in results.items():
+        print(f"{name:<24} {renders:>12,.0f} renders/s")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [name for name, renders in results.items()
+                       if name in baseline and renders < baseline[name] * (1 - args.tolerance)]
+        for name in regressions:
+            print(f"REGRESSION {name}: {results[name]:,.0f} < {baseline[name]:,.0f} renders/s")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
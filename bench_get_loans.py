@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+# Point the server at a throwaway database, uploads dir and static build dir
+# before importing it, so the benchmark leaves the working tree alone
+SCRATCH = tempfile.mkdtemp()
+DB_PATH = os.path.join(SCRATCH, "bench_loans.db")
+os.environ["LOANLINK_DB"] = DB_PATH
+os.environ.setdefault("LOANLINK_UPLOADS", os.path.join(SCRATCH, "uploads"))
+os.environ.setdefault("LOANLINK_STATIC_BUILD", os.path.join(SCRATCH, "static"))
+# No outbox threads: they would check connections out of the pool swapped in below
+os.environ.setdefault("EMAIL_OUTBOX_WORKERS", "0")
+
+import server
+
+LOAN_COUNTS = [1, 10, 100, 500, 1000]
+PAYMENTS_PER_LOAN = 5
+RUNS = 20
+
+def seed(conn, n_loans):
+    conn.execute('DELETE FROM payments')
+    conn.execute('DELETE FROM loans')
+    start = datetime(2024, 1, 1)
+    loans = []
+    for i in range(n_loans):
+        lender, borrower = ('power@example.com', f'b{i}@example.com') if i % 2 else (f'l{i}@example.com', 'power@example.com')
+        loans.append((lender, borrower, 'power@example.com', 'currency', 1000.0, 5.0, 12, 'simple',
+                      87.5, 1050.0, 0.0, 'active', (start + timedelta(hours=i)).isoformat()))
+    conn.executemany('''
+        INSERT INTO loans (lender_email, borrower_email, creator_email, asset_type, amount, rate, months,
+                           interest_type, monthly_payment, total_repayment, paid_amount, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', loans)
+    loan_ids = [r[0] for r in conn.execute('SELECT id FROM loans')]
+    conn.executemany('INSERT INTO payments (loan_id, amount, date, method) VALUES (?, ?, ?, ?)',
+                     [(loan_id, 87.5, (start + timedelta(days=30 * k)).isoformat(), 'Cash')
+                      for loan_id in loan_ids for k in range(PAYMENTS_PER_LOAN)])
+    conn.commit()
+
+def main():
+    # A single pooled connection, so every request reuses the traced one
+    server.db_pool = server.ConnectionPool(DB_PATH, max_size=1)
+    conn = server.db_pool.acquire()
+    conn.execute("INSERT OR IGNORE INTO users (email, password, name, token) VALUES ('power@example.com', 'x', 'Power', 'bench-token')")
+    conn.commit()
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    server.db_pool.release(conn)
+
+    client = server.app.test_client()
+    headers = {'Authorization': 'Bearer bench-token'}
+
+    print(f"{'loans':>6} {'queries':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for n_loans in LOAN_COUNTS:
+        conn = server.db_pool.acquire()
+        seed(conn, n_loans)
+        server.db_pool.release(conn)
+
+        timings = []
+        for _ in range(RUNS):
+            statements.clear()
+            t0 = time.perf_counter()
+            resp = client.get('/api/loans', headers=headers)
+            timings.append((time.perf_counter() - t0) * 1000)
+            assert resp.status_code == 200 and len(resp.json) == n_loans
+        queries = sum(1 for s in statements if s.lstrip().upper().startswith('SELECT'))
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{n_loans:>6} {queries:>8} {statistics.median(timings):>9.2f} {p95:>9.2f}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+# Weighted mix of user journeys (action -> relative weight)
+MIX = {
+    'list_loans': 30,
+    'list_listings': 15,
+    'create_loan': 12,
+    'accept_loan': 10,
+    'pay': 12,
+    'pay_with_proof': 4,
+    'login': 5,
+    'register': 2,
+}
+PASSWORD = 'loadtest-password'
+PROOF_PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 2048
+LISTINGS = 50
+
+class VirtualUser:
+    """A lender/borrower pair that walks through the loan lifecycle."""
+
+    def __init__(self, base_url, rng):
+        self.base_url = base_url
+        self.rng = rng
+        self.lender = requests.Session()
+        self.borrower = requests.Session()
+        self.lender_email = self._register(self.lender, 'lender')
+        self.borrower_email = self._register(self.borrower, 'borrower')
+        self.pending = []  # created, waiting for the borrower to accept
+        self.active = []   # accepted, open for payments
+
+    def _register(self, session, name):
+        email = f"{name}_{uuid.uuid4().hex[:12]}@loadtest.example"
+        resp = session.post(f"{self.base_url}/api/register", json={'email': email, 'password': PASSWORD, 'name': name})
+        resp.raise_for_status()
+        session.headers['Authorization'] = f"Bearer {resp.json()['token']}"
+        return email
+
+    def run(self, action):
+        """Perform one action; returns the response (None when it had nothing to do)."""
+        url = self.base_url
+        if action == 'list_loans':
+            return self.lender.get(f"{url}/api/loans")
+        if action == 'list_listings':
+            return self.borrower.get(f"{url}/api/listings?limit=50")
+        if action == 'create_loan':
+            resp = self.lender.post(f"{url}/api/loans", json={
+                'role': 'lender', 'counterpartyEmail': self.borrower_email, 'amount': self.rng.randint(100, 5000),
+                'rate': self.rng.choice([0, 5, 7.5, 12]), 'months': self.rng.choice([3, 6, 12, 24]),
+                'interestType': 'simple'})
+            if resp.ok:
+                self.pending.append(resp.json()['id'])
+            return resp
+        if action == 'accept_loan':
+            if not self.pending:
+                return None
+            loan_id = self.pending.pop()
+            resp = self.borrower.post(f"{url}/api/loans/{loan_id}/accept")
+            if resp.ok:
+                self.active.append(loan_id)
+            return resp
+        if action in ('pay', 'pay_with_proof'):
+            if not self.active:
+                return None
+            loan_id = self.rng.choice(self.active)
+            if action == 'pay':
+                resp = self.borrower.post(f"{url}/api/loans/{loan_id}/pay", json={'amount': 10, 'method': 'Cash'})
+            else:
+                resp = self.borrower.post(f"{url}/api/loans/{loan_id}/pay", data={'amount': '10', 'method': 'Card'},
+                                          files={'proof': ('proof.png', PROOF_PNG, 'image/png')})
+            if resp.status_code == 409:
+                # Paid off (or raced): stop paying into it
+                self.active.remove(loan_id)
+            return resp
+        if action == 'login':
+            resp = self.lender.post(f"{url}/api/login", json={'email': self.lender_email, 'password': PASSWORD})
+            if resp.ok:
+                self.lender.headers['Authorization'] = f"Bearer {resp.json()['token']}"
+            return resp
+        if action == 'register':
+            return requests.post(f"{url}/api/register", json={
+                'email': f"new_{uuid.uuid4().hex[:12]}@loadtest.example", 'password': PASSWORD, 'name': 'New'})
+        raise ValueError(action)
+
+def start_server(workers, threads, port, log_path):
+    """Run the real app under gunicorn with the production config (gunicorn.conf.py)
+    against a throwaway database, logging to log_path; returns (process, base_url, tmpdir)."""
+    tmp = tempfile.mkdtemp(prefix='loanlink-load-')
+    env = {
+        **os.environ,
+        'LOANLINK_DB': os.path.join(tmp, 'load.db'),
+        'LOANLINK_UPLOADS': os.path.join(tmp, 'uploads'),
+        'LOANLINK_STATIC_BUILD': os.path.join(tmp, 'static'),
+        'LOANLINK_METRICS_DIR': os.path.join(tmp, 'metrics'),
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        # Email transport stubbed out: without credentials the outbox records
+        # "not configured" instead of reaching a mail server
+        'RESEND_API_KEY': '',
+        'EMAIL_PASSWORD': '',
+    }
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'server:app', '-c', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}; see {log_path}")
+        try:
+            requests.get(f'{base_url}/api/listings?limit=1', timeout=1)
+            return proc, base_url, tmp
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not come up within 60s")
+
+def seed_listings(base_url):
+    user = VirtualUser(base_url, random.Random(0))
+    for i in range(LISTINGS):
+        user.lender.post(f"{base_url}/api/listings", json={
+            'itemName': f'Item {i}', 'description': 'Load test listing', 'charge': i % 20 + 1,
+            'deposit': 50, 'location': 'Springfield', 'tenure': 3})
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+def run(base_url, users, duration, seed):
+    latencies = {action: [] for action in MIX}
+    errors = {action: 0 for action in MIX}
+    # 409s are the app refusing a stale action (paying a paid-off loan,
+    # accepting one twice), not failures, so they are counted on their own
+    conflicts = {action: 0 for action in MIX}
+    lock = threading.Lock()
+    actions, weights = list(MIX), list(MIX.values())
+    stop_at = []
+    # The clock starts once every virtual user has registered
+    start = threading.Barrier(users + 1, action=lambda: stop_at.append(time.perf_counter() + duration))
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        vu = VirtualUser(base_url, rng)
+        start.wait()
+        while time.perf_counter() < stop_at[0]:
+            action = rng.choices(actions, weights)[0]
+            t0 = time.perf_counter()
+            resp = vu.run(action)
+            elapsed = time.perf_counter() - t0
+            if resp is None:
+                continue
+            with lock:
+                latencies[action].append(elapsed)
+                if resp.status_code == 409:
+                    conflicts[action] += 1
+                elif resp.status_code >= 400:
+                    errors[action] += 1
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(users)]
+    for t in threads:
+        t.start()
+    start.wait()
+    began = stop_at[0] - duration
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    results = {}
+    for action, values in latencies.items():
+        values.sort()
+        results[action] = {
+            'requests': len(values),
+            'errors': errors[action],
+            'conflicts': conflicts[action],
+            'rps': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        }
+    everything = sorted(x for values in latencies.values() for x in values)
+    results['total'] = {
+        'requests': len(everything),
+        'errors': sum(errors.values()),
+        'conflicts': sum(conflicts.values()),
+        'rps': round(len(everything) / elapsed, 2),
+        'p50_ms': round(percentile(everything, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(everything, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(everything, 0.99) * 1000, 2),
+    }
+    return results
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before or not before['requests']:
+            continue
+        if current['rps'] < before['rps'] * (1 - tolerance):
+            found.append(f"{name}: {current['rps']:,.1f} < {before['rps']:,.1f} req/s")
+        if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append(f"{name}: p95 {current['p95_ms']:,.1f} > {before['p95_ms']:,.1f} ms")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test of the main LoanLink journeys")
+    parser.add_argument('--url', help="target an already running server instead of starting gunicorn")
+    parser.add_argument('--workers', type=int, default=1, help="gunicorn workers (default 1, as deployed)")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker (default 8)")
+    parser.add_argument('--port', type=int, default=18765)
+    parser.add_argument('--server-log', metavar='FILE', default='bench_load-server.log',
+                        help="gunicorn output, kept after the run (default bench_load-server.log)")
+    parser.add_argument('--users', type=int, default=16, help="concurrent virtual users (default 16)")
+    parser.add_argument('--duration', type=float, default=20, help="seconds of load (default 20)")
+    parser.add_argument('--seed', type=int, default=1, help="seed for the action mix (default 1)")
+    parser.add_argument('--save', metavar='FILE', help="write results as a JSON baseline")
+    parser.add_argument('--baseline', metavar='FILE', help="compare against a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown vs baseline (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    proc = tmp = None
+    base_url = args.url
+    if not base_url:
+        proc, base_url, tmp = start_server(args.workers, args.threads, args.port, args.server_log)
+    try:
+        seed_listings(base_url)
+        results = run(base_url, args.users, args.duration, args.seed)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"{'endpoint':<16} {'requests':>9} {'errors':>7} {'409s':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['requests']:>9} {r['errors']:>7} {r['conflicts']:>7} {r['rps']:>9.1f} "
+              f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+    if proc:
+        print(f"Server log: {args.server_log}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+import requests
+
+from bench_load import percentile, regressions
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEARCH_TERMS = ['drill', 'ladder', 'tent', 'camera', 'bike', 'kayak', 'projector', 'saw', 'guitar', 'tripod']
+PLACES = [(51.507, -0.128), (53.481, -2.243), (40.713, -74.006), (43.653, -79.383), (-33.869, 151.209)]
+
+def build_fixture(path, users, loans):
+    subprocess.run([sys.executable, os.path.join(BASE_DIR, 'create_scale_fixture.py'), path, '--users', str(users),
+                    '--loans', str(loans), '--payments', str(loans * 5), '--listings', str(users * 5)],
+                   check=True, stdout=subprocess.DEVNULL)
+
+def start_server(db_path, workers, threads, port, tmp):
+    """gunicorn with the production config (preload, one-time init_db) on the fixture database."""
+    env = {
+        **os.environ,
+        'LOANLINK_DB': db_path,
+        'LOANLINK_UPLOADS': os.path.join(tmp, 'uploads'),
+        'LOANLINK_STATIC_BUILD': os.path.join(tmp, 'static'),
+        'LOANLINK_METRICS_DIR': os.path.join(tmp, f'metrics-{workers}'),
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'RESEND_API_KEY': '',
+        'EMAIL_PASSWORD': '',
+    }
+    log = open(os.path.join(tmp, f'gunicorn-{workers}.log'), 'w')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'server:app', '-c', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}; see {log.name}")
+        try:
+            requests.get(f'{base_url}/api/listings?limit=1', timeout=1)
+            return proc, base_url, log.name
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not come up within 120s")
+
+def read_requests(base_url, users, rng):
+    """Endless stream of (url, headers) for the read-heavy endpoints."""
+    while True:
+        n = rng.random()
+        if n < 0.4:
+            token = f"fixture-token-{rng.randrange(users)}"
+            yield f"{base_url}/api/loans?limit=20", {'Authorization': f"Bearer {token}"}
+        elif n < 0.65:
+            yield f"{base_url}/api/listings?limit=50", {}
+        elif n < 0.85:
+            yield f"{base_url}/api/listings/search?q={rng.choice(SEARCH_TERMS)}&limit=20", {}
+        else:
+            lat, lon = rng.choice(PLACES)
+            yield f"{base_url}/api/listings/nearby?lat={lat}&lon={lon}&limit=20", {}
+
+def client(base_url, users, seed, start_at, stop_at):
+    """One load-generating process: a closed loop of keep-alive GETs. Returns (latencies, errors)."""
+    session = requests.Session()
+    stream = read_requests(base_url, users, random.Random(seed))
+    latencies, errors = [], 0
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < stop_at:
+        url, headers = next(stream)
+        t0 = time.perf_counter()
+        resp = session.get(url, headers=headers)
+        latencies.append(time.perf_counter() - t0)
+        if resp.status_code >= 400:
+            errors += 1
+    return latencies, errors
+
+def measure(base_url, users, clients, duration, warmup):
+    start_at = time.time() + 1
+    with multiprocessing.get_context('spawn').Pool(clients) as pool:
+        # Warm each worker's session cache and SQLite page cache first
+        pool.starmap(client, [(base_url, users, 1000 + n, start_at, start_at + warmup) for n in range(clients)])
+        start_at = time.time() + 1
+        results = pool.starmap(client, [(base_url, users, n, start_at, start_at + duration)
+                                        for n in range(clients)])
+    latencies = sorted(x for values, _ in results for x in values)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'rps': round(len(latencies) / duration, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Read throughput of the app across gunicorn worker counts")
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated worker counts (default 1,2,4)")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker (default 8)")
+    parser.add_argument('--clients', type=int, default=16, help="load-generating processes (default 16)")
+    parser.add_argument('--duration', type=float, default=15, help="seconds per worker count (default 15)")
+    parser.add_argument('--warmup', type=float, default=3, help="warm-up seconds per worker count (default 3)")
+    parser.add_argument('--fixture', help="existing create_scale_fixture.py database (copied, not modified)")
+    parser.add_argument('--users', type=int, default=2000, help="fixture users when building one (default 2000)")
+    parser.add_argument('--loans', type=int, default=50000, help="fixture loans when building one (default 50000)")
+    parser.add_argument('--port', type=int, default=18766)
+    parser.add_argument('--save', metavar='FILE', help="write results as a JSON baseline")
+    parser.add_argument('--baseline', metavar='FILE', help="compare against a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown vs baseline (default 0.2 = 20%%)")
+    args = parser.parse_args()
+    worker_counts = [int(n) for n in args.workers.split(',')]
+
+    tmp = tempfile.mkdtemp(prefix='loanlink-workers-')
+    db_path = os.path.join(tmp, 'fixture.db')
+    try:
+        if args.fixture:
+            shutil.copy(args.fixture, db_path)
+            conn = sqlite3.connect(db_path)
+            users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+            conn.close()
+        else:
+            print(f"Building fixture: {args.users:,} users, {args.loans:,} loans ...", flush=True)
+            build_fixture(db_path, args.users, args.loans)
+            users = args.users
+
+        results = {}
+        for workers in worker_counts:
+            proc, base_url, log_path = start_server(db_path, workers, args.threads, args.port, tmp)
+            try:
+                results[f'workers_{workers}'] = measure(base_url, users, args.clients, args.duration, args.warmup)
+            finally:
+                proc.terminate()
+                proc.wait()
+            with open(log_path) as f:
+                inits = f.read().count('Database Initialized')
+            if inits != 1:
+                print(f"⚠️ init_db ran {inits} times with {workers} workers (expected once, in the master)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    base = results[f'workers_{worker_counts[0]}']
+    print(f"{os.cpu_count()} CPUs; {args.clients} client processes, {args.threads} threads per worker")
+    print(f"{'workers':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'speedup':>8} {'per worker':>11}")
+    for workers in worker_counts:
+        r = results[f'workers_{workers}']
+        speedup = r['rps'] / base['rps'] if base['rps'] else 0.0
+        efficiency = speedup * worker_counts[0] / workers
+        print(f"{workers:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} "
+              f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {speedup:>7.2f}x {efficiency:>10.0%}")
+    if max(worker_counts) > (os.cpu_count() or 1):
+        print("ℹ️ More workers than CPUs (clients share them too): expect sub-linear scaling here")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
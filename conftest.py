@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+# Run the test suite against a throwaway database, uploads dir and static
+# build dir instead of loanlink.db, uploads/ and build/
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("LOANLINK_DB", os.path.join(_tmp, "test_loanlink.db"))
+os.environ.setdefault("LOANLINK_UPLOADS", os.path.join(_tmp, "uploads"))
+os.environ.setdefault("LOANLINK_STATIC_BUILD", os.path.join(_tmp, "static"))
+
+import uuid
+
+import pytest
+
+# server is imported inside the fixtures, after the environment above is set
+
+@pytest.fixture
+def client():
+    import server
+    return server.app.test_client()
+
+@pytest.fixture(scope='session')
+def register():
+    """register(name) signs up a fresh user and returns (email, auth headers)"""
+    import server
+    client = server.app.test_client()
+
+    def register(name):
+        email = f"{name}_{uuid.uuid4().hex[:8]}@example.com"
+        resp = client.post('/api/register', json={'email': email, 'password': 'password123', 'name': name})
+        assert resp.status_code == 200
+        return email, {'Authorization': f"Bearer {resp.json['token']}"}
+    return register
@@ -0,0 +1,276 @@
+import os
+import sys
+import time
+import base64
+import hashlib
+import sqlite3
+import argparse
+import tempfile
+
+import numpy as np
+
+# users, loans, payments, listings
+PRESETS = {
+    'small': (1_000, 50_000, 300_000, 5_000),
+    'medium': (5_000, 250_000, 2_500_000, 25_000),
+    'large': (10_000, 1_000_000, 10_000_000, 100_000),
+}
+PASSWORD = 'password123'
+CHUNK = 100_000
+# Loans are created up to three years before this date
+END = np.datetime64('2026-01-01T00:00:00', 's')
+
+STATUSES = ['active', 'completed', 'pending', 'rejected']
+STATUS_P = [0.55, 0.25, 0.12, 0.08]
+FREQUENCIES = ['Monthly', 'Weekly', 'Bi-Weekly', 'Daily', 'One Time']
+FREQUENCY_P = [0.68, 0.12, 0.08, 0.05, 0.07]
+FREQUENCY_DAYS = np.array([30, 7, 14, 1, 0])
+TERMS = [1, 3, 6, 12, 18, 24, 36]
+TERM_P = [0.05, 0.15, 0.2, 0.3, 0.1, 0.15, 0.05]
+RATES = [0, 3, 5, 7.5, 10, 15, 20]
+METHODS = ['Cash', 'Direct Transfer', 'Cheque', 'Other']
+METHOD_P = [0.45, 0.4, 0.1, 0.05]
+ITEMS = ['Cordless Drill', 'Ladder', 'Tent', 'Camera', 'Mountain Bike', 'Kayak', 'Projector', 'PA Speaker',
+         'Circular Saw', 'Stand Mixer', 'Acoustic Guitar', 'Tripod', 'Pressure Washer', 'Sewing Machine',
+         'Camping Stove', 'Telescope', 'Snowboard', 'Lawn Mower', 'Carpet Cleaner', 'Party Lights']
+CONDITIONS = ['New', 'Like New', 'Good', 'Fair']
+CITIES = [('London', 51.507, -0.128), ('Manchester', 53.481, -2.243), ('Bristol', 51.455, -2.588),
+          ('Leeds', 53.801, -1.549), ('Glasgow', 55.864, -4.252), ('Dublin', 53.350, -6.260),
+          ('New York', 40.713, -74.006), ('Toronto', 43.653, -79.383), ('Mumbai', 19.076, 72.878),
+          ('Sydney', -33.869, 151.209)]
+
+def skewed_owners(rng, n_users, size, order, p):
+    """User indexes drawn from a Zipf-like distribution: a few power users own most rows."""
+    return order[rng.choice(n_users, size=size, p=p)]
+
+def timestamps(rng, size):
+    return END - rng.integers(0, 3 * 365 * 86400, size).astype('timedelta64[s]')
+
+def password_hash(rng):
+    """The app's scrypt hash format, with a seeded salt so fixtures are byte-for-byte reproducible"""
+    import server
+    salt = rng.bytes(16)
+    n = server.PASSWORD_SCRYPT_N
+    digest = hashlib.scrypt(PASSWORD.encode(), salt=salt, n=n, r=8, p=1, maxmem=256 * n * 8)
+    return f"scrypt${n}$8$1${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+
+def strip_derived(conn):
+    """Drop triggers, secondary indexes and derived tables before the bulk load.
+    Returns the index DDL (as init_db() created it) for recreate_indexes();
+    init_db() rebuilds the rest afterwards."""
+    indexes = [sql for (sql,) in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    for kind, name in conn.execute("""SELECT type, name FROM sqlite_master
+                                      WHERE type IN ('trigger', 'index') AND sql IS NOT NULL""").fetchall():
+        conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+    conn.execute('DROP TABLE IF EXISTS listings_fts')
+    conn.execute('DROP TABLE IF EXISTS listings_geo')
+    return indexes
+
+def recreate_indexes(conn, indexes):
+    # Here rather than in init_db() so the sorts get this connection's large cache
+    for sql in indexes:
+        conn.execute(sql)
+
+def insert_users(conn, rng, n_users):
+    hashed = password_hash(rng)
+    conn.executemany('INSERT INTO users (id, email, password, name, token) VALUES (?, ?, ?, ?, ?)',
+                     ((i + 1, f"user{i:06d}@fixture.example", hashed, f"User {i}", f"fixture-token-{i}")
+                      for i in range(n_users)))
+
+def insert_loans(conn, rng, n_users, n_loans, n_payments, lender_order, lender_p):
+    import server
+    # Scale payment counts so the total lands near n_payments
+    expected_natural = n_loans * (STATUS_P[0] * 5.5 + STATUS_P[1] * 11)
+    payment_scale = n_payments / expected_natural if expected_natural else 0
+    emails = np.array([f"user{i:06d}@fixture.example" for i in range(n_users)], dtype=object)
+    loans_written = payments_written = 0
+
+    for start in range(0, n_loans, CHUNK):
+        size = min(CHUNK, n_loans - start)
+        ids = np.arange(start + 1, start + size + 1)
+        lender = skewed_owners(rng, n_users, size, lender_order, lender_p)
+        borrower = rng.integers(0, n_users - 1, size)
+        borrower += borrower >= lender  # never lend to yourself
+        lender_created = rng.random(size) < 0.7
+        status = np.array(STATUSES, dtype=object)[rng.choice(len(STATUSES), size, p=STATUS_P)]
+        freq_idx = rng.choice(len(FREQUENCIES), size, p=FREQUENCY_P)
+        frequency = np.array(FREQUENCIES, dtype=object)[freq_idx]
+        periods = np.array(TERMS)[rng.choice(len(TERMS), size, p=TERM_P)]
+        interest = np.where(rng.random(size) < 0.6, 'simple', 'compound').astype(object)
+        amount = np.round(np.clip(rng.lognormal(np.log(800), 1.0, size), 10, 1_000_000), 2)
+        rate = np.array(RATES, dtype=float)[rng.integers(0, len(RATES), size)]
+        is_item = rng.random(size) < 0.15
+        item = np.array(ITEMS, dtype=object)[rng.integers(0, len(ITEMS), size)]
+        condition = np.array(CONDITIONS, dtype=object)[rng.integers(0, len(CONDITIONS), size)]
+        created = timestamps(rng, size)
+
+        # Installment and total from the app's own schedule engine
+        schedules = server.compute_schedules([
+            {'amount': a, 'rate': r, 'periods': n, 'interest_type': t, 'frequency': f}
+            for a, r, n, t, f in zip(amount.tolist(), rate.tolist(), periods.tolist(), interest.tolist(),
+                                     frequency.tolist())
+        ], include_periods=False)
+        installment = np.array([s['installment'] for s in schedules])
+        total = np.array([s['total'] for s in schedules])
+        n_installments = np.array([s['periods'] for s in schedules])
+
+        # Completed loans paid every installment, active ones some; the rest none
+        paid_installments = np.select(
+            [status == 'completed', status == 'active'],
+            [n_installments, (rng.random(size) * n_installments).astype(int)], 0)
+        paid = np.where(status == 'completed', total, np.round(np.minimum(installment * paid_installments, total), 2))
+        counts = np.where(paid_installments > 0,
+                          np.maximum(1, np.round(paid_installments * payment_scale)), 0).astype(int)
+
+        created_str = np.datetime_as_string(created, unit='s')
+        loan_date = np.datetime_as_string(created, unit='D')
+        conn.executemany('''
+            INSERT INTO loans (id, lender_email, borrower_email, creator_email, asset_type, item_name, item_condition,
+                               amount, rate, months, interest_type, monthly_payment, total_repayment, paid_amount,
+                               status, created_at, payment_frequency, loan_date, row_version, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+        ''', zip(ids.tolist(), emails[lender].tolist(), emails[borrower].tolist(),
+                 np.where(lender_created, emails[lender], emails[borrower]).tolist(),
+                 np.where(is_item, 'item', 'currency').tolist(),
+                 np.where(is_item, item, None).tolist(), np.where(is_item, condition, None).tolist(),
+                 amount.tolist(), rate.tolist(), periods.tolist(), interest.tolist(), installment.tolist(),
+                 total.tolist(), paid.tolist(), status.tolist(), created_str.tolist(), frequency.tolist(),
+                 loan_date.tolist(), (counts + (status != 'pending')).tolist()))
+
+        # Payments: `count` per loan, splitting paid_amount evenly (the last one takes the rounding).
+        # Only one plan row per loan crosses into SQLite; joining it against a table of installment
+        # numbers expands it into payments without binding ten million Python tuples.
+        paying = counts > 0
+        share = np.round(paid / np.maximum(counts, 1), 2)
+        last = np.round(paid - share * (counts - 1), 2)
+        step = np.maximum(FREQUENCY_DAYS[freq_idx], 1) * 86400
+        method = rng.choice(len(METHODS), size, p=METHOD_P)  # borrowers stick to one way of paying
+        conn.execute('DELETE FROM payment_plan')
+        conn.executemany('INSERT INTO payment_plan VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         zip(ids[paying].tolist(), counts[paying].tolist(), share[paying].tolist(),
+                             last[paying].tolist(), created[paying].astype(np.int64).tolist(),
+                             step[paying].tolist(), np.array(METHODS, dtype=object)[method[paying]].tolist()))
+        conn.executemany('INSERT OR IGNORE INTO payment_seq VALUES (?)', ((k,) for k in range(int(counts.max(initial=0)))))
+        conn.execute('''
+            INSERT INTO payments (loan_id, amount, date, method, row_version)
+            SELECT loan_id, CASE WHEN k = n - 1 THEN last ELSE share END,
+                   strftime('%Y-%m-%dT%H:%M:%S', MIN(created + (k + 1) * step, ?), 'unixepoch'), method, 1
+            FROM payment_plan CROSS JOIN payment_seq ON k < n
+        ''', (int(END.astype(np.int64)),))
+        loans_written += size
+        payments_written += int(counts.sum())
+        print(f"  loans {loans_written:,}/{n_loans:,}  payments {payments_written:,}", flush=True)
+    return payments_written
+
+def insert_listings(conn, rng, n_users, n_listings, owner_order, owner_p):
+    owner = skewed_owners(rng, n_users, n_listings, owner_order, owner_p)
+    item = rng.integers(0, len(ITEMS), n_listings)
+    city = rng.integers(0, len(CITIES), n_listings)
+    located = rng.random(n_listings) < 0.8
+    lat = np.array([c[1] for c in CITIES])[city] + rng.normal(0, 0.08, n_listings)
+    lon = np.array([c[2] for c in CITIES])[city] + rng.normal(0, 0.12, n_listings)
+    condition = rng.integers(0, len(CONDITIONS), n_listings)
+    rows = zip(
+        [f"user{i:06d}@fixture.example" for i in owner.tolist()],
+        [ITEMS[i] for i in item.tolist()],
+        [f"{CONDITIONS[c]} {ITEMS[i].lower()}, available to borrow in {CITIES[t][0]}"
+         for c, i, t in zip(condition.tolist(), item.tolist(), city.tolist())],
+        np.round(rng.uniform(1, 60, n_listings), 2).tolist(),
+        np.round(rng.choice([0, 20, 50, 100, 250], n_listings), 2).tolist(),
+        [CITIES[t][0] for t in city.tolist()],
+        rng.choice([1, 2, 3, 6, 12], n_listings).tolist(),
+        np.where(rng.random(n_listings) < 0.9, 'active', 'inactive').tolist(),
+        np.datetime_as_string(timestamps(rng, n_listings), unit='s').tolist(),
+        np.where(located, np.round(lat, 6), None).tolist(),
+        np.where(located, np.round(lon, 6), None).tolist(),
+    )
+    conn.executemany('''
+        INSERT INTO listings (user_email, item_name, description, charge, deposit, location, tenure, status,
+                              created_at, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+def build(path, n_users, n_loans, n_payments, n_listings, seed):
+    # Point the server at the fixture before importing it; importing runs init_db() there
+    os.environ['LOANLINK_DB'] = path
+    scratch = tempfile.mkdtemp()
+    os.environ.setdefault('LOANLINK_UPLOADS', os.path.join(scratch, 'uploads'))
+    os.environ.setdefault('LOANLINK_STATIC_BUILD', os.path.join(scratch, 'static'))
+    os.environ.setdefault('EMAIL_OUTBOX_WORKERS', '0')
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    import server
+
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, n_users + 1) ** 1.1
+    zipf_p = weights / weights.sum()
+    lender_order = rng.permutation(n_users)
+    owner_order = rng.permutation(n_users)
+
+    conn = sqlite3.connect(path)
+    # Bulk-load settings: no journal, no fsync, and no triggers/indexes to maintain per row
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    indexes = strip_derived(conn)
+    conn.execute('''CREATE TEMP TABLE payment_plan (
+        loan_id INTEGER PRIMARY KEY, n INTEGER, share REAL, last REAL, created INTEGER, step INTEGER, method TEXT
+    )''')
+    conn.execute('CREATE TEMP TABLE payment_seq (k INTEGER PRIMARY KEY)')
+    t0 = time.perf_counter()
+    insert_users(conn, rng, n_users)
+    payments = insert_loans(conn, rng, n_users, n_loans, n_payments, lender_order, zipf_p)
+    insert_listings(conn, rng, n_users, n_listings, owner_order, zipf_p)
+    conn.commit()
+    print(f"Rows written in {time.perf_counter() - t0:.1f}s", flush=True)
+
+    t0 = time.perf_counter()
+    recreate_indexes(conn, indexes)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+
+    # Recreate triggers, the summary table and the search indexes
+    server.init_db()
+    conn = sqlite3.connect(path)
+    if conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0] == 0:
+        raise RuntimeError("init_db() did not rebuild the schema; see the warning above")
+    conn.close()
+    print(f"Indexes, triggers and summaries rebuilt in {time.perf_counter() - t0:.1f}s", flush=True)
+    return payments
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a large synthetic LoanLink database")
+    parser.add_argument('path', help="database file to create")
+    parser.add_argument('--preset', choices=PRESETS, default='small', help="scale preset (default small)")
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--loans', type=int)
+    parser.add_argument('--payments', type=int, help="approximate payment count")
+    parser.add_argument('--listings', type=int)
+    parser.add_argument('--seed', type=int, default=42, help="same seed, same database (default 42)")
+    parser.add_argument('--force', action='store_true', help="overwrite an existing file")
+    args = parser.parse_args()
+
+    users, loans, payments, listings = PRESETS[args.preset]
+    users = args.users if args.users is not None else users
+    loans = args.loans if args.loans is not None else loans
+    payments = args.payments if args.payments is not None else payments
+    listings = args.listings if args.listings is not None else listings
+    if users < 2:
+        parser.error("need at least 2 users")
+
+    if os.path.exists(args.path):
+        if not args.force:
+            parser.error(f"{args.path} exists (use --force to overwrite)")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+
+    start = time.perf_counter()
+    written = build(args.path, users, loans, payments, listings, args.seed)
+    print(f"✅ {args.path}: {users:,} users, {loans:,} loans, {written:,} payments, {listings:,} listings "
+          f"in {time.perf_counter() - start:.1f}s")
+    print(f"   Every user's password is '{PASSWORD}'; user N's token is 'fixture-token-N'")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import os
+import multiprocessing
+
+# Import server.py once in the master: init_db() runs there a single time and
+# the workers fork from the initialized app. The master opens no pooled SQLite
+# connections and starts no background threads; each worker starts its own in
+# post_fork (see server.start_worker).
+os.environ["LOANLINK_PRELOAD"] = "1"
+preload_app = True
+
+bind = [f"0.0.0.0:{os.environ.get('PORT', 10000)}"]
+# Internal listener for Prometheus: /metrics needs no admin token here (see
+# server.on_metrics_listener), so keep METRICS_HOST off the public network
+if os.environ.get("METRICS_PORT"):
+    bind.append(f"{os.environ.get('METRICS_HOST', '127.0.0.1')}:{os.environ['METRICS_PORT']}")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = 120
+
+def post_fork(server, worker):
+    import server as loanlink
+    loanlink.start_worker()
@@ -1,15 +1,50 @@
 import sqlite3
 import hashlib
+import hmac
+import mimetypes
 import uuid
 import os
+import time
+import json
+import base64
+import csv
+import io
+import queue
+import threading
+import zlib
+import gzip
 import smtplib
+import ssl
+import tempfile
+import re
+import math
+import heapq
+import multiprocessing
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, send_file, g
+from werkzeug.security import safe_join
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge, UnsupportedMediaType
 from flask_cors import CORS
+import jinja2
+import numpy as np
 import socket
+import requests
 import resend # New: API-based email
+try:
+    import brotli  # optional: adds .br variants of the static assets
+except ImportError:
+    brotli = None
+try:
+    import fcntl  # POSIX only: serializes init_db() across processes
+except ImportError:
+    fcntl = None
 
 # FORCE IPv4: This fixes "Network is unreachable" errors on cloud providers like Render
 orig_getaddrinfo = socket.getaddrinfo
@@ -17,12 +52,63 @@ def getaddrinfo_ipv4(host, port, family=0, type=0, proto=0, flags=0):
     return orig_getaddrinfo(host, port, socket.AF_INET, type, proto, flags)
 socket.getaddrinfo = getaddrinfo_ipv4
 
-app = Flask(__name__, static_url_path='', static_folder='.')
+# No static folder: the front-end is served from the fingerprinted build (see Static Files)
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 # Absolute path for the database to ensure it works on all platforms
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, "loanlink.db")
+DB_NAME = os.environ.get("LOANLINK_DB", os.path.join(BASE_DIR, "loanlink.db"))
+
+UPLOADS_DIR = os.environ.get("LOANLINK_UPLOADS", os.path.join(BASE_DIR, "uploads"))
+
+# Set by gunicorn.conf.py: this module is imported once in the gunicorn master
+# (preload_app) and each worker starts its own services from the post_fork hook
+PRELOADED = os.environ.get("LOANLINK_PRELOAD") == "1"
+
+# Connection pool size (one per gunicorn thread is enough)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+
+# Per-worker metric snapshots are written here and merged by /metrics
+METRICS_DIR = os.environ.get("LOANLINK_METRICS_DIR", os.path.join(
+    tempfile.gettempdir(), f"loanlink-metrics-{hashlib.sha1(DB_NAME.encode()).hexdigest()[:8]}"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 1))
+
+# Shared secret for /api/admin/* and /metrics, sent as "X-Admin-Token: <token>"
+# or "Authorization: Bearer <token>". Unset (the default) disables them.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Optional internal listener (gunicorn.conf.py binds it on METRICS_HOST) where
+# /metrics is served without the admin token, for a Prometheus scraper on a
+# private network
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0)) or None
+
+# Opt-in slow-query log: statements slower than SQL_SLOW_MS are logged with an
+# EXPLAIN QUERY PLAN; unset (the default) turns SQL tracing off
+SQL_SLOW_MS = os.environ.get("SQL_SLOW_MS")
+SQL_TRACE_TOP_N = int(os.environ.get("SQL_TRACE_TOP_N", 50))
+
+# Authenticated-session cache (see SessionCache)
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 10000))
+SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", 300))
+SESSION_CACHE_POLL = float(os.environ.get("SESSION_CACHE_POLL", 1.0))
+
+# Delta sync keeps deleted-loan tombstones this long; clients that last synced
+# before that get a full resync instead of a delta
+SYNC_TOMBSTONE_DAYS = float(os.environ.get("SYNC_TOMBSTONE_DAYS", 30))
+
+# Email outbox delivery (see EmailOutbox)
+EMAIL_OUTBOX_WORKERS = int(os.environ.get("EMAIL_OUTBOX_WORKERS", 2))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", 6))
+EMAIL_RETRY_BASE = float(os.environ.get("EMAIL_RETRY_BASE", 30))
+
+# Password hashing runs in a small process pool; beyond PASSWORD_HASH_QUEUE
+# outstanding hashes, login/register answer 429 instead of piling up.
+# PASSWORD_HASH_WORKERS=0 hashes inline in the request thread.
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 32))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 30))
+PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", 2 ** 14))
 
 # Global error handler to catch crashes and return them as JSON
 @app.errorhandler(Exception)
@@ -33,23 +119,49 @@ def handle_exception(e):
         "details": str(e)
     }), 500
 
-@app.route('/uploads/<path:filename>')
-def serve_upload(filename):
-    uploads_dir = os.path.join(BASE_DIR, 'uploads')
-    return send_from_directory(uploads_dir, filename)
+def admin_denied():
+    """None when the request carries ADMIN_TOKEN, else the error response
+    (404 when no token is configured, so the endpoints look absent)."""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    supplied = request.headers.get('X-Admin-Token') or ''
+    authorization = request.headers.get('Authorization', '')
+    if not supplied and authorization.startswith('Bearer '):
+        supplied = authorization[7:]
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Admin token required'}), 403
+    return None
+
+def require_admin(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return admin_denied() or view(*args, **kwargs)
+    return wrapper
 
 @app.route('/api/debug-users')
 def debug_users():
     conn = get_db_connection()
     users = conn.execute('SELECT email FROM users').fetchall()
-    conn.close()
     return jsonify([u['email'] for u in users])
 
+@app.route('/api/admin/pool-stats')
+@require_admin
+def pool_stats():
+    return jsonify(db_pool.stats())
+
+@app.route('/api/admin/session-cache-stats')
+@require_admin
+def session_cache_stats():
+    return jsonify(session_cache.stats())
+
 @app.route('/api/admin/nuke-database')
+@require_admin
 def nuke_database():
     try:
         if os.path.exists(DB_NAME):
-            # Close any active connections if possible (not really possible here globally, but os.remove will try)
+            # Drop pooled connections so they don't keep the deleted file alive
+            db_pool.close_all()
+            session_cache.clear()
             os.remove(DB_NAME)
             # Re-init immediately
             init_db()
@@ -61,18 +173,213 @@ def nuke_database():
         return f"Error during nuke: {str(e)}"
 
 # Email Configuration (Gmail SMTP)
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 465
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 465))
+# "ssl" (implicit TLS, e.g. port 465), "starttls" (e.g. port 587), or "plain" for
+# a trusted local relay only: credentials would cross the network in cleartext
+SMTP_SECURITY = os.environ.get("SMTP_SECURITY", "ssl")
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 2))
 SENDER_EMAIL = os.environ.get("EMAIL_ADDRESS", "onboarding@resend.dev")
 SENDER_PASSWORD = os.environ.get("EMAIL_PASSWORD", "")
 RESEND_API_KEY = os.environ.get("RESEND_API_KEY", "")
 
+# --- Mail Transport ---
+
+class SMTPTransportPool:
+    """Small pool of logged-in SMTP sessions that are reused across sends.
+
+    A session is closed and replaced after max_messages sends or when it has
+    sat idle longer than max_idle seconds (servers drop idle clients). If a
+    send fails because the server dropped the connection, the message is
+    retried once on a fresh session.
+    """
+
+    RETRYABLE = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+    SECURITY_MODES = ('ssl', 'starttls', 'plain')
+
+    def __init__(self, host, port, username=None, password=None, security='ssl',
+                 size=2, max_messages=100, max_idle=60, timeout=10):
+        if security not in self.SECURITY_MODES:
+            raise ValueError(f"SMTP security must be one of {', '.join(self.SECURITY_MODES)}, not {security!r}")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.reconnects = 0
+        self.messages = 0
+
+    def _connect(self):
+        if self.security == 'ssl':
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == 'starttls':
+                # Raises SMTPNotSupportedError rather than logging in unencrypted
+                try:
+                    server.ehlo()
+                    server.starttls(context=ssl.create_default_context())
+                    server.ehlo()
+                except Exception:
+                    server.close()
+                    raise
+        if self.password:
+            server.login(self.username, self.password)
+        with self._lock:
+            self.connects += 1
+        return {'server': server, 'sent': 0, 'last_used': time.monotonic()}
+
+    @staticmethod
+    def _close(session):
+        try:
+            session['server'].quit()
+        except Exception:
+            try:
+                session['server'].close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - session['last_used'] > self.max_idle:
+                self._close(session)
+                continue
+            return session
+
+    def _checkin(self, session):
+        session['last_used'] = time.monotonic()
+        if session['sent'] >= self.max_messages:
+            self._close(session)
+        else:
+            self._idle.put(session)
+
+    def send(self, msg):
+        with self._slots:
+            session = self._checkout()
+            try:
+                try:
+                    session['server'].send_message(msg)
+                except self.RETRYABLE:
+                    # Stale session: the server hung up since we last used it
+                    self._close(session)
+                    with self._lock:
+                        self.reconnects += 1
+                    session = self._connect()
+                    session['server'].send_message(msg)
+            except smtplib.SMTPRecipientsRefused:
+                # The session itself is still fine
+                self._checkin(session)
+                raise
+            except Exception:
+                self._close(session)
+                raise
+            session['sent'] += 1
+            with self._lock:
+                self.messages += 1
+            self._checkin(session)
+
+    def close_all(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'reconnects': self.reconnects,
+                'messages': self.messages,
+                'idle_sessions': self._idle.qsize(),
+            }
+
+class KeepAliveResendClient(resend.HTTPClient):
+    """Resend HTTP client that reuses one requests.Session, so consecutive API
+    calls share TLS connections instead of handshaking every time."""
+
+    def __init__(self, timeout=30, pool_size=4):
+        self._timeout = timeout
+        self._session = requests.Session()
+        self._session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def request(self, method, url, headers, json=None, files=None, data=None):
+        try:
+            if files is not None:
+                resp = self._session.request(method, url, headers=headers, files=files, data=data,
+                                             timeout=self._timeout)
+            else:
+                resp = self._session.request(method, url, headers=headers, json=json if data is None else None,
+                                             data=data, timeout=self._timeout)
+            return resp.content, resp.status_code, resp.headers
+        except requests.RequestException as e:
+            # resend turns this into a ResendError, like its default client
+            raise RuntimeError(f"Request failed: {e}") from e
+
+smtp_pool = SMTPTransportPool(SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD,
+                              security=SMTP_SECURITY, size=SMTP_POOL_SIZE)
+
 if RESEND_API_KEY:
     resend.api_key = RESEND_API_KEY
+    resend.default_http_client = KeepAliveResendClient()
+
+def rebuild_portfolio_summary(c):
+    """Recompute portfolio_summary from scratch (migration / repair)"""
+    c.execute("DELETE FROM portfolio_summary")
+    c.execute('''
+        INSERT INTO portfolio_summary (email, role, status, loan_count, outstanding, next_due)
+        SELECT email, role, status, COUNT(*), SUM(outstanding), SUM(MIN(monthly, outstanding))
+        FROM (
+            SELECT lender_email AS email, 'lender' AS role, COALESCE(status, 'pending') AS status,
+                   COALESCE(monthly_payment, 0) AS monthly,
+                   MAX(COALESCE(total_repayment, 0) - COALESCE(paid_amount, 0), 0) AS outstanding
+            FROM loans WHERE lender_email IS NOT NULL
+            UNION ALL
+            SELECT borrower_email, 'borrower', COALESCE(status, 'pending'),
+                   COALESCE(monthly_payment, 0),
+                   MAX(COALESCE(total_repayment, 0) - COALESCE(paid_amount, 0), 0)
+            FROM loans WHERE borrower_email IS NOT NULL
+        )
+        GROUP BY email, role, status
+    ''')
+
+@contextmanager
+def schema_lock():
+    """Exclusive lock on DB_NAME-lock, so processes that start together run
+    init_db() one after another instead of racing through the migrations.
+    A no-op where fcntl is unavailable (Windows)."""
+    lock_file = None
+    if fcntl is not None:
+        try:
+            lock_file = open(f"{DB_NAME}-lock", 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except OSError as e:
+            print(f"⚠️ Schema lock unavailable, initializing without it: {e}", flush=True)
+    try:
+        yield
+    finally:
+        if lock_file is not None:
+            lock_file.close()  # closing the file releases the lock
 
 def init_db():
-    # Only the first worker to start should successfully run full initialization
-    # We use a long timeout to wait for other workers to finish
+    # Under gunicorn.conf.py this runs once, in the master. Otherwise every
+    # process runs it, serialized by schema_lock; the migrations are idempotent.
+    with schema_lock():
+        _init_db()
+
+def _init_db():
     try:
         conn = sqlite3.connect(DB_NAME, timeout=60)
         conn.execute('PRAGMA journal_mode=WAL')
@@ -167,14 +474,251 @@ def init_db():
 
         try: c.execute("ALTER TABLE loans ADD COLUMN repayment_start_date TEXT")
         except: pass
+
+        try: c.execute("ALTER TABLE loans ADD COLUMN row_version INTEGER DEFAULT 0")
+        except: pass
+
+        try: c.execute("ALTER TABLE payments ADD COLUMN row_version INTEGER DEFAULT 0")
+        except: pass
+
+        try: c.execute("ALTER TABLE payments ADD COLUMN proof_hash TEXT")
+        except: pass
+
+        # Optimistic concurrency for payments (bumped on every payment)
+        try: c.execute("ALTER TABLE loans ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        except: pass
+
+        # Delta sync: every loan/payment write stamps the row with the next value
+        # of a global clock, and deleted loans leave a tombstone per participant
+        c.execute('''CREATE TABLE IF NOT EXISTS sync_clock (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )''')
+        c.execute("INSERT OR IGNORE INTO sync_clock (id, version) VALUES (1, 0)")
+        # Highest version whose tombstones may have been pruned (see prune_tombstones)
+        try: c.execute("ALTER TABLE sync_clock ADD COLUMN pruned_version INTEGER NOT NULL DEFAULT 0")
+        except: pass
+        c.execute('''CREATE TABLE IF NOT EXISTS sync_tombstones (
+            version INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            created_at INTEGER
+        )''')
+        try: c.execute("ALTER TABLE sync_tombstones ADD COLUMN created_at INTEGER")
+        except: pass
+        c.execute("UPDATE sync_tombstones SET created_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE created_at IS NULL")
+        # Inserts that arrive with a row_version (bulk import claims a block of
+        # clock values up front) skip the per-row clock bump
+        c.execute("DROP TRIGGER IF EXISTS loans_version_insert")
+        c.execute('''CREATE TRIGGER loans_version_insert AFTER INSERT ON loans
+        WHEN COALESCE(NEW.row_version, 0) = 0 BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            UPDATE loans SET row_version = (SELECT version FROM sync_clock WHERE id = 1) WHERE id = NEW.id;
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS loans_version_update AFTER UPDATE ON loans
+        WHEN NEW.row_version IS OLD.row_version BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            UPDATE loans SET row_version = (SELECT version FROM sync_clock WHERE id = 1) WHERE id = NEW.id;
+        END''')
+        c.execute("DROP TRIGGER IF EXISTS loans_version_delete")
+        c.execute('''CREATE TRIGGER loans_version_delete AFTER DELETE ON loans BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            INSERT INTO sync_tombstones (version, email, entity, entity_id, created_at)
+            SELECT version, OLD.lender_email, 'loan', OLD.id, CAST(strftime('%s', 'now') AS INTEGER)
+            FROM sync_clock WHERE id = 1
+            UNION ALL
+            SELECT version, OLD.borrower_email, 'loan', OLD.id, CAST(strftime('%s', 'now') AS INTEGER)
+            FROM sync_clock WHERE id = 1;
+        END''')
+        # Rows written before versioning existed start at version 1
+        c.execute("UPDATE sync_clock SET version = MAX(version, 1) WHERE id = 1")
+        c.execute("UPDATE loans SET row_version = 1 WHERE row_version = 0 OR row_version IS NULL")
+        c.execute("UPDATE payments SET row_version = 1 WHERE row_version = 0 OR row_version IS NULL")
+        # A payment also bumps its loan, so "loans changed since" covers new payments
+        c.execute("DROP TRIGGER IF EXISTS payments_version_insert")
+        c.execute('''CREATE TRIGGER payments_version_insert AFTER INSERT ON payments
+        WHEN COALESCE(NEW.row_version, 0) = 0 BEGIN
+            UPDATE sync_clock SET version = version + 1 WHERE id = 1;
+            UPDATE payments SET row_version = (SELECT version FROM sync_clock WHERE id = 1) WHERE id = NEW.id;
+            UPDATE loans SET row_version = (SELECT version FROM sync_clock WHERE id = 1) WHERE id = NEW.loan_id;
+        END''')
+
+
+        # Per-user dashboard totals, one row per (email, role, status). Triggers
+        # move each loan's contribution between rows inside the writing
+        # transaction, so reading the summary never touches the loans table.
+        c.execute('''CREATE TABLE IF NOT EXISTS portfolio_summary (
+            email TEXT NOT NULL,
+            role TEXT NOT NULL,
+            status TEXT NOT NULL,
+            loan_count INTEGER NOT NULL DEFAULT 0,
+            outstanding REAL NOT NULL DEFAULT 0,
+            next_due REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (email, role, status)
+        ) WITHOUT ROWID''')
+        # outstanding = total - paid; next_due = the next installment, capped at what is left
+        summary_upsert = '''
+            INSERT INTO portfolio_summary (email, role, status, loan_count, outstanding, next_due)
+            SELECT {row}.{role}_email, '{role}', COALESCE({row}.status, 'pending'), {sign}1,
+                   {sign}MAX(COALESCE({row}.total_repayment, 0) - COALESCE({row}.paid_amount, 0), 0),
+                   {sign}MIN(COALESCE({row}.monthly_payment, 0),
+                             MAX(COALESCE({row}.total_repayment, 0) - COALESCE({row}.paid_amount, 0), 0))
+            WHERE {row}.{role}_email IS NOT NULL
+            ON CONFLICT (email, role, status) DO UPDATE SET
+                loan_count = loan_count + excluded.loan_count,
+                outstanding = outstanding + excluded.outstanding,
+                next_due = next_due + excluded.next_due;'''
+        add_new = ''.join(summary_upsert.format(row='NEW', role=role, sign='') for role in ('lender', 'borrower'))
+        remove_old = ''.join(summary_upsert.format(row='OLD', role=role, sign='-') for role in ('lender', 'borrower'))
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_summary_insert AFTER INSERT ON loans BEGIN {add_new} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS loans_summary_delete AFTER DELETE ON loans BEGIN {remove_old} END")
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS loans_summary_update
+        AFTER UPDATE OF lender_email, borrower_email, status, total_repayment, paid_amount, monthly_payment ON loans
+        BEGIN {remove_old} {add_new} END''')
+        # Build the summary for loans that predate it
+        if c.execute("SELECT 1 FROM portfolio_summary LIMIT 1").fetchone() is None:
+            rebuild_portfolio_summary(c)
+
+        # Content-addressed payment proofs (see register_upload); refcount is
+        # the number of payments whose proof_hash points at the file
+        c.execute('''CREATE TABLE IF NOT EXISTS uploads (
+            hash TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT
+        )''')
+        # Per-deployment keys shared by all workers (e.g. for signed upload links)
+        c.execute('''CREATE TABLE IF NOT EXISTS app_secrets (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS payments_upload_ref AFTER INSERT ON payments
+        WHEN NEW.proof_hash IS NOT NULL BEGIN
+            UPDATE uploads SET refcount = refcount + 1 WHERE hash = NEW.proof_hash;
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS payments_upload_unref AFTER DELETE ON payments
+        WHEN OLD.proof_hash IS NOT NULL BEGIN
+            UPDATE uploads SET refcount = refcount - 1 WHERE hash = OLD.proof_hash;
+        END''')
+
+        # Optional listing coordinates, indexed by listings_geo below
+        for col in ['latitude', 'longitude']:
+            try: c.execute(f"ALTER TABLE listings ADD COLUMN {col} REAL")
+            except: pass
+
+        # Marketplace full-text search. listings_fts is an external-content
+        # FTS5 index over listings (no second copy of the text), kept in sync
+        # by the triggers below; prefix='2 3' makes short prefix queries cheap.
+        fts_exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'listings_fts'").fetchone()
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+            item_name, description, location,
+            content='listings', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings BEGIN
+            INSERT INTO listings_fts (rowid, item_name, description, location)
+            VALUES (NEW.id, NEW.item_name, NEW.description, NEW.location);
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, item_name, description, location)
+            VALUES ('delete', OLD.id, OLD.item_name, OLD.description, OLD.location);
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS listings_fts_update
+        AFTER UPDATE OF item_name, description, location ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, item_name, description, location)
+            VALUES ('delete', OLD.id, OLD.item_name, OLD.description, OLD.location);
+            INSERT INTO listings_fts (rowid, item_name, description, location)
+            VALUES (NEW.id, NEW.item_name, NEW.description, NEW.location);
+        END''')
+        if not fts_exists:
+            # Index listings that predate the search table; item names weigh most
+            c.execute("INSERT INTO listings_fts (listings_fts) VALUES ('rebuild')")
+            c.execute("INSERT INTO listings_fts (listings_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)')")
         
+        # Spatial index for /api/listings/nearby: one point-sized R*Tree box per
+        # listing that has coordinates
+        geo_exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'listings_geo'").fetchone()
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS listings_geo USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon
+        )''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS listings_geo_insert AFTER INSERT ON listings
+        WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL BEGIN
+            INSERT INTO listings_geo VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS listings_geo_delete AFTER DELETE ON listings
+        WHEN OLD.latitude IS NOT NULL AND OLD.longitude IS NOT NULL BEGIN
+            DELETE FROM listings_geo WHERE id = OLD.id;
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS listings_geo_update AFTER UPDATE OF latitude, longitude ON listings BEGIN
+            DELETE FROM listings_geo WHERE id = OLD.id;
+            INSERT INTO listings_geo SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+        END''')
+        if not geo_exists:
+            c.execute('''INSERT INTO listings_geo SELECT id, latitude, latitude, longitude, longitude FROM listings
+                         WHERE latitude IS NOT NULL AND longitude IS NOT NULL''')
+
+        # Session invalidation log, read by every worker's SessionCache
+        c.execute('''CREATE TABLE IF NOT EXISTS session_invalidations (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )''')
+
+        # Outgoing emails, written in the same transaction as the change that
+        # triggers them and delivered by the EmailOutbox workers
+        c.execute('''CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            loan_id INTEGER,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            text TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TEXT,
+            sent_at TEXT
+        )''')
+
+        # Indexes for the hot lookups
+        c.execute("CREATE INDEX IF NOT EXISTS idx_users_token ON users(token)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)")
+        # One index per side of `lender_email = ? OR borrower_email = ?` so SQLite
+        # can answer the OR as a union of two index lookups
+        c.execute("CREATE INDEX IF NOT EXISTS idx_loans_lender ON loans(lender_email, created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_loans_borrower ON loans(borrower_email, created_at)")
+        # Same per-side split for the paginated dashboard's status filter
+        c.execute("CREATE INDEX IF NOT EXISTS idx_loans_lender_status ON loans(lender_email, status, created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_loans_borrower_status ON loans(borrower_email, status, created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_payments_loan ON payments(loan_id, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_listings_status_created ON listings(status, created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_listings_status_charge ON listings(status, charge)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_listings_status_deposit ON listings(status, deposit)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_listings_status_tenure ON listings(status, tenure)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_reset_tokens_token ON reset_tokens(token)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_session_invalidations_created ON session_invalidations(created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_loan ON email_outbox(loan_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_loans_lender_version ON loans(lender_email, row_version)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_loans_borrower_version ON loans(borrower_email, row_version)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sync_tombstones_email ON sync_tombstones(email, version)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sync_tombstones_created ON sync_tombstones(created_at, version)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_uploads_refcount ON uploads(refcount)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_payments_proof ON payments(proof_image)")
+
         # Ensure asset_type defaults to currency if null
         c.execute("UPDATE loans SET asset_type = 'currency' WHERE asset_type IS NULL")
 
         # Ensure ALL emails are lowercased for stability (running every time for safety)
         c.execute("UPDATE users SET email = LOWER(email)")
         c.execute("UPDATE reset_tokens SET email = LOWER(email)")
-        c.execute("PRAGMA user_version = 2")
+        c.execute("PRAGMA user_version = 10")
         
         conn.commit()
         conn.close()
@@ -186,157 +730,959 @@ def init_db():
     except Exception as e:
         print(f"⚠️ Warning during init_db: {e}", flush=True)
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, timeout=60)
-    conn.row_factory = sqlite3.Row
+# --- Metrics ---
+# Counters and histograms live in memory per process. Every process writes a
+# snapshot to METRICS_DIR/<parent pid>-<pid>.json once a second, and /metrics
+# merges the snapshots of all workers under the same gunicorn master, so any
+# worker can answer a scrape for the whole deployment.
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+# name -> (type, help, buckets)
+METRIC_DEFINITIONS = {
+    'loanlink_http_requests_total': ('counter', 'HTTP responses by endpoint, method and status', None),
+    'loanlink_http_request_duration_seconds': ('histogram', 'Time to build the response', LATENCY_BUCKETS),
+    'loanlink_sql_queries_per_request': ('histogram', 'SQLite statements executed per request', QUERY_COUNT_BUCKETS),
+    'loanlink_sql_seconds_per_request': ('histogram', 'Time per request spent executing SQLite statements', LATENCY_BUCKETS),
+    'loanlink_email_send_seconds': ('histogram', 'Time per email delivery attempt', LATENCY_BUCKETS),
+    'loanlink_lock_wait_seconds': ('histogram', 'Time waiting for a pooled connection (pool) or the SQLite write lock (sqlite_write)', LATENCY_BUCKETS),
+    'loanlink_sqlite_busy_errors_total': ('counter', 'Statements that failed with "database is locked/busy"', None),
+}
+QUANTILES = (0.5, 0.95, 0.99)
+
+def histogram_quantile(q, buckets, counts):
+    """Estimate quantile q from cumulative-free bucket counts (last count is +Inf),
+    interpolating linearly inside the bucket like Prometheus does."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank, seen, lower = q * total, 0, 0.0
+    for upper, count in zip(buckets, counts):
+        if seen + count >= rank:
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+        lower = upper
+    return float(buckets[-1])
+
+class Metrics:
+    """Process-local counters/histograms plus the snapshot files that let
+    /metrics aggregate across gunicorn workers."""
+
+    _fork_lock = threading.Lock()
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flusher = None
+        # Last, so threads on the unlocked fast path never see a half reset
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # A forked child starts from zero with its own lock and flusher thread.
+        # Threads racing here must not reset twice or start two flushers.
+        if self._pid == os.getpid() and self._flusher is not None:
+            return
+        with self._fork_lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+                self._flusher.start()
+
+    def inc(self, name, labels, value=1):
+        self._check_pid()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        self._check_pid()
+        buckets = METRIC_DEFINITIONS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            i = 0
+            while i < len(buckets) and value > buckets[i]:
+                i += 1
+            hist[0][i] += 1
+            hist[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, dict(labels), list(counts), total]
+                               for (name, labels), (counts, total) in self._histograms.items()],
+            }
+
+    def _path(self, pid=None):
+        return os.path.join(self.directory, f"{os.getppid()}-{pid or os.getpid()}.json")
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path()
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️ Metrics flush failed: {e}", flush=True)
+
+    def collect(self):
+        """Merge this worker's live data with the snapshots of its siblings
+        (including ones that exited, so counters never go backwards)."""
+        self._check_pid()
+        group = f"{os.getppid()}-"
+        snapshots = [self.snapshot()]
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if not name.endswith('.json') or name == os.path.basename(self._path()):
+                continue
+            path = os.path.join(self.directory, name)
+            if not name.startswith(group):
+                # Left behind by an earlier deployment whose master is gone
+                if not pid_alive(int(name.split('-')[0])):
+                    try: os.remove(path)
+                    except OSError: pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        counters, histograms = {}, {}
+        for snap in snapshots:
+            for name, labels, value in snap['counters']:
+                key = (name, tuple(sorted(labels.items())))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total in snap['histograms']:
+                key = (name, tuple(sorted(labels.items())))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return counters, histograms, len(snapshots)
+
+    def render(self):
+        """Prometheus text exposition (0.0.4) of the merged metrics"""
+        counters, histograms, workers = self.collect()
+        label_str = lambda labels, **extra: prometheus_labels((*labels, *extra.items()))
+        lines = ['# HELP loanlink_metrics_workers Worker snapshots merged into this scrape',
+                 '# TYPE loanlink_metrics_workers gauge', f'loanlink_metrics_workers {workers}']
+        for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (n, labels), value in sorted(counters.items()):
+                    if n == name:
+                        lines.append(f'{name}{label_str(labels)} {value}')
+                continue
+            for (n, labels), (counts, total) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for upper, count in zip((*buckets, '+Inf'), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{label_str(labels, le=upper)} {cumulative}')
+                lines.append(f'{name}_sum{label_str(labels)} {total}')
+                lines.append(f'{name}_count{label_str(labels)} {cumulative}')
+            # Percentiles estimated from the merged buckets, for humans reading /metrics
+            quantile_name = f'{name}_quantile'
+            quantiles = [(labels, counts) for (n, labels), (counts, _) in sorted(histograms.items()) if n == name]
+            if quantiles:
+                lines.append(f'# TYPE {quantile_name} gauge')
+                for labels, counts in quantiles:
+                    for q in QUANTILES:
+                        lines.append(f'{quantile_name}{label_str(labels, quantile=q)} '
+                                     f'{round(histogram_quantile(q, buckets, counts), 6)}')
+        return '\n'.join(lines) + '\n'
+
+def prometheus_labels(pairs):
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}' if pairs else ''
+
+def pid_alive(pid):
     try:
-        conn.execute('PRAGMA journal_mode=WAL')
-        conn.execute('PRAGMA busy_timeout=60000')
-    except:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
         pass
-    return conn
+    return True
+
+metrics = Metrics(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+
+# SQL accounting for the request being handled on this thread (see
+# start_request_metrics); statements run by background threads aren't counted
+request_sql = threading.local()
+
+def record_sql(sql, elapsed, new_statement=True):
+    """Account `elapsed` seconds of running `sql`; new_statement=False adds
+    time spent reading the rows of a statement that was already counted."""
+    if getattr(request_sql, 'active', False):
+        request_sql.count += new_statement
+        request_sql.seconds += elapsed
+    if new_statement and sql.startswith('BEGIN IMMEDIATE'):
+        metrics.observe('loanlink_lock_wait_seconds', {'kind': 'sqlite_write'}, elapsed)
+
+def record_sql_error(e):
+    if 'locked' in str(e) or 'busy' in str(e):
+        metrics.inc('loanlink_sqlite_busy_errors_total', {})
+
+def redact_params(params):
+    """Parameter shapes without values, e.g. ['str', 'int'], for logs."""
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    return [type(v).__name__ for v in params]
+
+class SlowQueryLog:
+    """Per-statement timing table plus a log of statements over a threshold.
+
+    Statements are keyed by their SQL text (placeholders, never values), so
+    the table stays small and holds no user data. The first time a statement
+    is slow its EXPLAIN QUERY PLAN is captured on the same connection. Only
+    this process's statements are kept; each worker has its own table.
+    """
+
+    MAX_STATEMENTS = 1000
+
+    def __init__(self, threshold_ms=None, top_n=50):
+        self.enabled = threshold_ms not in (None, '')
+        self.threshold = float(threshold_ms or 0) / 1000
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    def record(self, conn, sql, params, elapsed, many=False):
+        key = ' '.join(sql.split())
+        slow = elapsed >= self.threshold
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.MAX_STATEMENTS:
+                    # Forget the statement that has cost the least so far
+                    del self._statements[min(self._statements, key=lambda k: self._statements[k]['total'])]
+                entry = self._statements[key] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'slow_calls': 0,
+                                                 'endpoints': {}, 'plan': None}
+            entry['calls'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            endpoint = getattr(request_sql, 'endpoint', None) if getattr(request_sql, 'active', False) else None
+            endpoint = endpoint or 'background'
+            entry['endpoints'][endpoint] = entry['endpoints'].get(endpoint, 0) + 1
+            if slow:
+                entry['slow_calls'] += 1
+            capture_plan = slow and entry['plan'] is None and not many
+        if not slow:
+            return
+        shape = redact_params(params) if not many else 'executemany'
+        print(f"🐢 Slow SQL {elapsed * 1000:.1f} ms [{endpoint}]: {key} params={shape}", flush=True)
+        if capture_plan:
+            try:
+                # The base class's execute(), so the EXPLAIN isn't traced itself
+                plan = [row[3] for row in sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', params)]
+            except sqlite3.Error as e:
+                plan = [f'(no plan: {e})']
+            with self._lock:
+                entry['plan'] = plan
+            print(f"🐢   plan: {' | '.join(plan)}", flush=True)
+
+    def top(self, n=None):
+        with self._lock:
+            rows = sorted(self._statements.items(), key=lambda item: item[1]['total'], reverse=True)[:n or self.top_n]
+            return [{
+                'sql': sql,
+                'calls': e['calls'],
+                'total_ms': round(e['total'] * 1000, 3),
+                'avg_ms': round(e['total'] * 1000 / e['calls'], 3),
+                'max_ms': round(e['max'] * 1000, 3),
+                'slow_calls': e['slow_calls'],
+                'endpoints': dict(e['endpoints']),
+                'plan': e['plan'],
+            } for sql, e in rows]
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
+
+slow_query_log = SlowQueryLog(SQL_SLOW_MS, SQL_TRACE_TOP_N)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement for the request metrics (and the
+    slow-query log, when enabled).
+
+    execute() only runs a SELECT up to its first row; the rest of the scan
+    happens while rows are fetched. So fetch time is added to the statement,
+    and the statement is logged once it is done: rows exhausted, cursor
+    closed or reused for another statement. Statements left half-read (a
+    fetchone() lookup, say) stay open on the connection until
+    InstrumentedConnection.finish_statements(), which the owner calls before
+    the connection goes back to the pool. Never from __del__: by the time a
+    cursor is collected its connection may belong to another thread.
+    """
+
+    _statement = None  # [sql, params, execute seconds, fetch seconds] while rows may remain
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            record_sql_error(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            record_sql(sql, elapsed)
+            self._statement = [sql, parameters, elapsed, 0.0]
+            self.connection.open_statements[id(self._statement)] = self._statement
+        if self.description is None:
+            self._finish()  # nothing to fetch
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.OperationalError as e:
+            record_sql_error(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            record_sql(sql, elapsed)
+            if slow_query_log.enabled:
+                slow_query_log.record(self.connection, sql, (), elapsed, many=True)
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        # Not there when finish_statements() already logged it
+        if statement is not None and self.connection.open_statements.pop(id(statement), None) is not None:
+            finish_statement(self.connection, statement)
+
+    def _fetched(self, start, done):
+        if self._statement is not None:
+            self._statement[3] += time.perf_counter() - start
+            if done:
+                self._finish()
+
+    def __iter__(self):
+        # Timed in batches: a timer around every row would cost more than the row
+        while True:
+            rows = self.fetchmany(256)
+            yield from rows
+            if len(rows) < 256:
+                return
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, True)
+            raise
+        self._fetched(start, False)
+        return row
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+def finish_statement(conn, statement):
+    sql, params, executed, fetched = statement
+    if fetched:
+        record_sql(sql, fetched, new_statement=False)
+    if slow_query_log.enabled:
+        slow_query_log.record(conn, sql, params, executed + fetched)
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.open_statements = {}  # id -> statement of InstrumentedCursors not yet logged
+
+    def finish_statements(self):
+        """Log statements whose rows were never fully read. Call from the
+        thread that owns the connection, before handing it on."""
+        while self.open_statements:
+            _, statement = self.open_statements.popitem()
+            finish_statement(self, statement)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C implementations of these don't go through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared by the request threads.
+
+    Connections are opened lazily (up to max_size) and the PRAGMAs are applied
+    once when a connection is created, not on every checkout. Threads that find
+    the pool exhausted wait up to `timeout` seconds for a connection to come back.
+    """
+
+    _fork_lock = threading.Lock()
+
+    def __init__(self, db_path, max_size=8, timeout=60):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._inherited = []
+        # Bumped by close_all(); connections opened before that are closed on release
+        self._generation = 0
+        self._reset()
+
+    def _reset(self):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        # Last, so threads on the unlocked fast path never see a half reset
+        self._pid = os.getpid()
 
-def hash_password(password):
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False, factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA busy_timeout=60000')
+        except sqlite3.OperationalError:
+            pass
+        conn.pool_generation = self._generation
+        return conn
+
+    def _check_pid(self):
+        # SQLite handles must not cross fork(). A forked child starts an empty
+        # pool; the parent's connections are kept referenced but never used or
+        # closed here, since closing them could checkpoint the parent's WAL.
+        # The lock keeps two racing threads from each resetting the pool and
+        # handing out connections from a pool the other then replaces.
+        if self._pid == os.getpid():
+            return
+        with self._fork_lock:
+            if self._pid != os.getpid():
+                while True:
+                    try:
+                        self._inherited.append(self._idle.get_nowait())
+                    except queue.Empty:
+                        break
+                self._reset()
+
+    def acquire(self):
+        self._check_pid()
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise sqlite3.OperationalError("Database connection pool exhausted")
+        waited = time.perf_counter() - start
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._created += 1
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        metrics.observe('loanlink_lock_wait_seconds', {'kind': 'pool'}, waited)
+        return conn
+
+    def release(self, conn):
+        # Never hand a connection with an open transaction to the next request,
+        # nor one opened before the last close_all()
+        stale = conn.pool_generation != self._generation
+        try:
+            conn.finish_statements()
+            if conn.in_transaction:
+                conn.rollback()
+            if not stale:
+                self._idle.put(conn)
+        except sqlite3.Error:
+            stale = True
+            with self._lock:
+                self._discarded += 1
+        finally:
+            if stale:
+                conn.close()
+                with self._lock:
+                    self._created -= 1
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def close_all(self):
+        """Close idle connections (checked-out ones are closed on release)."""
+        self._check_pid()
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._created - self._in_use,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'wait_total_ms': round(self._wait_total * 1000, 3),
+                'wait_avg_ms': round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+            }
+
+db_pool = ConnectionPool(DB_NAME, max_size=DB_POOL_SIZE)
+
+def get_db_connection():
+    """Return this request's pooled connection, checking one out on first use.
+
+    The connection is returned to the pool by release_db_connection() when the
+    app context tears down, so handlers must not close it themselves.
+    """
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    request_sql.active = True
+    request_sql.endpoint = request.endpoint
+    request_sql.count = 0
+    request_sql.seconds = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if 'db' in g:
+        # So the rows of half-read statements count toward this request
+        g.db.finish_statements()
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.inc('loanlink_http_requests_total',
+                    {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)})
+        metrics.observe('loanlink_http_request_duration_seconds', {'endpoint': endpoint, 'method': request.method},
+                        time.perf_counter() - started)
+        metrics.observe('loanlink_sql_queries_per_request', {'endpoint': endpoint}, request_sql.count)
+        metrics.observe('loanlink_sql_seconds_per_request', {'endpoint': endpoint}, request_sql.seconds)
+    request_sql.active = False
+    return response
+
+@app.route('/api/admin/slow-queries', methods=['GET', 'DELETE'])
+@require_admin
+def slow_queries():
+    """Statements by total time in this worker (?n= rows); DELETE resets the table."""
+    if request.method == 'DELETE':
+        slow_query_log.clear()
+        return jsonify({'success': True})
+    try:
+        n = max(1, int(request.args.get('n', slow_query_log.top_n)))
+    except ValueError:
+        return jsonify({'error': 'n must be an integer'}), 400
+    return jsonify({
+        'enabled': slow_query_log.enabled,
+        'threshold_ms': slow_query_log.threshold * 1000,
+        'pid': os.getpid(),
+        'statements': slow_query_log.top(n),
+    })
+
+def on_metrics_listener():
+    """True when the request came in on the internal METRICS_PORT listener.
+    Uses the accepted socket's local address, which clients can't spoof."""
+    sock = request.environ.get('gunicorn.socket')
+    if METRICS_PORT is None or sock is None:
+        return False
+    try:
+        local = sock.getsockname()
+    except OSError:
+        return False
+    return isinstance(local, tuple) and local[1] == METRICS_PORT
+
+@app.route('/metrics')
+def prometheus_metrics():
+    denied = None if on_metrics_listener() else admin_denied()
+    if denied:
+        return denied
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+# --- Password Hashing ---
+# Stored as "scrypt$n$r$p$salt$hash" (or "pbkdf2_sha256$iterations$salt$hash"
+# where OpenSSL lacks scrypt). Bare 64-hex values are legacy unsalted SHA-256
+# hashes; they still verify and are replaced on the next successful login.
+
+PBKDF2_ITERATIONS = 600_000
+
+def legacy_password_hash(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-def send_loan_notification_email(recipient_email, loan_data):
-    """Send email notification for new loan request"""
-    if not RESEND_API_KEY and not SENDER_PASSWORD:
+def is_legacy_password_hash(stored):
+    return len(stored) == 64 and '$' not in stored
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r)
+
+def make_password_hash(password):
+    salt = os.urandom(16)
+    if hasattr(hashlib, 'scrypt'):
+        n, r, p = PASSWORD_SCRYPT_N, 8, 1
+        digest = _scrypt(password, salt, n, r, p)
+        return f"scrypt${n}${r}${p}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+
+def check_password_hash(stored, password):
+    if is_legacy_password_hash(stored):
+        return hmac.compare_digest(stored, legacy_password_hash(password))
+    scheme, *params = stored.split('$')
+    if scheme == 'scrypt' and len(params) == 5:
+        n, r, p = (int(v) for v in params[:3])
+        digest = _scrypt(password, base64.b64decode(params[3]), n, r, p)
+    elif scheme == 'pbkdf2_sha256' and len(params) == 3:
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), base64.b64decode(params[1]), int(params[0]))
+    else:
+        return False
+    return hmac.compare_digest(digest, base64.b64decode(params[-1]))
+
+def password_needs_rehash(stored):
+    if hasattr(hashlib, 'scrypt'):
+        return not stored.startswith(f"scrypt${PASSWORD_SCRYPT_N}$8$1$")
+    return not stored.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+# Same scheme and cost as real hashes; login verifies against it for unknown emails
+DUMMY_PASSWORD_HASH = make_password_hash(os.urandom(16).hex())
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; answered with 429."""
+
+class PasswordHasher:
+    """Runs password KDFs in a small process pool.
+
+    scrypt is CPU- and memory-bound, so doing it in request threads lets a
+    login burst starve every other request. Here request threads only wait on
+    a future. At most `max_pending` hashes may be outstanding (running or
+    queued); past that, hash()/verify() raise PasswordHasherBusy rather than
+    letting the queue grow without bound. The pool is created on first use so
+    every process that hashes gets its own.
+    """
+
+    LATENCY_WINDOW = 1000
+
+    def __init__(self, workers=2, max_pending=32, timeout=30):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._pending = 0
+        self._pending_max = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failures = 0
+        self._rehashed = 0
+
+    def _pool(self):
+        with self._lock:
+            # An executor inherited across fork() belongs to the parent; its
+            # management thread didn't survive, so start over
+            if self._executor is None or self._pid != os.getpid():
+                # fork: workers inherit the already-imported module instead of
+                # re-running server.py the way spawn/forkserver would
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def start(self):
+        """Fork the workers now, while the process is still single-threaded."""
+        if self.workers > 0:
+            self._pool().submit(int).result(timeout=self.timeout)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHasherBusy()
+        with self._lock:
+            self._pending += 1
+            self._pending_max = max(self._pending_max, self._pending)
+        start = time.perf_counter()
+        ok = False
+        try:
+            if self.workers <= 0:
+                result = fn(*args)
+            else:
+                result = self._pool().submit(fn, *args).result(timeout=self.timeout)
+            ok = True
+            return result
+        except BrokenProcessPool:
+            # A worker died (OOM kill?); start a fresh pool on the next call
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._pending -= 1
+                if ok:
+                    self._completed += 1
+                    self._latencies.append(elapsed)
+                else:
+                    self._failures += 1
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(make_password_hash, password)
+
+    def verify(self, stored, password, upgrade=True):
+        """Check `password` against `stored`; returns (ok, replacement hash or None).
+
+        With `upgrade`, a replacement is offered for legacy or outdated hashes.
+        It is skipped (rather than failing the login) when the queue is full.
+        """
+        if not stored or password is None:
+            return False, None
+        if is_legacy_password_hash(stored):
+            # Cheap to check inline; only the upgrade needs the pool
+            ok = check_password_hash(stored, password)
+        else:
+            ok = self._run(check_password_hash, stored, password)
+        if not ok or not upgrade or not password_needs_rehash(stored):
+            return ok, None
+        try:
+            new_hash = self.hash(password)
+        except PasswordHasherBusy:
+            return True, None
+        with self._lock:
+            self._rehashed += 1
+        return True, new_hash
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pct = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 3) if latencies else 0.0
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'pending_max': self._pending_max,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'failures': self._failures,
+                'rehashed': self._rehashed,
+                'latency_p50_ms': pct(0.50),
+                'latency_p95_ms': pct(0.95),
+                'latency_max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT)
+
+@app.errorhandler(PasswordHasherBusy)
+def handle_password_hasher_busy(e):
+    resp = jsonify({'error': 'Server busy, please retry shortly'})
+    resp.headers['Retry-After'] = '1'
+    return resp, 429
+
+@app.route('/api/admin/password-hash-stats')
+@require_admin
+def password_hash_stats():
+    return jsonify(password_hasher.stats())
+
+def email_configured():
+    return bool(RESEND_API_KEY or SENDER_PASSWORD)
+
+# --- Email Templates ---
+# Templates live in templates/email/<name>.html and <name>.txt. They are
+# compiled once at startup; HTML variants are autoescaped.
+
+EMAIL_TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates', 'email')
+EMAIL_TEMPLATE_NAMES = ['loan_request', 'password_reset', 'payment_reminder']
+
+TERM_UNITS = {
+    'Monthly': 'months',
+    'Weekly': 'weeks',
+    'Bi-Weekly': 'bi-weeks',
+    'Daily': 'days',
+    'One Time': 'days',
+}
+
+def format_money(value):
+    try:
+        return f"${float(value):,.2f}"
+    except (TypeError, ValueError):
+        return f"${value}"
+
+email_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(EMAIL_TEMPLATES_DIR),
+    autoescape=jinja2.select_autoescape(['html']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,
+)
+email_env.filters['money'] = format_money
+EMAIL_TEMPLATES = {
+    name: (email_env.get_template(f'{name}.html'), email_env.get_template(f'{name}.txt'))
+    for name in EMAIL_TEMPLATE_NAMES
+}
+
+def render_email(name, context):
+    """Render a compiled template pair. Returns (subject, html, text)."""
+    html_template, text_template = EMAIL_TEMPLATES[name]
+    return context['subject'], html_template.render(context), text_template.render(context)
+
+def render_email_batch(name, contexts):
+    """Render many messages from the same template (outbox / digest sends)."""
+    html_template, text_template = EMAIL_TEMPLATES[name]
+    return [(c['subject'], html_template.render(c), text_template.render(c)) for c in contexts]
+
+def loan_email_context(loan_data):
+    is_item = loan_data.get('asset_type') == 'item'
+    creator_name = loan_data.get('creator_name', 'A user')
+    if loan_data['role'] == 'borrower':
+        action = f"{creator_name} is requesting to borrow from you"
+    else:
+        action = f"{creator_name} is offering to lend to you"
+    freq = loan_data.get('payment_frequency') or 'Monthly'
+
+    return {
+        'subject': f"New Loan Agreement Request - {loan_data['item_name'] if is_item else format_money(loan_data['amount'])}",
+        'action': action,
+        'is_item': is_item,
+        'item_name': loan_data.get('item_name'),
+        'item_description': loan_data.get('item_description'),
+        'item_condition': loan_data.get('item_condition'),
+        'amount': loan_data.get('amount'),
+        'rate': loan_data.get('rate'),
+        'interest_type': loan_data.get('interest_type'),
+        'months': loan_data.get('months'),
+        'term_unit': TERM_UNITS.get(freq, 'months'),
+        'loan_date': loan_data.get('loan_date'),
+        'repayment_start_date': loan_data.get('repayment_start_date'),
+        'payment_frequency': freq,
+        'monthly': loan_data.get('monthly'),
+        'total': loan_data.get('total'),
+        'app_url': loan_data.get('app_url', ''),
+    }
+
+def payment_reminder_context(loan, lender_name, due_date, app_url):
+    """Context for the payment_reminder template from a loans row."""
+    is_item = loan['asset_type'] == 'item'
+    paid = loan['paid_amount'] or 0
+    return {
+        'subject': f"Payment Reminder - {loan['item_name'] if is_item else format_money(loan['monthly_payment'])} due {due_date}",
+        'is_item': is_item,
+        'item_name': loan['item_name'],
+        'lender_name': lender_name,
+        'due_date': due_date,
+        'payment_frequency': loan['payment_frequency'] or 'Monthly',
+        'monthly': loan['monthly_payment'],
+        'paid': paid,
+        'remaining': max((loan['total_repayment'] or 0) - paid, 0),
+        'app_url': app_url,
+    }
+
+def build_loan_notification_email(loan_data):
+    """Build (subject, html, text) for a new/updated loan request email"""
+    return render_email('loan_request', loan_email_context(loan_data))
+
+def send_email(recipient_email, subject, html, text=None):
+    """Deliver one email via Resend (if configured) or Gmail SMTP. Returns (success, message)."""
+    if not email_configured():
         msg = "Email not configured (RESEND_API_KEY or Gmail App Password missing)."
         print(f"⚠️ {msg}", flush=True)
         return False, msg
     
     try:
-        # Create message details
-        if loan_data.get('asset_type') == 'item':
-            subject = f"New Loan Agreement Request - {loan_data['item_name']}"
-        else:
-            subject = f"New Loan Agreement Request - ${loan_data['amount']:,.2f}"
-        role = loan_data['role']
-        creator_name = loan_data.get('creator_name', 'A user')
-        
-        if role == 'borrower':
-            action = f"{creator_name} is requesting to borrow from you"
-        else:
-            action = f"{creator_name} is offering to lend to you"
-
-        # Determine Term Unit
-        freq = loan_data.get('payment_frequency', 'Monthly')
-        term_unit = 'months'
-        if freq == 'Weekly': term_unit = 'weeks'
-        elif freq == 'Bi-Weekly': term_unit = 'bi-weeks'
-        elif freq == 'Daily': term_unit = 'days'
-        elif freq == 'One Time': term_unit = 'days'
-
-        # ... (Rest of HTML/Text generation is same, abbreviated for brevity)
-        html = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                    <div style="background: linear-gradient(135deg, #6366f1 0%, #a855f7 100%); padding: 30px; border-radius: 10px; text-align: center;">
-                        <h1 style="color: white; margin: 0;">💰 LoanLink</h1>
-                        <p style="color: #e0e7ff; margin: 10px 0 0 0;">Peer-to-Peer Loan Management</p>
-                    </div>
-                    
-                    <div style="background: #f8fafc; padding: 30px; border-radius: 10px; margin-top: 20px;">
-                        <h2 style="color: #1e293b; margin-top: 0;">New Loan Request</h2>
-                        <p style="font-size: 16px;">{action}</p>
-                        
-                        <div style="background: white; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                            <table style="width: 100%; border-collapse: collapse;">
-                                {"""
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Item:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data['item_name']}</td>
-                                </tr>
-                                """ if loan_data.get('asset_type') == 'item' else f"""
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Amount:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">${loan_data['amount']:,.2f}</td>
-                                </tr>
-                                """}
-                                {"""
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Description:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data['item_description']}</td>
-                                </tr>
-                                """ if loan_data.get('asset_type') == 'item' and loan_data.get('item_description') else ""}
-                                {"""
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Condition:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data['item_condition']}</td>
-                                </tr>
-                                """ if loan_data.get('asset_type') == 'item' and loan_data.get('item_condition') else ""}
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Interest Rate:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data['rate']}% ({loan_data['interest_type']})</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Term:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data['months']} {term_unit}</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Loan Date:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data.get('loan_date', 'N/A')}</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Start Payment:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data.get('repayment_start_date', 'N/A')}</td>
-                                </tr>
-                                <tr style="border-top: 2px solid #e2e8f0;">
-                                    <td style="padding: 10px; color: #64748b;">{f"{loan_data.get('payment_frequency', 'Monthly')} {'Fee' if loan_data.get('asset_type') == 'item' else 'Payment'}"}:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right; color: #10b981;">${loan_data['monthly']:,.2f}</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Total Repayment:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right; color: #6366f1;">${loan_data['total']:,.2f}</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 10px; color: #64748b;">Schedule:</td>
-                                    <td style="padding: 10px; font-weight: bold; text-align: right;">{loan_data.get('payment_frequency', 'Monthly')}</td>
-                                </tr>
-                            </table>
-                        </div>
-                        
-                        <p style="color: #64748b; font-size: 14px; margin: 20px 0;">
-                            Please review this loan request and accept or reject it.
-                        </p>
-                        
-                        <div style="margin-top: 25px;">
-                            <a href="{request.host_url}#login" style="display: inline-block; background-color: #6366f1; background: linear-gradient(135deg, #6366f1 0%, #a855f7 100%); color: #ffffff !important; padding: 12px 20px; text-decoration: none; border-radius: 8px; font-weight: bold; margin-right: 10px; border: 1px solid #6366f1;">
-                                Login to Review →
-                            </a>
-                            <a href="{request.host_url}#signup" style="display: inline-block; background-color: #ffffff; color: #6366f1 !important; padding: 12px 20px; text-decoration: none; border-radius: 8px; font-weight: bold; border: 1px solid #6366f1;">
-                                Create Account
-                            </a>
-                        </div>
-                    </div>
-                    
-                    <div style="text-align: center; margin-top: 30px; color: #94a3b8; font-size: 12px;">
-                        <p>This is an automated notification from LoanLink.</p>
-                        <p>If you are a new user, please use the "Create New Account" button above.</p>
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        if loan_data.get('asset_type') == 'item':
-            text = f"LoanLink - New Loan Request\n\n{action}\n\nItem: {loan_data['item_name']}\nTerm: {loan_data['months']} {term_unit}"
-        else:
-            text = f"LoanLink - New Loan Request\n\n{action}\n\nAmount: ${loan_data['amount']:,.2f}\nInterest: {loan_data['rate']}%"
-
         # Use Resend if API Key is available
         if RESEND_API_KEY:
             try:
                 print(f"DEBUG: Attempting to send email via Resend API to {recipient_email}", flush=True)
-                r = resend.Emails.send({
+                params = {
                     "from": "LoanLink <onboarding@resend.dev>",
                     "to": [recipient_email],
                     "subject": subject,
-                    "html": html,
-                    "text": text
-                })
+                    "html": html
+                }
+                if text:
+                    params["text"] = text
+                r = resend.Emails.send(params)
                 print(f"✅ Email successfully sent via Resend to {recipient_email}. ID: {r.get('id')}", flush=True)
                 return True, "Success"
             except Exception as e:
@@ -350,12 +1696,11 @@ def send_loan_notification_email(recipient_email, loan_data):
         msg['Subject'] = subject
         msg['From'] = SENDER_EMAIL
         msg['To'] = recipient_email
-        msg.attach(MIMEText(text, 'plain'))
+        if text:
+            msg.attach(MIMEText(text, 'plain'))
         msg.attach(MIMEText(html, 'html'))
         
-        with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, timeout=10) as server:
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
+        smtp_pool.send(msg)
         
         print(f"✅ Email successfully sent via SMTP to {recipient_email}", flush=True)
         return True, "Success"
@@ -365,6 +1710,125 @@ def send_loan_notification_email(recipient_email, loan_data):
         print(f"❌ {error_msg}", flush=True)
         return False, error_msg
 
+# --- Email Outbox ---
+
+def enqueue_email(conn, kind, recipient, subject, html, text=None, loan_id=None):
+    """Queue an email on `conn`'s open transaction. Call email_outbox.notify() after commit."""
+    c = conn.execute('''
+        INSERT INTO email_outbox (kind, loan_id, recipient, subject, html, text, status, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+    ''', (kind, loan_id, recipient, subject, html, text, time.time(), datetime.now().isoformat()))
+    return c.lastrowid
+
+class EmailOutbox:
+    """Worker threads that drain the email_outbox table.
+
+    A worker claims a due row by flipping it to 'sending' and pushing its
+    next_attempt_at out by the lease time, so a row claimed by a worker that
+    dies is picked up again once the lease expires. Failed sends are retried
+    with exponential backoff; after max_attempts the row is left as 'failed'
+    (dead-lettered) with the last error recorded.
+    """
+
+    LEASE_SECONDS = 120
+    MAX_BACKOFF = 3600
+
+    def __init__(self, workers=2, max_attempts=6, retry_base=30, poll_interval=5):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def start(self):
+        # Threads don't survive fork(): a forked child starts its own
+        self._threads = [t for t in self._threads if t.is_alive()]
+        for i in range(self.workers - len(self._threads)):
+            t = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                worked = self.process_one()
+            except Exception as e:
+                print(f"❌ Email outbox worker error: {e}", flush=True)
+                worked = False
+            if not worked:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        now = time.time()
+        conn = db_pool.acquire()
+        try:
+            row = conn.execute('''
+                UPDATE email_outbox
+                SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?
+                WHERE id = (SELECT id FROM email_outbox
+                            WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                            ORDER BY next_attempt_at LIMIT 1)
+                RETURNING *
+            ''', (now + self.LEASE_SECONDS, now)).fetchone()
+            conn.commit()
+            return row
+        finally:
+            db_pool.release(conn)
+
+    def process_one(self):
+        """Deliver one due email. Returns False when nothing was due."""
+        row = self._claim()
+        if row is None:
+            return False
+
+        if email_configured():
+            started = time.perf_counter()
+            success, msg = send_email(row['recipient'], row['subject'], row['html'], row['text'])
+            metrics.observe('loanlink_email_send_seconds', {'outcome': 'sent' if success else 'failed'},
+                            time.perf_counter() - started)
+            retryable = True
+        else:
+            # Retrying can't help until the server is restarted with credentials
+            success, msg = False, "Email not configured (RESEND_API_KEY or Gmail App Password missing)."
+            retryable = False
+
+        conn = db_pool.acquire()
+        try:
+            if success:
+                conn.execute("UPDATE email_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                             (datetime.now().isoformat(), row['id']))
+            elif retryable and row['attempts'] < self.max_attempts:
+                delay = min(self.retry_base * 2 ** (row['attempts'] - 1), self.MAX_BACKOFF)
+                conn.execute("UPDATE email_outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                             (time.time() + delay, msg, row['id']))
+            else:
+                print(f"❌ Email {row['id']} to {row['recipient']} dead-lettered: {msg}", flush=True)
+                conn.execute("UPDATE email_outbox SET status = 'failed', last_error = ? WHERE id = ?",
+                             (msg, row['id']))
+            conn.commit()
+        finally:
+            db_pool.release(conn)
+        return True
+
+email_outbox = EmailOutbox(EMAIL_OUTBOX_WORKERS, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE)
+
+@app.route('/api/admin/outbox-stats')
+@require_admin
+def outbox_stats():
+    conn = get_db_connection()
+    rows = conn.execute('SELECT status, COUNT(*) AS n FROM email_outbox GROUP BY status').fetchall()
+    return jsonify({row['status']: row['n'] for row in rows})
+
+@app.route('/api/admin/mail-stats')
+@require_admin
+def mail_stats():
+    return jsonify(smtp_pool.stats())
+
 @app.route('/api/debug-email')
 def debug_email():
     results = []
@@ -431,8 +1895,9 @@ def update_profile():
     c = conn.cursor()
     c.execute('UPDATE users SET name = ?, alias = ?, contact = ?, dob = ? WHERE id = ?', 
               (name, alias, contact, dob, user['id']))
+    invalidate_session(conn, user['email'])
     conn.commit()
-    conn.close()
+    session_cache.evict_email(user['email'])
     
     return jsonify({'success': True, 'name': name})
 
@@ -446,7 +1911,7 @@ def register():
     if not email or not password:
         return jsonify({'error': 'Email and password required'}), 400
 
-    hashed = hash_password(password)
+    hashed = password_hasher.hash(password)
     
     try:
         conn = get_db_connection()
@@ -456,7 +1921,6 @@ def register():
         c.execute('INSERT INTO users (email, password, name, token) VALUES (?, ?, ?, ?)', 
                   (email, hashed, name, token))
         conn.commit()
-        conn.close()
         return jsonify({'token': token, 'email': email, 'name': name})
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Email already exists'}), 409
@@ -471,21 +1935,25 @@ def login():
     
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE email = ? COLLATE NOCASE', (email,)).fetchone()
-    conn.close()
     
-    if user and user['password'] == hash_password(password):
+    # Unknown emails are checked against a dummy hash so they take as long as a wrong password
+    if user:
+        ok, new_hash = password_hasher.verify(user['password'], password)
+    else:
+        password_hasher.verify(DUMMY_PASSWORD_HASH, password, upgrade=False)
+        ok, new_hash = False, None
+    if ok:
         token = str(uuid.uuid4())
-        conn = get_db_connection()
         conn.execute('UPDATE users SET token = ? WHERE id = ?', (token, user['id']))
+        if new_hash:
+            # Transparently upgrade legacy SHA-256 / outdated hashes
+            conn.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                         (new_hash, user['id'], user['password']))
+        invalidate_session(conn, user['email'])
         conn.commit()
-        conn.close()
+        session_cache.evict_email(user['email'])
         return jsonify({'token': token, 'email': user['email'], 'name': user['name']})
     else:
-        # Debugging hash mismatch
-        if user:
-            print(f"DEBUG: Login failed for {email}. Password hash mismatch.", flush=True)
-        else:
-            print(f"DEBUG: Login failed. User {email} not found.", flush=True)
         return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/api/forgot-password', methods=['POST'])
@@ -498,7 +1966,6 @@ def forgot_password():
     user = conn.execute('SELECT * FROM users WHERE email = ? COLLATE NOCASE', (email,)).fetchone()
     
     if not user:
-        conn.close()
         return jsonify({'error': 'No user found with that email. Did the database restart?'}), 404
 
     # Generate token
@@ -507,55 +1974,22 @@ def forgot_password():
     
     conn.execute('INSERT OR REPLACE INTO reset_tokens (email, token, expires_at) VALUES (?, ?, ?)', 
                  (email, token, expires_at))
-    conn.commit()
-    conn.close()
 
-    # Send reset email
+    # Queue reset email
     reset_url = f"{request.host_url}#reset?token={token}"
     print(f"DEBUG: Manual Reset Link for {email}: {reset_url}", flush=True)
-    msg = MIMEMultipart()
-    msg['Subject'] = "Reset Your LoanLink Password"
-    msg['From'] = SENDER_EMAIL
-    msg['To'] = email
-    
-    body = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <h2>Password Reset Request</h2>
-            <p>You requested a password reset for your LoanLink account.</p>
-            <p>Click the button below to set a new password:</p>
-            <a href="{reset_url}" style="display: inline-block; background: #6366f1; color: white; padding: 12px 20px; text-decoration: none; border-radius: 8px; font-weight: bold;">Reset Password</a>
-            <p style="color: #64748b; font-size: 12px; margin-top: 20px;">If you didn't request this, you can ignore this email.</p>
-        </body>
-    </html>
-    """
-    msg.attach(MIMEText(body, 'html'))
     
-    if RESEND_API_KEY:
-        try:
-            print(f"DEBUG: Sending reset email via Resend to {email}", flush=True)
-            r = resend.Emails.send({
-                "from": "LoanLink <onboarding@resend.dev>",
-                "to": [email],
-                "subject": "Reset Your LoanLink Password",
-                "html": body
-            })
-            print(f"✅ Reset email sent via Resend. ID: {r.get('id')}", flush=True)
-            return jsonify({'success': True})
-        except Exception as e:
-            print(f"❌ Resend API Error: {str(e)}", flush=True)
-            return jsonify({'error': 'Failed to send reset link', 'details': str(e)}), 500
+    subject, html, text = render_email('password_reset', {
+        'subject': "Reset Your LoanLink Password",
+        'reset_url': reset_url,
+    })
+    enqueue_email(conn, 'password_reset', email, subject, html, text)
+    conn.commit()
+    email_outbox.notify()
 
-    try:
-        with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, timeout=10) as server:
-            server.set_debuglevel(1) # Enable verbose SMTP logs in Render
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-        print(f"✅ Reset email sent to {email}", flush=True)
-        return jsonify({'success': True})
-    except Exception as e:
-        print(f"❌ Error sending reset email: {e}", flush=True)
-        return jsonify({'error': 'Failed to send reset email', 'details': str(e)}), 500
+    if not email_configured():
+        return jsonify({'error': 'Failed to send reset email', 'details': 'Email not configured (RESEND_API_KEY or Gmail App Password missing).'}), 500
+    return jsonify({'success': True})
 
 @app.route('/api/reset-password', methods=['POST'])
 def reset_password():
@@ -567,52 +2001,696 @@ def reset_password():
     reset = conn.execute('SELECT * FROM reset_tokens WHERE token = ?', (token,)).fetchone()
     
     if not reset:
-        conn.close()
         return jsonify({'error': 'Invalid or expired token'}), 400
         
-    hashed = hash_password(new_password)
+    if not new_password:
+        return jsonify({'error': 'Password required'}), 400
+    hashed = password_hasher.hash(new_password)
     conn.execute('UPDATE users SET password = ? WHERE email = ?', (hashed, reset['email']))
     conn.execute('DELETE FROM reset_tokens WHERE token = ?', (token,))
+    invalidate_session(conn, reset['email'])
+    conn.commit()
+    session_cache.evict_email(reset['email'])
+    
+    return jsonify({'success': True})
+
+@app.route('/api/change-password', methods=['POST'])
+def change_password():
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+        
+    data = request.json
+    old_password = data.get('old_password')
+    new_password = data.get('new_password')
+    
+    # Verify old password
+    if not password_hasher.verify(user['password'], old_password, upgrade=False)[0]:
+        return jsonify({'error': 'Incorrect current password'}), 400
+    if not new_password:
+        return jsonify({'error': 'New password required'}), 400
+        
+    conn = get_db_connection()
+    conn.execute('UPDATE users SET password = ? WHERE email = ?', 
+                 (password_hasher.hash(new_password), user['email']))
+    invalidate_session(conn, user['email'])
     conn.commit()
-    conn.close()
+    session_cache.evict_email(user['email'])
     
     return jsonify({'success': True})
 
-@app.route('/api/change-password', methods=['POST'])
-def change_password():
+# --- Middleware-like helper ---
+class SessionCache:
+    """Bounded LRU of bearer token -> user row, with a TTL.
+
+    Anything that changes a user row must call invalidate_session() in the same
+    transaction. That evicts the user locally and appends to the
+    session_invalidations table, which every worker polls (at most every
+    poll_interval seconds) to evict the same user from its own cache.
+
+    Every eviction bumps a generation number. A caller that missed the cache
+    reads the generation before reading the user row and passes it to put(),
+    which drops the row if anything was evicted in between: that row may come
+    from a snapshot taken before the change committed.
+    """
+
+    def __init__(self, max_size=10000, ttl=300, poll_interval=1.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._entries = OrderedDict() # token -> (user, expires_at)
+        self._tokens_by_email = {}
+        self._lock = threading.Lock()
+        self._last_seq = None
+        self._next_poll = 0.0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, token, get_conn):
+        self._sync(get_conn)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                self._drop(token)
+            self.misses += 1
+            return None
+
+    def generation(self):
+        return self._generation
+
+    def put(self, token, user, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if token in self._entries:
+                self._drop(token)
+            self._entries[token] = (user, time.monotonic() + self.ttl)
+            self._tokens_by_email.setdefault(user['email'], set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def evict_email(self, email):
+        with self._lock:
+            for token in self._tokens_by_email.pop(email, ()):
+                self._entries.pop(token, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_email.clear()
+            self._generation += 1
+            self._last_seq = None
+
+    def _drop(self, token):
+        user, _ = self._entries.pop(token)
+        tokens = self._tokens_by_email.get(user['email'])
+        if tokens:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[user['email']]
+
+    def _sync(self, get_conn):
+        # Pick up invalidations committed by other workers. The connection is
+        # only checked out when a poll is due, so a cache hit never touches SQLite.
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_poll:
+                return
+            self._next_poll = now + self.poll_interval
+            last_seq = self._last_seq
+        conn = get_conn()
+        if last_seq is None:
+            row = conn.execute('SELECT MAX(seq) FROM session_invalidations').fetchone()
+            with self._lock:
+                self._last_seq = row[0] or 0
+            return
+        rows = conn.execute('SELECT seq, email FROM session_invalidations WHERE seq > ? ORDER BY seq',
+                            (last_seq,)).fetchall()
+        for row in rows:
+            self.evict_email(row['email'])
+        if rows:
+            with self._lock:
+                self._last_seq = max(self._last_seq or 0, rows[-1]['seq'])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL, SESSION_CACHE_POLL)
+
+def invalidate_session(conn, email):
+    """Drop cached sessions for `email` in this and every other worker.
+
+    Call before committing the change to the user row so the log entry is
+    part of the same transaction, and call session_cache.evict_email() again
+    after the commit: until then other threads of this worker can still read
+    the old row and cache it.
+    """
+    now = time.time()
+    conn.execute('INSERT INTO session_invalidations (email, created_at) VALUES (?, ?)', (email, now))
+    # Entries older than the TTL can no longer match a live cache entry
+    conn.execute('DELETE FROM session_invalidations WHERE created_at < ?', (now - session_cache.ttl - 60,))
+    session_cache.evict_email(email)
+
+def get_current_user():
+    token = request.headers.get('Authorization')
+    if not token:
+        return None
+    # Remove 'Bearer ' if present
+    if token.startswith('Bearer '):
+        token = token[7:]
+    
+    user = session_cache.get(token, get_db_connection)
+    if user is None:
+        generation = session_cache.generation()
+        user = get_db_connection().execute('SELECT * FROM users WHERE token = ?', (token,)).fetchone()
+        if user:
+            session_cache.put(token, user, generation)
+    return user
+
+# --- Pagination helpers ---
+# List endpoints page with an opaque keyset cursor over (created_at, id), newest
+# first, so each page is an index range scan no matter how deep it is.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def get_page_args():
+    """(limit, cursor) from the query string, or None when the client didn't ask for paging"""
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+def page_response(items, limit):
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]['created_at'], items[-1]['id'])
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+def serialize_loans(conn, loan_rows, email, history_by_loan=None, include_history=True):
+    """Shape loan rows for the frontend, attaching payment history and the user's role"""
+    if history_by_loan is None and include_history:
+        # Fetch the payment history of all those loans in one query and group it
+        history_by_loan = {}
+        ids = [row['id'] for row in loan_rows]
+        if ids:
+            placeholders = ','.join('?' * len(ids))
+            payments_cursor = conn.execute(f'SELECT * FROM payments WHERE loan_id IN ({placeholders}) ORDER BY loan_id, date', ids)
+            for p in payments_cursor:
+                history_by_loan.setdefault(p['loan_id'], []).append(serialize_payment(p))
+    
+    loans = []
+    for row in loan_rows:
+        loan = dict(row)
+        
+        # Transform for frontend compatibility
+        if include_history:
+            loan['history'] = history_by_loan.get(loan['id'], [])
+        loan['total'] = loan['total_repayment'] # Alias for frontend
+        loan['monthly'] = loan['monthly_payment'] # Alias
+        loan['paid'] = loan['paid_amount'] # Alias
+        loan['interestType'] = loan['interest_type'] # Alias
+        
+        # Determine role relative to current user
+        if loan['lender_email'] == email:
+            loan['role'] = 'lender'
+            loan['counterparty'] = loan['borrower_email'] 
+        else:
+            loan['role'] = 'borrower'
+            loan['counterparty'] = loan['lender_email']
+        
+        # Pass creator_email implicitly
+        
+        loans.append(loan)
+    return loans
+
+# --- Delta sync helpers ---
+
+def loans_version(conn, email):
+    """Highest row version among the user's loans and loan tombstones"""
+    return conn.execute('''
+        SELECT MAX(
+            (SELECT IFNULL(MAX(row_version), 0) FROM loans WHERE lender_email = ?),
+            (SELECT IFNULL(MAX(row_version), 0) FROM loans WHERE borrower_email = ?),
+            (SELECT IFNULL(MAX(version), 0) FROM sync_tombstones WHERE email = ?)
+        )
+    ''', (email, email, email)).fetchone()[0]
+
+def loans_etag(email, version):
+    """Opaque entity-tag (sent weak, as W/"...") for the user's loans at `version`"""
+    # The same version can render differently per user and per filter. `since`
+    # is left out: a delta client revalidates with the tag of its last sync.
+    # Bodies also embed signed proof links, which are re-signed daily.
+    day = int(time.time()) // 86400
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if k != 'since')
+    key = hashlib.sha256(f"{email}|{args}|{day}".encode()).hexdigest()[:12]
+    return f"{version}-{key}"
+
+def not_modified(etag, headers=None):
+    """A 304 if If-None-Match lists `etag` (weak comparison, as RFC 9110 requires for GET)"""
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'W/"{etag}"', **(headers or {})}
+    return None
+
+def prune_tombstones(conn):
+    """Drop tombstones older than SYNC_TOMBSTONE_DAYS, in the caller's transaction.
+
+    Raises sync_clock.pruned_version to the newest pruned version: a client
+    whose last sync is older than that may have missed a deletion and gets a
+    full resync instead of a delta.
+    """
+    cutoff = int(time.time() - SYNC_TOMBSTONE_DAYS * 86400)
+    pruned = conn.execute('SELECT MAX(version) FROM sync_tombstones WHERE created_at < ?', (cutoff,)).fetchone()[0]
+    if pruned is not None:
+        conn.execute('DELETE FROM sync_tombstones WHERE created_at < ?', (cutoff,))
+        conn.execute('UPDATE sync_clock SET pruned_version = MAX(pruned_version, ?) WHERE id = 1', (pruned,))
+
+def get_loan_changes(conn, email, since):
+    """Loans and payments changed after `since`, plus ids of deleted loans.
+
+    `full` is true when `since` predates the tombstone retention window: the
+    response then holds every loan and the client must replace its copy.
+    """
+    # Read the clock before the changes: anything committed in between is sent
+    # again next time instead of being missed
+    version, pruned_version = conn.execute('SELECT version, pruned_version FROM sync_clock WHERE id = 1').fetchone()
+    if since < pruned_version:
+        since = 0
+    
+    loan_rows = conn.execute('''
+        SELECT * FROM loans
+        WHERE (lender_email = ? AND row_version > ?) OR (borrower_email = ? AND row_version > ?)
+    ''', (email, since, email, since)).fetchall()
+    
+    payments = []
+    ids = [row['id'] for row in loan_rows]
+    if ids:
+        placeholders = ','.join('?' * len(ids))
+        payments = [serialize_payment(p) for p in conn.execute(
+            f'SELECT * FROM payments WHERE loan_id IN ({placeholders}) AND row_version > ? ORDER BY loan_id, date',
+            (*ids, since))]
+    
+    deleted = [row['entity_id'] for row in conn.execute(
+        "SELECT DISTINCT entity_id FROM sync_tombstones WHERE email = ? AND version > ? AND entity = 'loan'",
+        (email, since))]
+    
+    return jsonify({
+        'version': version,
+        'full': since == 0,
+        'loans': serialize_loans(conn, loan_rows, email, include_history=False),
+        'payments': payments,
+        'deleted': deleted,
+    })
+
+# --- Schedule engine ---
+# Mirrors the installment math in app.js updatePreview, but builds the whole
+# per-period schedule and does it for a batch of loans at once: every period of
+# every loan is one row in flat NumPy arrays, so a few thousand loans cost a
+# handful of array operations instead of a Python loop per period.
+
+PERIODS_PER_YEAR = {'Monthly': 12, 'Bi-Weekly': 26, 'Weekly': 52, 'Daily': 365}
+PERIOD_DAYS = {'Bi-Weekly': 14, 'Weekly': 7, 'Daily': 1}
+INTEREST_TYPES = ('simple', 'compound')
+MAX_SCHEDULE_PERIODS = 3650
+MAX_SCHEDULE_BATCH = 5000
+
+def parse_date(value):
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+def schedule_terms(amount, rate, periods, interest_type='simple', frequency='Monthly',
+                   loan_date=None, repayment_start_date=None):
+    """Validate loan terms for compute_schedules. Raises ValueError with a user-facing message."""
+    try:
+        amount = float(amount)
+        rate = float(rate or 0)
+        periods = int(periods)
+    except (TypeError, ValueError):
+        raise ValueError('amount, rate and months must be numbers')
+    if not (0 <= amount < 1e12) or not (0 <= rate <= 1000):
+        raise ValueError('amount must be positive and rate between 0 and 1000')
+    if not 1 <= periods <= MAX_SCHEDULE_PERIODS:
+        raise ValueError(f'months must be between 1 and {MAX_SCHEDULE_PERIODS}')
+    frequency = frequency or 'Monthly'
+    if frequency not in PERIODS_PER_YEAR and frequency != 'One Time':
+        raise ValueError(f'Unknown payment frequency: {frequency}')
+    interest_type = interest_type or 'simple'
+    if interest_type not in INTEREST_TYPES:
+        raise ValueError(f'Unknown interest type: {interest_type}')
+    try:
+        loan_date = parse_date(loan_date) if loan_date else datetime.now().date()
+        first_due = parse_date(repayment_start_date) if repayment_start_date else None
+    except ValueError:
+        raise ValueError('Dates must be YYYY-MM-DD')
+    if first_due is None:
+        # One Time loans run for `periods` days; periodic ones start paying a period in
+        first_due = loan_date + timedelta(days=periods) if frequency == 'One Time' else None
+    return {'amount': amount, 'rate': rate, 'periods': periods, 'interest_type': interest_type,
+            'frequency': frequency, 'loan_date': loan_date, 'first_due': first_due}
+
+def loan_row_terms(loan):
+    return schedule_terms(loan['amount'], loan['rate'], loan['months'], loan['interest_type'],
+                          loan['payment_frequency'], loan['loan_date'], loan['repayment_start_date'])
+
+def _due_dates(start, monthly, step_days, k, first_due_given):
+    """Due date of period k (1-based) for each row, as datetime64[D]."""
+    # Period 1 is due on the given first due date, or else one period after the loan date
+    steps = np.where(first_due_given, k - 1, k)
+    by_days = start + steps * step_days
+    # Calendar months: same day of month, clamped to the month's last day
+    month0 = start.astype('datetime64[M]')
+    month = month0 + steps
+    month_len = (month + np.timedelta64(1, 'M')).astype('datetime64[D]') - month.astype('datetime64[D]')
+    day = np.minimum(start - month0.astype('datetime64[D]'), month_len - np.timedelta64(1, 'D'))
+    by_months = month.astype('datetime64[D]') + day
+    return np.where(monthly, by_months, by_days)
+
+def compute_schedules(terms, include_periods=True):
+    """Installment, totals and (optionally) the per-period schedule for each of `terms`.
+
+    `terms` are dicts from schedule_terms. Each result has installment, total,
+    interest and periods; with include_periods the schedule is columnar:
+    due_date, payment, principal, interest and balance lists, one entry per period.
+    """
+    if not terms:
+        return []
+    P = np.array([t['amount'] for t in terms])
+    r = np.array([t['rate'] for t in terms]) / 100
+    n = np.array([t['periods'] for t in terms])
+    one_time = np.array([t['frequency'] == 'One Time' for t in terms])
+    simple = np.array([t['interest_type'] == 'simple' for t in terms])
+    ppy = np.array([PERIODS_PER_YEAR.get(t['frequency'], 365) for t in terms], dtype=float)
+    years = n / ppy
+    i = r / ppy
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Annuity payment in the overflow-safe form P*i / (1 - (1+i)^-n)
+        annuity = np.where(i > 0, P * i / -np.expm1(-n * np.log1p(i)), P / n)
+    simple_total = P + P * r * years
+    total = np.select([one_time & simple, one_time, simple],
+                      [simple_total, P * np.exp(r * years), simple_total], annuity * n)
+    installment = np.where(one_time, total, np.where(simple, total / n, annuity))
+    amortized = ~simple & ~one_time
+
+    results = [{'installment': round(float(a), 2), 'total': round(float(t), 2),
+                'interest': round(float(t - p), 2), 'periods': int(c)}
+               for a, t, p, c in zip(installment, total, P, np.where(one_time, 1, n))]
+    if not include_periods:
+        return results
+
+    # One row per (loan, period)
+    counts = np.where(one_time, 1, n)
+    offsets = np.cumsum(counts) - counts
+    loan = np.repeat(np.arange(len(terms)), counts)
+    k = np.arange(counts.sum()) - offsets[loan] + 1
+    Pl, nl, il, Al = P[loan], n[loan], i[loan], installment[loan]
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Remaining balance of an annuity after k payments: A * (1 - (1+i)^-(n-k)) / i
+        def annuity_balance(paid):
+            return np.where(il > 0, Al * -np.expm1(-(nl - paid) * np.log1p(il)) / il, Al * (nl - paid))
+        amortized_interest = annuity_balance(k - 1) * il
+        amortized_balance = annuity_balance(k)
+    amortized_rows = amortized[loan]
+    interest = np.where(amortized_rows, amortized_interest, (total[loan] - Pl) / counts[loan])
+    principal = Al - interest
+    balance = np.where(amortized_rows, amortized_balance, Pl - Pl * k / counts[loan])
+    balance = np.where(k == counts[loan], 0.0, np.maximum(balance, 0.0))
+
+    first_due_given = np.array([t['first_due'] is not None for t in terms])
+    starts = np.array([t['first_due'] or t['loan_date'] for t in terms], dtype='datetime64[D]')
+    monthly = np.array([t['frequency'] == 'Monthly' for t in terms])
+    step_days = np.array([PERIOD_DAYS.get(t['frequency'], 1) for t in terms])
+    due = _due_dates(starts[loan], monthly[loan], step_days[loan], k, first_due_given[loan])
+
+    columns = {
+        'due_date': np.datetime_as_string(due, unit='D').tolist(),
+        'payment': np.round(Al, 2).tolist(),
+        'principal': np.round(principal, 2).tolist(),
+        'interest': np.round(interest, 2).tolist(),
+        'balance': np.round(balance, 2).tolist(),
+    }
+    for result, start, count in zip(results, offsets.tolist(), counts.tolist()):
+        result['schedule'] = {name: values[start:start + count] for name, values in columns.items()}
+    return results
+
+# --- Uploads ---
+# Payment proofs are stored once per distinct content under
+# uploads/<h[0:2]>/<h[2:4]>/<sha256><ext>. In views that opt in (make_payment),
+# UploadRequest streams each file part to a temp file while hashing it, so
+# nothing is held in memory, and rejects oversized or non-image parts while the
+# body is still being read. The `uploads` table refcounts files via
+# payments.proof_hash triggers; rows whose count drops to zero are dropped by
+# remove_orphan_uploads and their files deleted by delete_upload_files.
+
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+UPLOAD_TMP_DIR = os.path.join(UPLOADS_DIR, 'tmp')
+# Leading bytes -> (content type, extension); the client's claimed type is only a first filter
+UPLOAD_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'GIF87a', 'image/gif', '.gif'),
+    (b'GIF89a', 'image/gif', '.gif'),
+    (b'%PDF-', 'application/pdf', '.pdf'),
+]
+
+class HashingUpload:
+    """Temp file that hashes and size-checks bytes as the form parser writes them."""
+
+    def __init__(self):
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR)
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > UPLOAD_MAX_BYTES:
+            self.close()
+            raise RequestEntityTooLarge(f'Uploads are limited to {UPLOAD_MAX_BYTES:,} bytes')
+        if len(self.head) < 16:
+            self.head += data[:16 - len(self.head)]
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush etc. go to the underlying file
+        return getattr(self.file, name)
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.path)  # already gone once place_upload has moved it
+        except FileNotFoundError:
+            pass
+
+    def content_type(self):
+        if self.head[:4] == b'RIFF' and self.head[8:12] == b'WEBP':
+            return 'image/webp', '.webp'
+        for signature, content_type, ext in UPLOAD_SIGNATURES:
+            if self.head.startswith(signature):
+                return content_type, ext
+        raise ValueError('Proof must be a PNG, JPEG, GIF, WebP or PDF file')
+
+    def relative_path(self):
+        digest = self.sha256.hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{self.content_type()[1]}"
+
+class UploadRequest(Request):
+    proof_upload = False
+
+    def accept_proof_upload(self):
+        """Apply the proof limits (UPLOAD_MAX_BYTES, images and PDFs only) and
+        hash file parts as they stream in. Call before touching form or files."""
+        self.proof_upload = True
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not self.proof_upload:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        # Checked when the file part starts, before its bytes are read
+        if total_content_length and total_content_length > UPLOAD_MAX_BYTES + 64 * 1024:
+            raise RequestEntityTooLarge(f'Uploads are limited to {UPLOAD_MAX_BYTES:,} bytes')
+        if content_type and not (content_type.startswith('image/')
+                                 or content_type in ('application/pdf', 'application/octet-stream')):
+            raise UnsupportedMediaType('Proof must be an image or PDF')
+        return HashingUpload()
+
+app.request_class = UploadRequest
+
+def register_upload(conn, upload):
+    """Record the upload inside the caller's write transaction. Returns (hash, relative path);
+    the reference is counted when a payment row with that proof_hash is inserted."""
+    digest = upload.sha256.hexdigest()
+    path = upload.relative_path()
+    conn.execute('''
+        INSERT INTO uploads (hash, path, size, content_type, created_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (hash) DO NOTHING
+    ''', (digest, path, upload.size, upload.content_type()[0], datetime.now().isoformat()))
+    return digest, path
+
+def place_upload(upload, path):
+    """Move the temp file into place. Call after commit: from then on the refcount
+    keeps remove_orphan_uploads away, and a duplicate just replaces identical bytes."""
+    final_path = os.path.join(UPLOADS_DIR, path)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    upload.file.flush()
+    os.replace(upload.path, final_path)
+
+def remove_orphan_uploads(conn):
+    """Drop the rows of uploads no payment references any more, inside the write
+    transaction that dropped the references. Returns (hash, path) pairs for
+    delete_upload_files() once that transaction has committed: deleting files
+    here would leave restored rows pointing at nothing if it rolled back."""
+    return [(row['hash'], row['path'])
+            for row in conn.execute('DELETE FROM uploads WHERE refcount <= 0 RETURNING hash, path').fetchall()]
+
+def delete_upload_files(conn, orphans):
+    """Delete the files remove_orphan_uploads() released, after its commit.
+    Under the write lock, so a file re-uploaded in the meantime (its row is
+    back) is kept and no new upload can be registered mid-way."""
+    if not orphans:
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for digest, path in orphans:
+            if conn.execute('SELECT 1 FROM uploads WHERE hash = ?', (digest,)).fetchone():
+                continue
+            try:
+                os.remove(os.path.join(UPLOADS_DIR, path))
+            except FileNotFoundError:
+                pass
+    finally:
+        conn.rollback()
+
+# Serving: proofs are immutable, so responses carry a strong ETag (the content
+# hash), Last-Modified and a year-long private cache lifetime, and answer
+# conditional and Range requests. Access needs either the caller's bearer
+# token (checked against the loans the proof belongs to) or a signed link;
+# the API hands out signed proof_image URLs because <a href> can't send headers.
+# With UPLOAD_OFFLOAD=x-accel (nginx) or x-sendfile (Apache/lighttpd) the
+# proxy streams the bytes and Python only authorizes.
+
+UPLOAD_LINK_DAYS = int(os.environ.get("UPLOAD_LINK_DAYS", 7))
+UPLOAD_OFFLOAD = os.environ.get("UPLOAD_OFFLOAD", "")
+# nginx: location /_protected_uploads/ { internal; alias <UPLOADS_DIR>/; }
+UPLOAD_ACCEL_PREFIX = os.environ.get("UPLOAD_ACCEL_PREFIX", "/_protected_uploads/")
+UPLOAD_CACHE = 'private, max-age=31536000, immutable'
+_upload_secret = None
+
+def upload_url_secret():
+    """Key for signed upload links: UPLOAD_URL_SECRET, else one shared by all workers via the database."""
+    global _upload_secret
+    if _upload_secret is None:
+        secret = os.environ.get("UPLOAD_URL_SECRET")
+        if not secret:
+            conn = db_pool.acquire()
+            try:
+                conn.execute("INSERT OR IGNORE INTO app_secrets (name, value) VALUES ('upload_url', ?)",
+                             (uuid.uuid4().hex + uuid.uuid4().hex,))
+                conn.commit()
+                secret = conn.execute("SELECT value FROM app_secrets WHERE name = 'upload_url'").fetchone()[0]
+            finally:
+                db_pool.release(conn)
+        _upload_secret = secret.encode()
+    return _upload_secret
+
+def upload_signature(path, expires):
+    return hmac.new(upload_url_secret(), f"{path}|{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def sign_upload_url(url):
+    """Signed link for an /uploads/ URL. The expiry is rounded to a day so the
+    URL (and the browser's cached copy) stays the same all day."""
+    if not url or not url.startswith('/uploads/'):
+        return url
+    path = url[len('/uploads/'):]
+    expires = (int(time.time()) // 86400 + UPLOAD_LINK_DAYS) * 86400
+    return f"{url}?expires={expires}&sig={upload_signature(path, expires)}"
+
+def serialize_payment(row):
+    payment = dict(row)
+    payment['proof_image'] = sign_upload_url(payment.get('proof_image'))
+    return payment
+
+def can_view_upload(filename):
+    try:
+        expires = int(request.args.get('expires', 0))
+    except ValueError:
+        expires = 0
+    sig = request.args.get('sig')
+    if sig and expires >= time.time():
+        return hmac.compare_digest(sig, upload_signature(filename, expires))
     user = get_current_user()
     if not user:
-        return jsonify({'error': 'Unauthorized'}), 401
-        
-    data = request.json
-    old_password = data.get('old_password')
-    new_password = data.get('new_password')
-    
-    # Verify old password
-    if hash_password(old_password) != user['password']:
-        return jsonify({'error': 'Incorrect current password'}), 400
-        
-    conn = get_db_connection()
-    conn.execute('UPDATE users SET password = ? WHERE email = ?', 
-                 (hash_password(new_password), user['email']))
-    conn.commit()
-    conn.close()
-    
-    return jsonify({'success': True})
+        return False
+    return get_db_connection().execute('''
+        SELECT 1 FROM payments p JOIN loans l ON l.id = p.loan_id
+        WHERE p.proof_image = ? AND (l.lender_email = ? OR l.borrower_email = ?)
+        LIMIT 1
+    ''', (f"/uploads/{filename}", user['email'], user['email'])).fetchone() is not None
 
-# --- Middleware-like helper ---
-def get_current_user():
-    token = request.headers.get('Authorization')
-    if not token:
-        return None
-    # Remove 'Bearer ' if present
-    if token.startswith('Bearer '):
-        token = token[7:]
-    
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE token = ?', (token,)).fetchone()
-    conn.close()
-    return user
+@app.route('/uploads/<path:filename>')
+def serve_upload(filename):
+    if filename.startswith('tmp/') or not can_view_upload(filename):
+        return jsonify({'error': 'Not found'}), 404
+    path = safe_join(UPLOADS_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'Not found'}), 404
+
+    # Content-addressed names are their own strong validator
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    etag = stem if len(stem) == 64 and all(ch in '0123456789abcdef' for ch in stem) else None
+
+    if UPLOAD_OFFLOAD in ('x-accel', 'x-sendfile'):
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        if UPLOAD_OFFLOAD == 'x-accel':
+            response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX + filename
+        else:
+            response.headers['X-Sendfile'] = path
+    else:
+        response = send_file(path, conditional=True, etag=etag if etag else True, max_age=31536000)
+    response.headers['Cache-Control'] = UPLOAD_CACHE
+    response.headers['Vary'] = 'Authorization'
+    return response
 
 # --- Loan Routes ---
 
@@ -625,41 +2703,90 @@ def get_loans():
     email = user['email']
     conn = get_db_connection()
     
-    # Get all loans where user is lender OR borrower
-    loans_cursor = conn.execute('''
+    if 'since' in request.args:
+        try:
+            since = int(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'since must be an integer version'}), 400
+    
+    # Cheap conditional GET: three index lookups instead of the whole portfolio
+    # (or, for a delta sync, instead of the change queries)
+    etag = loans_etag(email, loans_version(conn, email))
+    cached = not_modified(etag, {'Cache-Control': 'private, no-cache'})
+    if cached:
+        return cached
+    
+    if 'since' in request.args:
+        response = get_loan_changes(conn, email, since)
+        response.headers['ETag'] = f'W/"{etag}"'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    try:
+        page = get_page_args()
+        if page:
+            response = get_loans_page(conn, email, *page)
+        else:
+            response = get_all_loans(conn, email)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response.headers['ETag'] = f'W/"{etag}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def get_all_loans(conn, email):
+    """All loans where user is lender OR borrower, with full payment history"""
+    loan_rows = conn.execute('''
         SELECT * FROM loans 
         WHERE lender_email = ? OR borrower_email = ? 
         ORDER BY created_at DESC
+    ''', (email, email)).fetchall()
+    
+    # Fetch the payment history of all those loans in one query and group it
+    # by loan, instead of one query per loan
+    history_by_loan = {}
+    payments_cursor = conn.execute('''
+        SELECT * FROM payments
+        WHERE loan_id IN (SELECT id FROM loans WHERE lender_email = ? OR borrower_email = ?)
+        ORDER BY loan_id, date
     ''', (email, email))
+    for p in payments_cursor:
+        history_by_loan.setdefault(p['loan_id'], []).append(serialize_payment(p))
     
-    loans = []
-    for row in loans_cursor:
-        loan = dict(row)
-        # Fetch history
-        payments_cur = conn.execute('SELECT * FROM payments WHERE loan_id = ? ORDER BY date', (loan['id'],))
-        history = [dict(p) for p in payments_cur]
-        
-        # Transform for frontend compatibility
-        loan['history'] = history
-        loan['total'] = loan['total_repayment'] # Alias for frontend
-        loan['monthly'] = loan['monthly_payment'] # Alias
-        loan['paid'] = loan['paid_amount'] # Alias
-        loan['interestType'] = loan['interest_type'] # Alias
-        
-        # Determine role relative to current user
-        if loan['lender_email'] == email:
-            loan['role'] = 'lender'
-            loan['counterparty'] = loan['borrower_email'] 
-        else:
-            loan['role'] = 'borrower'
-            loan['counterparty'] = loan['lender_email']
-        
-        # Pass creator_email implicitly
-        
-        loans.append(loan)
-        
-    conn.close()
-    return jsonify(loans)
+    return jsonify(serialize_loans(conn, loan_rows, email, history_by_loan))
+
+def get_loans_page(conn, email, limit, cursor):
+    """One page of the user's loans, filtered by ?status=, ?role= and ?asset_type="""
+    role = request.args.get('role')
+    if role not in (None, '', 'lender', 'borrower'):
+        raise ValueError('role must be lender or borrower')
+    
+    filters, filter_params = '', []
+    if request.args.get('status'):
+        filters += ' AND status = ?'
+        filter_params.append(request.args['status'])
+    if request.args.get('asset_type'):
+        filters += ' AND asset_type = ?'
+        filter_params.append(request.args['asset_type'])
+    if cursor:
+        filters += ' AND (created_at, id) < (?, ?)'
+        filter_params.extend(cursor)
+    
+    # Each side is its own index range scan that stops after limit + 1 rows;
+    # merging the two short lists keeps the cost independent of portfolio size
+    branches, params = [], []
+    for column, side in (('lender_email', 'lender'), ('borrower_email', 'borrower')):
+        if role and role != side:
+            continue
+        branches.append(f'SELECT * FROM (SELECT * FROM loans WHERE {column} = ?{filters} ORDER BY created_at DESC, id DESC LIMIT ?)')
+        params.extend([email, *filter_params, limit + 1])
+    
+    loan_rows = conn.execute(
+        ' UNION '.join(branches) + ' ORDER BY created_at DESC, id DESC LIMIT ?',
+        (*params, limit + 1)
+    ).fetchall()
+    
+    return page_response(serialize_loans(conn, loan_rows, email), limit)
 
 @app.route('/api/loans', methods=['POST'])
 def create_loan():
@@ -701,6 +2828,15 @@ def create_loan():
     
     if lender_email.strip().lower() == borrower_email.strip().lower():
         return jsonify({'error': 'You cannot create a loan with yourself.'}), 400
+    
+    # Recompute the installment and total rather than trusting the client's preview
+    try:
+        terms = schedule_terms(amount, rate, months, type, payment_frequency, loan_date, repayment_start_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    type = terms['interest_type']
+    quote = compute_schedules([terms], include_periods=False)[0]
+    monthly, total = quote['installment'], quote['total']
         
     created_at = datetime.now().isoformat()
     
@@ -710,10 +2846,9 @@ def create_loan():
         INSERT INTO loans (lender_email, borrower_email, creator_email, counterparty_name, asset_type, item_name, item_description, item_condition, amount, rate, months, interest_type, monthly_payment, total_repayment, created_at, status, payment_frequency, loan_date, repayment_start_date)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?)
     ''', (lender_email, borrower_email, creator_email, counterparty_name, asset_type, item_name, item_description, item_condition, amount, rate, months, type, monthly, total, created_at, payment_frequency, loan_date, repayment_start_date))
-    conn.commit()
-    conn.close()
+    loan_id = c.lastrowid
     
-    # Send email notification to counterpartyl
+    # Queue email notification to counterparty in the same transaction
     email_data = {
         'asset_type': asset_type,
         'item_name': item_name,
@@ -729,89 +2864,107 @@ def create_loan():
         'payment_frequency': payment_frequency,
         'loan_date': loan_date,
         'repayment_start_date': repayment_start_date,
-        'creator_name': user['name'] if user['name'] else user['email']
+        'creator_name': user['name'] if user['name'] else user['email'],
+        'app_url': request.host_url
     }
+    subject, html, text = build_loan_notification_email(email_data)
+    outbox_id = enqueue_email(conn, 'loan_request', other_email, subject, html, text, loan_id=loan_id)
+    conn.commit()
+    email_outbox.notify()
     
-    success, msg = send_loan_notification_email(other_email, email_data)
-    if not success:
-        return jsonify({'success': False, 'error': f"Loan created, but {msg}"}), 200 # Still return 200 since loan is created
+    notification = {'id': outbox_id, 'status': 'pending'}
+    if not email_configured():
+        msg = "Email not configured (RESEND_API_KEY or Gmail App Password missing)."
+        return jsonify({'success': False, 'id': loan_id, 'notification': notification, 'error': f"Loan created, but {msg}"}), 200 # Still return 200 since loan is created
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'id': loan_id, 'notification': notification})
 
 @app.route('/api/loans/<int:loan_id>/pay', methods=['POST'])
 def make_payment(loan_id):
+    """Record a payment. `version` (the loan version the client last saw) is
+    optional: with it, the payment is refused with 409 if the loan changed in
+    between, e.g. a double-submitted form or a payment from the other party.
+    Without it the payment is still applied as one atomic increment, so no
+    concurrent payment is lost; the check just isn't made. That keeps older
+    cached copies of app.js and scripts that don't track versions working."""
     user = get_current_user()
     if not user:
         return jsonify({'error': 'Unauthorized'}), 401
 
-    # Safe extraction of amount
-    if request.is_json:
-        amount = request.json.get('amount')
+    # JSON or multipart (multipart when a proof image is attached). Parsing a
+    # multipart body streams the proof through HashingUpload.
+    request.accept_proof_upload()
+    try:
+        req_data = request.json if request.is_json else request.form
+        file = request.files.get('proof')
+    except HTTPException as e:
+        return jsonify({'error': e.description}), e.code
+    try:
+        amount = float(req_data.get('amount'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'amount must be a number'}), 400
+    if not math.isfinite(amount):
+        return jsonify({'error': 'amount must be a number'}), 400
+    if not amount > 0:
+        return jsonify({'error': 'amount must be positive'}), 400
+    expected_version = req_data.get('version')
+    if expected_version in (None, ''):
+        expected_version = None
     else:
-        amount = request.form.get('amount')
-        
-    if amount:
-        amount = float(amount)
-        
-    conn = get_db_connection()
-    
+        try:
+            expected_version = int(expected_version)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'version must be an integer'}), 400
+    method = req_data.get('method', 'Unknown')
+    payment_date = req_data.get('date') or datetime.now().isoformat()
+
+    # The proof is already on disk (hashed) by now, so the write lock is only
+    # held for the statements below
+    upload = file.stream if file and file.filename != '' else None
+    if upload is not None:
+        try:
+            upload.content_type()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 415
+
     conn = get_db_connection()
-    loan = conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
-    
-    if not loan:
-        return jsonify({'error': 'Loan not found'}), 404
-        
-    # Validation?
-    
-    new_paid = loan['paid_amount'] + amount
-    
-    c = conn.cursor()
-    
-    # Check if fully paid
-    if new_paid >= loan['total_repayment'] - 0.01: # Small epsilon for float logic
-        c.execute("UPDATE loans SET paid_amount = ?, status = 'completed' WHERE id = ?", (new_paid, loan_id))
-    else:
-        c.execute('UPDATE loans SET paid_amount = ? WHERE id = ?', (new_paid, loan_id))
-        
-    # Get form data for mixed content (file + text)
-    # If JSON is sent, request.form is empty, so we must support both or switch frontend to FormData exclusively.
-    
-    # Check if request is JSON or Multipart
-    if request.is_json:
-        req_data = request.json
-        method = req_data.get('method', 'Unknown')
-        date_str = req_data.get('date')
-        proof_path = None
-    else:
-        req_data = request.form
-        method = req_data.get('method', 'Unknown')
-        date_str = req_data.get('date')
-        
-        # Handle File
-        proof_path = None
-        if 'proof' in request.files:
-            file = request.files['proof']
-            if file and file.filename != '':
-                # Secure filename and save
-                # Ensure uploads dir exists
-                uploads_dir = os.path.join(BASE_DIR, 'uploads')
-                if not os.path.exists(uploads_dir):
-                    os.makedirs(uploads_dir)
-                    
-                ext = os.path.splitext(file.filename)[1]
-                filename = f"{uuid.uuid4()}{ext}"
-                file.save(os.path.join(uploads_dir, filename))
-                proof_path = f"/uploads/{filename}"
-
-    payment_date = date_str if date_str else datetime.now().isoformat()
-        
-    c.execute('INSERT INTO payments (loan_id, amount, date, method, proof_image) VALUES (?, ?, ?, ?, ?)', 
-              (loan_id, amount, payment_date, method, proof_path))
+    conn.execute('BEGIN IMMEDIATE')
+    # Increment, completion check and version bump in one statement: concurrent
+    # payments serialize on the write lock instead of overwriting each other
+    updated = conn.execute('''
+        UPDATE loans
+        SET paid_amount = COALESCE(paid_amount, 0) + :amount,
+            status = CASE WHEN COALESCE(paid_amount, 0) + :amount >= total_repayment - 0.01
+                          THEN 'completed' ELSE status END,
+            version = version + 1
+        WHERE id = :id AND status = 'active' AND :email IN (lender_email, borrower_email)
+          AND (:expected IS NULL OR version = :expected)
+        RETURNING paid_amount, status, version
+    ''', {'amount': amount, 'id': loan_id, 'email': user['email'], 'expected': expected_version}).fetchall()
+
+    if not updated:
+        loan = conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
+        conn.rollback()
+        if not loan:
+            return jsonify({'error': 'Loan not found'}), 404
+        if user['email'] not in (loan['lender_email'], loan['borrower_email']):
+            return jsonify({'error': 'Unauthorized for this loan'}), 403
+        if loan['status'] != 'active':
+            return jsonify({'error': f"Loan is {loan['status']}, not active", 'version': loan['version']}), 409
+        return jsonify({'error': 'Loan was changed by another payment. Refresh and try again.',
+                        'version': loan['version']}), 409
+
+    proof_hash = proof_path = None
+    if upload is not None:
+        proof_hash, proof_path = register_upload(conn, upload)
+    conn.execute('INSERT INTO payments (loan_id, amount, date, method, proof_image, proof_hash) VALUES (?, ?, ?, ?, ?, ?)',
+                 (loan_id, amount, payment_date, method, proof_path and f"/uploads/{proof_path}", proof_hash))
     conn.commit()
-    conn.close()
-    
-    
-    return jsonify({'success': True, 'new_paid': new_paid})
+    if upload is not None:
+        place_upload(upload, proof_path)
+
+    new_paid, status, version = updated[0]
+    return jsonify({'success': True, 'new_paid': new_paid, 'status': status, 'version': version})
 
 @app.route('/api/loans/<int:loan_id>', methods=['PUT'])
 def update_loan(loan_id):
@@ -823,17 +2976,14 @@ def update_loan(loan_id):
     loan = conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
     
     if not loan:
-        conn.close()
         return jsonify({'error': 'Loan not found'}), 404
     
     # Only creator can edit
     if loan['creator_email'] != user['email']:
-        conn.close()
         return jsonify({'error': 'Only the creator can edit this loan'}), 403
     
     # Only pending loans can be edited
     if loan['status'] != 'pending':
-        conn.close()
         return jsonify({'error': 'Only pending loans can be edited'}), 400
     
     # Get updated data
@@ -850,22 +3000,31 @@ def update_loan(loan_id):
     item_description = data.get('itemDescription')
     item_condition = data.get('itemCondition')
     
+    try:
+        terms = schedule_terms(amount, rate, months, interest_type, loan['payment_frequency'],
+                               loan['loan_date'], loan['repayment_start_date'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    interest_type = terms['interest_type']
+    quote = compute_schedules([terms], include_periods=False)[0]
+    monthly, total = quote['installment'], quote['total']
+    
     # Update the loan
     c = conn.cursor()
     c.execute('''
         UPDATE loans 
         SET amount = ?, rate = ?, months = ?, interest_type = ?, 
             monthly_payment = ?, total_repayment = ?, counterparty_name = ?,
-            asset_type = ?, item_name = ?, item_description = ?, item_condition = ?
+            asset_type = ?, item_name = ?, item_description = ?, item_condition = ?,
+            version = version + 1
         WHERE id = ?
     ''', (amount, rate, months, interest_type, monthly, total, counterparty_name, asset_type, item_name, item_description, item_condition, loan_id))
-    conn.commit()
     
     # Get other party's email
     other_email = loan['borrower_email'] if loan['lender_email'] == user['email'] else loan['lender_email']
     role = 'lender' if loan['lender_email'] == user['email'] else 'borrower'
     
-    # Send updated email notification
+    # Queue updated email notification with the loan update
     email_data = {
         'asset_type': asset_type,
         'item_name': item_name,
@@ -878,15 +3037,41 @@ def update_loan(loan_id):
         'monthly': monthly,
         'total': total,
         'role': role,
-        'creator_name': user['name'] if user['name'] else user['email']
+        'creator_name': user['name'] if user['name'] else user['email'],
+        'app_url': request.host_url
     }
-    success, msg = send_loan_notification_email(other_email, email_data)
+    subject, html, text = build_loan_notification_email(email_data)
+    outbox_id = enqueue_email(conn, 'loan_update', other_email, subject, html, text, loan_id=loan_id)
+    conn.commit()
+    email_outbox.notify()
     
-    conn.close()
-    if not success:
-        return jsonify({'success': False, 'error': f"Loan updated, but {msg}"}), 200
+    notification = {'id': outbox_id, 'status': 'pending'}
+    if not email_configured():
+        msg = "Email not configured (RESEND_API_KEY or Gmail App Password missing)."
+        return jsonify({'success': False, 'notification': notification, 'error': f"Loan updated, but {msg}"}), 200
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'notification': notification})
+
+@app.route('/api/loans/<int:loan_id>/notifications', methods=['GET'])
+def get_loan_notifications(loan_id):
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    loan = conn.execute('SELECT lender_email, borrower_email FROM loans WHERE id = ?', (loan_id,)).fetchone()
+    
+    if not loan:
+        return jsonify({'error': 'Loan not found'}), 404
+    
+    if user['email'] not in [loan['lender_email'], loan['borrower_email']]:
+        return jsonify({'error': 'Unauthorized for this loan'}), 403
+    
+    rows = conn.execute('''
+        SELECT id, kind, recipient, status, attempts, last_error, created_at, sent_at
+        FROM email_outbox WHERE loan_id = ? ORDER BY id
+    ''', (loan_id,))
+    return jsonify([dict(row) for row in rows])
 
 @app.route('/api/loans/<int:loan_id>/accept', methods=['POST'])
 def accept_loan(loan_id):
@@ -898,12 +3083,10 @@ def accept_loan(loan_id):
     loan = conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
     
     if not loan:
-        conn.close()
         return jsonify({'error': 'Loan not found'}), 404
         
     # Only the non-creator can accept.
     if user['email'] not in [loan['lender_email'], loan['borrower_email']]:
-        conn.close()
         return jsonify({'error': 'Unauthorized for this loan'}), 403
         
     # Prevent self-acceptance
@@ -912,13 +3095,11 @@ def accept_loan(loan_id):
     # Stricter: if null, fallback to old logic (anyone). If set, enforce.
     
     if loan['creator_email'] and loan['creator_email'] == user['email']:
-        conn.close()
         return jsonify({'error': 'You created this loan request. The other party must accept it.'}), 403
         
     c = conn.cursor()
-    c.execute("UPDATE loans SET status = 'active' WHERE id = ?", (loan_id,))
+    c.execute("UPDATE loans SET status = 'active', version = version + 1 WHERE id = ?", (loan_id,))
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True})
 
@@ -929,13 +3110,22 @@ def reject_loan(loan_id):
         return jsonify({'error': 'Unauthorized'}), 401
     
     conn = get_db_connection()
+    loan = conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
+    
+    if not loan:
+        return jsonify({'error': 'Loan not found'}), 404
+    
+    if user['email'] not in [loan['lender_email'], loan['borrower_email']]:
+        return jsonify({'error': 'Unauthorized for this loan'}), 403
+    
     # Delete the loan if rejected? Or set status 'rejected'? 
     # Let's delete to keep it clean, or set to 'rejected' for history.
     # 'rejected' is safer.
     c = conn.cursor()
-    c.execute("UPDATE loans SET status = 'rejected' WHERE id = ?", (loan_id,))
+    c.execute("UPDATE loans SET status = 'rejected' WHERE id = ? AND status = 'pending'", (loan_id,))
+    if c.rowcount == 0:
+        return jsonify({'error': 'Only pending loan proposals can be rejected'}), 409
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True})
 
@@ -949,7 +3139,6 @@ def delete_loan(loan_id):
     loan = conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
     
     if not loan:
-        conn.close()
         return jsonify({'error': 'Loan not found'}), 404
         
     can_delete = False
@@ -962,23 +3151,549 @@ def delete_loan(loan_id):
         can_delete = True
         
     if not can_delete:
-         conn.close()
          return jsonify({'error': 'Cannot delete this loan. You can only cancel pending requests you created, or clear rejected loans.'}), 403
 
     c = conn.cursor()
     c.execute('DELETE FROM loans WHERE id = ?', (loan_id,))
     c.execute('DELETE FROM payments WHERE loan_id = ?', (loan_id,))
+    orphans = remove_orphan_uploads(conn)
+    prune_tombstones(conn)
     conn.commit()
-    conn.close()
+    delete_upload_files(conn, orphans)
     
     return jsonify({'success': True})
 
 
+@app.route('/api/portfolio/summary', methods=['GET'])
+def get_portfolio_summary():
+    """Dashboard header totals, read from the trigger-maintained portfolio_summary rows"""
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    rows = get_db_connection().execute(
+        'SELECT role, status, loan_count, outstanding, next_due FROM portfolio_summary WHERE email = ?',
+        (user['email'],)).fetchall()
+    summary = {'total_owed': 0.0, 'total_lent': 0.0, 'next_due_owed': 0.0, 'next_due_lent': 0.0,
+               'counts': {}, 'counts_by_role': {'lender': {}, 'borrower': {}}}
+    for row in rows:
+        if row['loan_count'] <= 0:
+            continue
+        summary['counts'][row['status']] = summary['counts'].get(row['status'], 0) + row['loan_count']
+        summary['counts_by_role'][row['role']][row['status']] = row['loan_count']
+        if row['status'] == 'active':
+            side = 'owed' if row['role'] == 'borrower' else 'lent'
+            summary[f'total_{side}'] = round(max(row['outstanding'], 0), 2)
+            summary[f'next_due_{side}'] = round(max(row['next_due'], 0), 2)
+    return jsonify(summary)
+
+@app.route('/api/schedules', methods=['POST'])
+def get_schedules():
+    """Batch schedules: `loans` is a list of loan terms (same fields as POST /api/loans),
+    `loanIds` a list of the user's stored loans. `includeSchedule: false` returns just the totals."""
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.json or {}
+    submitted = data.get('loans') or []
+    loan_ids = data.get('loanIds') or []
+    include_periods = bool(data.get('includeSchedule', True))
+    if not isinstance(submitted, list) or not isinstance(loan_ids, list):
+        return jsonify({'error': 'loans and loanIds must be lists'}), 400
+    if not submitted and not loan_ids:
+        return jsonify({'error': 'Provide loans or loanIds'}), 400
+    if len(submitted) + len(loan_ids) > MAX_SCHEDULE_BATCH:
+        return jsonify({'error': f'At most {MAX_SCHEDULE_BATCH} loans per request'}), 400
+
+    terms = []
+    for index, loan in enumerate(submitted):
+        try:
+            terms.append(schedule_terms(loan.get('amount'), loan.get('rate'), loan.get('months'),
+                                        loan.get('interestType'), loan.get('paymentFrequency'),
+                                        loan.get('loanDate'), loan.get('repaymentStartDate')))
+        except (AttributeError, ValueError) as e:
+            return jsonify({'error': f'loans[{index}]: {e}'}), 400
+    results = compute_schedules(terms, include_periods)
+
+    if loan_ids:
+        try:
+            loan_ids = [int(loan_id) for loan_id in loan_ids]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'loanIds must be integers'}), 400
+        placeholders = ','.join('?' * len(loan_ids))
+        rows = get_db_connection().execute(f'''
+            SELECT * FROM loans WHERE id IN ({placeholders}) AND (lender_email = ? OR borrower_email = ?)
+        ''', (*loan_ids, user['email'], user['email'])).fetchall()
+        stored, stored_terms, errors = [], [], []
+        for row in rows:
+            try:
+                stored_terms.append(loan_row_terms(row))
+                stored.append(row['id'])
+            except ValueError as e:
+                errors.append({'id': row['id'], 'error': str(e)})
+        for loan_id, result in zip(stored, compute_schedules(stored_terms, include_periods)):
+            results.append({'id': loan_id, **result})
+        results.extend(errors)
+
+    return jsonify({'schedules': results})
+
+# --- Bulk import ---
+# POST /api/import streams NDJSON or CSV records (loans and their payments),
+# validates them one at a time and writes them in chunked executemany
+# transactions. Memory is bounded by the chunk size plus one id per imported
+# loan (so payments can refer back to loans by `ref`). Imports never email.
+#
+# A loan with someone who has a LoanLink account is imported as 'pending' and
+# needs their accept, exactly like POST /api/loans. Only loans with people who
+# have no account (the importer's own bookkeeping) may be imported as 'active'
+# or 'completed', together with their payment history.
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 2000))
+IMPORT_MAX_ERRORS = 1000
+IMPORT_LOAN_STATUSES = ('active', 'pending', 'completed')
+
+def iter_import_records(stream, fmt):
+    """Yield (row_number, record) pairs; record is a dict or the ValueError for that row."""
+    lines = (line.decode('utf-8').lstrip('\ufeff') if number == 0 else line.decode('utf-8')
+             for number, line in enumerate(stream))
+    if fmt == 'csv':
+        # Blank cells mean "not given", so defaults apply as they do for JSON
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            yield number, {k: v for k, v in row.items() if k and v not in ('', None)}
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, ValueError('Invalid JSON')
+            continue
+        yield number, record if isinstance(record, dict) else ValueError('Each line must be a JSON object')
+
+class LoanImport:
+    """Validates import records and writes them in chunked transactions.
+
+    Loans get their ids assigned here (inside the chunk's write transaction) so
+    payments later in the same import can reference them by `ref`.
+    """
+
+    def __init__(self, conn, user, chunk_size=None):
+        self.conn = conn
+        self.email = user['email']
+        self.chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+        self.loans = []       # (ref, terms, values) waiting for the next flush
+        self.payments = []    # (row, loan_ref, loan_id, values)
+        self.loan_ids = {}    # ref -> id of loans imported so far
+        self.ref_status = {}  # ref -> status it was imported with (None: its chunk failed)
+        self.loan_errors = {}  # existing loan id -> why it can't take payments (None: it can)
+        self.registered = {}  # counterparty email -> has an account
+        self.chunk_rows = None  # (first, last) row of the unflushed chunk
+        self.imported = {'loans': 0, 'payments': 0}
+        self.rows = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, row, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'row': row, 'error': message})
+
+    def add(self, row, record):
+        self.rows += 1
+        self.chunk_rows = (self.chunk_rows[0] if self.chunk_rows else row, row)
+        try:
+            if isinstance(record, Exception):
+                raise record
+            kind = record.get('type', 'loan')
+            if kind == 'loan':
+                self.add_loan(record)
+            elif kind == 'payment':
+                self.add_payment(row, record)
+            else:
+                raise ValueError(f'Unknown record type: {kind}')
+        except ValueError as e:
+            self.error(row, str(e))
+        if len(self.loans) + len(self.payments) >= self.chunk_size:
+            self.flush()
+
+    def add_loan(self, record):
+        role = record.get('role', 'lender')
+        if role not in ('lender', 'borrower'):
+            raise ValueError("role must be 'lender' or 'borrower'")
+        other_email = str(record.get('counterpartyEmail') or '').lower().strip()
+        if '@' not in other_email:
+            raise ValueError('counterpartyEmail is required')
+        if other_email == self.email:
+            raise ValueError('You cannot create a loan with yourself.')
+        has_account = self.has_account(other_email)
+        status = record.get('status', 'pending' if has_account else 'active')
+        if status not in IMPORT_LOAN_STATUSES:
+            raise ValueError(f'status must be one of {", ".join(IMPORT_LOAN_STATUSES)}')
+        if has_account and status != 'pending':
+            raise ValueError(f'{other_email} has an account, so the loan must be imported as pending '
+                             'and accepted by them')
+        asset_type = record.get('assetType', 'currency')
+        if asset_type not in ('currency', 'item'):
+            raise ValueError("assetType must be 'currency' or 'item'")
+        ref = record.get('ref')
+        if ref is not None and str(ref) in self.loan_ids:
+            raise ValueError(f'Duplicate ref: {ref}')
+        terms = schedule_terms(record.get('amount'), record.get('rate'), record.get('months'),
+                               record.get('interestType'), record.get('paymentFrequency'),
+                               record.get('loanDate'), record.get('repaymentStartDate'))
+        lender, borrower = (self.email, other_email) if role == 'lender' else (other_email, self.email)
+        values = {
+            'lender_email': lender, 'borrower_email': borrower, 'creator_email': self.email,
+            'counterparty_name': record.get('counterpartyName'), 'asset_type': asset_type,
+            'item_name': record.get('itemName'), 'item_description': record.get('itemDescription'),
+            'item_condition': record.get('itemCondition'), 'amount': terms['amount'], 'rate': terms['rate'],
+            'months': terms['periods'], 'interest_type': terms['interest_type'], 'status': status,
+            'payment_frequency': terms['frequency'], 'loan_date': record.get('loanDate'),
+            'repayment_start_date': record.get('repaymentStartDate'),
+            'created_at': record.get('createdAt') or datetime.now().isoformat(),
+        }
+        if ref is not None:
+            # Reserve the ref now so later rows see duplicates; the id is set on flush
+            self.loan_ids[str(ref)] = None
+            self.ref_status[str(ref)] = status
+        self.loans.append((None if ref is None else str(ref), terms, values))
+
+    def add_payment(self, row, record):
+        try:
+            amount = float(record.get('amount'))
+        except (TypeError, ValueError):
+            raise ValueError('amount must be a number')
+        if not math.isfinite(amount):
+            raise ValueError('amount must be a number')
+        if not amount > 0:
+            raise ValueError('amount must be positive')
+        loan_ref, loan_id = record.get('loanRef'), record.get('loanId')
+        if loan_ref is not None:
+            if str(loan_ref) not in self.loan_ids:
+                raise ValueError(f'Unknown loanRef: {loan_ref} (loans must come before their payments)')
+            loan_ref = str(loan_ref)
+            status = self.ref_status[loan_ref]
+            if status is None:
+                raise ValueError(f'Loan {loan_ref} was not imported')
+            if status == 'pending':
+                raise ValueError(f'Loan {loan_ref} is pending, not active')
+        elif loan_id is not None:
+            try:
+                loan_id = int(loan_id)
+            except (TypeError, ValueError):
+                raise ValueError('loanId must be an integer')
+            problem = self.payment_error(loan_id)
+            if problem:
+                raise ValueError(problem)
+        else:
+            raise ValueError('Payment needs a loanRef or loanId')
+        values = (amount, record.get('date') or datetime.now().isoformat(), record.get('method', 'Import'))
+        self.payments.append((row, loan_ref, loan_id, values))
+
+    def has_account(self, email):
+        if email not in self.registered:
+            self.registered[email] = self.conn.execute('SELECT 1 FROM users WHERE email = ?',
+                                                       (email,)).fetchone() is not None
+        return self.registered[email]
+
+    def payment_error(self, loan_id):
+        """Why an existing loan can't take payments from this user (None if it can); same rules as make_payment."""
+        if loan_id not in self.loan_errors:
+            loan = self.conn.execute('SELECT lender_email, borrower_email, status FROM loans WHERE id = ?',
+                                     (loan_id,)).fetchone()
+            if not loan or self.email not in (loan['lender_email'], loan['borrower_email']):
+                self.loan_errors[loan_id] = f'Loan {loan_id} not found'
+            elif loan['status'] != 'active':
+                self.loan_errors[loan_id] = f"Loan {loan_id} is {loan['status']}, not active"
+            else:
+                self.loan_errors[loan_id] = None
+        return self.loan_errors[loan_id]
+
+    def flush(self):
+        if not self.loans and not self.payments:
+            return
+        conn = self.conn
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            payments = self._write_chunk(conn)
+            conn.commit()
+            self.imported['loans'] += len(self.loans)
+            self.imported['payments'] += payments
+        except sqlite3.Error as e:
+            # Earlier chunks stay committed; this one is reported and skipped
+            conn.rollback()
+            first, last = self.chunk_rows
+            self.error(first, f'Rows {first}-{last} were not imported: {e}')
+            for ref, _, _ in self.loans:
+                if ref is not None:
+                    self.loan_ids[ref] = self.ref_status[ref] = None
+        self.loans, self.payments = [], []
+        self.chunk_rows = None
+
+    def _write_chunk(self, conn):
+        """Write the pending loans and payments; returns how many payments were written."""
+        # Existing loans may have been paid off or changed since their rows
+        # were validated; recheck under the write lock, as make_payment does
+        existing = {loan_id for _, loan_ref, loan_id, _ in self.payments if loan_ref is None}
+        if existing:
+            placeholders = ','.join('?' * len(existing))
+            active = {row[0] for row in conn.execute(
+                f"SELECT id FROM loans WHERE id IN ({placeholders}) AND status = 'active'", tuple(existing))}
+            payments = []
+            for payment in self.payments:
+                row, loan_ref, loan_id, _ = payment
+                if loan_ref is None and loan_id not in active:
+                    self.loan_errors[loan_id] = f'Loan {loan_id} is no longer active'
+                    self.error(row, self.loan_errors[loan_id])
+                else:
+                    payments.append(payment)
+        else:
+            payments = self.payments
+
+        # Payments for loans in this same chunk go straight into the loan's
+        # INSERT instead of a follow-up UPDATE per loan
+        paid_on_insert = {}
+        for _, loan_ref, _, (amount, _, _) in payments:
+            if loan_ref is not None and self.loan_ids[loan_ref] is None:
+                paid_on_insert[loan_ref] = paid_on_insert.get(loan_ref, 0) + amount
+
+        # Claim one block of sync-clock values for every row in the chunk
+        count = len(self.loans) + len(payments)
+        version = conn.execute('UPDATE sync_clock SET version = version + ? WHERE id = 1 RETURNING version',
+                               (count,)).fetchall()[0][0] - count + 1
+        if self.loans:
+            # Nobody else can insert while we hold the write lock, so ids
+            # after the AUTOINCREMENT high-water mark are ours
+            next_id = conn.execute('''
+                SELECT MAX(COALESCE((SELECT MAX(id) FROM loans), 0),
+                           COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'loans'), 0))
+            ''').fetchone()[0] + 1
+            quotes = compute_schedules([terms for _, terms, _ in self.loans], include_periods=False)
+            rows = []
+            for (ref, _, values), quote in zip(self.loans, quotes):
+                if ref is not None:
+                    self.loan_ids[ref] = next_id
+                paid = paid_on_insert.get(ref, 0)
+                status = values['status']
+                if status == 'active' and paid >= quote['total'] - 0.01:
+                    status = 'completed'
+                rows.append({**values, 'id': next_id, 'monthly_payment': quote['installment'],
+                             'total_repayment': quote['total'], 'paid_amount': paid, 'status': status,
+                             'row_version': version})
+                next_id += 1
+                version += 1
+            conn.executemany('''
+                INSERT INTO loans (id, lender_email, borrower_email, creator_email, counterparty_name, asset_type,
+                                   item_name, item_description, item_condition, amount, rate, months, interest_type,
+                                   monthly_payment, total_repayment, paid_amount, status, payment_frequency,
+                                   loan_date, repayment_start_date, created_at, row_version)
+                VALUES (:id, :lender_email, :borrower_email, :creator_email, :counterparty_name, :asset_type,
+                        :item_name, :item_description, :item_condition, :amount, :rate, :months, :interest_type,
+                        :monthly_payment, :total_repayment, :paid_amount, :status, :payment_frequency,
+                        :loan_date, :repayment_start_date, :created_at, :row_version)
+            ''', rows)
+
+        payment_rows, paid_by_loan, paid_by_ref = [], {}, {}
+        for _, loan_ref, loan_id, (amount, date, method) in payments:
+            if loan_ref is not None:
+                loan_id = self.loan_ids[loan_ref]
+                if loan_ref not in paid_on_insert:
+                    paid_by_ref[loan_id] = paid_by_ref.get(loan_id, 0) + amount
+            else:
+                paid_by_loan[loan_id] = paid_by_loan.get(loan_id, 0) + amount
+            payment_rows.append((loan_id, amount, date, method, version))
+            version += 1
+        conn.executemany('INSERT INTO payments (loan_id, amount, date, method, row_version) VALUES (?, ?, ?, ?, ?)',
+                         payment_rows)
+        # Same increment-and-complete update as make_payment, once per loan.
+        # Loans from earlier chunks of this import keep the status they were
+        # imported with (a completed loan's history may follow it); loans that
+        # were already in the database only take payments while active.
+        update = '''
+            UPDATE loans
+            SET paid_amount = COALESCE(paid_amount, 0) + :paid,
+                status = CASE WHEN status = 'active' AND COALESCE(paid_amount, 0) + :paid >= total_repayment - 0.01
+                              THEN 'completed' ELSE status END,
+                version = version + 1
+            WHERE id = :id
+        '''
+        conn.executemany(update, [{'id': loan_id, 'paid': paid} for loan_id, paid in paid_by_ref.items()])
+        conn.executemany(update + " AND status = 'active'",
+                         [{'id': loan_id, 'paid': paid} for loan_id, paid in paid_by_loan.items()])
+        return len(payments)
+
+    def report(self):
+        return {'success': self.error_count == 0, 'rows': self.rows, 'imported': self.imported,
+                'error_count': self.error_count, 'errors': self.errors}
+
+@app.route('/api/import', methods=['POST'])
+def import_loans():
+    """Bulk-create loans and payments from NDJSON (default) or CSV (?format=csv or a text/csv body).
+
+    Each record has `type` "loan" (POST /api/loans fields plus optional ref, status
+    and createdAt) or "payment" (amount, date, method and loanRef or loanId).
+    Payments go only into active loans (or the history of a loan imported with
+    them); a chunk that fails to write is reported and the import carries on.
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    fmt = request.args.get('format') or ('csv' if 'csv' in (request.content_type or '') else 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    importer = LoanImport(get_db_connection(), user)
+    try:
+        # Buffered so line iteration doesn't read the WSGI input a byte at a time
+        stream = io.BufferedReader(request.stream, buffer_size=64 * 1024)
+        for row, record in iter_import_records(stream, fmt):
+            importer.add(row, record)
+        importer.flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        importer.error(importer.rows + 1, f'Unreadable input: {e}')
+        importer.flush()
+    return jsonify(importer.report())
+
+# --- Export ---
+# GET /api/export streams the caller's loans and payment ledger straight from
+# a SQLite cursor. Rows are encoded (and optionally gzipped) in ~64KB pieces,
+# so memory stays flat however long the history is.
+
+EXPORT_LOAN_COLUMNS = ['id', 'role', 'counterparty', 'counterparty_name', 'status', 'asset_type', 'item_name',
+                       'amount', 'rate', 'months', 'interest_type', 'payment_frequency', 'monthly_payment',
+                       'total_repayment', 'paid_amount', 'loan_date', 'repayment_start_date', 'created_at']
+EXPORT_PAYMENT_COLUMNS = ['payment_id', 'payment_amount', 'payment_date', 'payment_method']
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+def iter_export_rows(conn, email):
+    """(loan dict, payment dict or None) per payment, in loan order; one row per loan without payments."""
+    # One side at a time so each half is an index range scan already in order
+    for side, role, other in (('lender_email', 'lender', 'borrower_email'),
+                              ('borrower_email', 'borrower', 'lender_email')):
+        cursor = conn.execute(f'''
+            SELECT l.*, '{role}' AS role, l.{other} AS counterparty,
+                   p.id AS payment_id, p.amount AS payment_amount, p.date AS payment_date, p.method AS payment_method
+            FROM loans l LEFT JOIN payments p ON p.loan_id = l.id
+            WHERE l.{side} = ?
+            ORDER BY l.created_at, l.id, p.date
+        ''', (email,))
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for row in rows:
+                loan = {column: row[column] for column in EXPORT_LOAN_COLUMNS}
+                payment = None
+                if row['payment_id'] is not None:
+                    payment = {'id': row['payment_id'], 'amount': row['payment_amount'],
+                               'date': row['payment_date'], 'method': row['payment_method']}
+                yield loan, payment
+
+def iter_export_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_LOAN_COLUMNS + EXPORT_PAYMENT_COLUMNS)
+    for loan, payment in rows:
+        payment = payment or {}
+        writer.writerow([loan[c] for c in EXPORT_LOAN_COLUMNS] +
+                        [payment.get('id'), payment.get('amount'), payment.get('date'), payment.get('method')])
+        if out.tell() >= EXPORT_FLUSH_BYTES:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+def iter_export_ndjson(rows):
+    """One line per loan with its payments nested (rows arrive grouped by loan)."""
+    parts, size, current = [], 0, None
+    for loan, payment in rows:
+        if current is None or current['id'] != loan['id']:
+            if current is not None:
+                line = json.dumps(current) + '\n'
+                parts.append(line)
+                size += len(line)
+                if size >= EXPORT_FLUSH_BYTES:
+                    yield ''.join(parts)
+                    parts, size = [], 0
+            current = {**loan, 'payments': []}
+        if payment:
+            current['payments'].append(payment)
+    if current is not None:
+        parts.append(json.dumps(current) + '\n')
+    yield ''.join(parts)
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/export', methods=['GET'])
+def export_loans():
+    """Download the caller's loans and payments: ?format=csv (one row per payment) or ndjson (one loan per line).
+    Compressed on the fly when the client accepts gzip (or asks with ?gzip=1)."""
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    use_gzip = request.args.get('gzip') == '1' or request.accept_encodings['gzip'] > 0
+    email = user['email']
+
+    def generate():
+        # Its own connection: the request's one goes back to the pool before the body is streamed
+        conn = db_pool.acquire()
+        try:
+            rows = iter_export_rows(conn, email)
+            encoded = iter_export_csv(rows) if fmt == 'csv' else iter_export_ndjson(rows)
+            chunks = (chunk.encode('utf-8') for chunk in encoded if chunk)
+            yield from gzip_stream(chunks) if use_gzip else chunks
+        finally:
+            db_pool.release(conn)
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="loanlink-export.{fmt}"',
+        'Cache-Control': 'private, no-store',
+        'Vary': 'Accept-Encoding',
+    }
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers=headers)
+
 # --- Marketplace Listings Routes ---
 
 @app.route('/api/listings', methods=['GET'])
 def get_listings():
     conn = get_db_connection()
+    
+    try:
+        page = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if page:
+        limit, cursor = page
+        keyset, params = '', []
+        if cursor:
+            keyset = 'AND (l.created_at, l.id) < (?, ?)'
+            params.extend(cursor)
+        listings_cursor = conn.execute(f'''
+            SELECT l.*, u.name as owner_name, u.alias as owner_alias 
+            FROM listings l
+            JOIN users u ON l.user_email = u.email
+            WHERE l.status = 'active' {keyset}
+            ORDER BY l.created_at DESC, l.id DESC
+            LIMIT ?
+        ''', (*params, limit + 1))
+        return page_response([dict(row) for row in listings_cursor], limit)
+    
     listings_cursor = conn.execute('''
         SELECT l.*, u.name as owner_name, u.alias as owner_alias 
         FROM listings l
@@ -987,9 +3702,174 @@ def get_listings():
         ORDER BY l.created_at DESC
     ''')
     listings = [dict(row) for row in listings_cursor]
-    conn.close()
     return jsonify(listings)
 
+# Range filters for /api/listings/search: query arg -> (column, operator)
+LISTING_FILTERS = {
+    'min_charge': ('charge', '>='), 'max_charge': ('charge', '<='),
+    'min_deposit': ('deposit', '>='), 'max_deposit': ('deposit', '<='),
+    'min_tenure': ('tenure', '>='), 'max_tenure': ('tenure', '<='),
+}
+
+def listing_match_query(text):
+    """FTS5 MATCH expression for free text: every word must match, as a prefix
+    ("dri" finds "drill"). Words are quoted so FTS5 operators in the input are
+    searched for literally."""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{w}"*' for w in words)
+
+@app.route('/api/listings/search', methods=['GET'])
+def search_listings():
+    """Active listings matching ?q= (ranked best-first, name matches weigh most)
+    and/or the LISTING_FILTERS ranges. Without q, newest first. Always paged:
+    {items, next_cursor} like /api/listings?limit=.
+
+    Ranked pages are best-effort: the cursor is (rank, id), and BM25 ranks
+    shift whenever listings are added, edited or removed, so a listing may be
+    repeated or skipped across pages fetched while the corpus changes. Paging
+    an unchanged corpus visits every match exactly once."""
+    try:
+        limit, cursor = get_page_args() or (DEFAULT_PAGE_SIZE, None)
+        filters, params = [], []
+        for arg, (column, op) in LISTING_FILTERS.items():
+            if request.args.get(arg, '') != '':
+                try:
+                    params.append(float(request.args[arg]))
+                except ValueError:
+                    raise ValueError(f'{arg} must be a number')
+                filters.append(f'l.{column} {op} ?')
+        match = listing_match_query(request.args.get('q', ''))
+        if match and cursor:
+            cursor = (float(cursor[0]), cursor[1])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db_connection()
+    where = ''.join(f' AND {f}' for f in filters)
+    if match:
+        if cursor:
+            where += ' AND (f.rank, l.id) > (?, ?)'
+            params.extend(cursor)
+        rows = conn.execute(f'''
+            SELECT l.*, u.name AS owner_name, u.alias AS owner_alias, f.rank AS rank
+            FROM listings_fts f
+            JOIN listings l ON l.id = f.rowid
+            JOIN users u ON l.user_email = u.email
+            WHERE listings_fts MATCH ? AND l.status = 'active' {where}
+            ORDER BY f.rank, l.id
+            LIMIT ?
+        ''', (match, *params, limit + 1)).fetchall()
+        items = [dict(row) for row in rows]
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1]['rank'], items[-1]['id'])
+        for item in items:
+            del item['rank']
+        return jsonify({'items': items, 'next_cursor': next_cursor})
+
+    if cursor:
+        where += ' AND (l.created_at, l.id) < (?, ?)'
+        params.extend(cursor)
+    rows = conn.execute(f'''
+        SELECT l.*, u.name AS owner_name, u.alias AS owner_alias
+        FROM listings l
+        JOIN users u ON l.user_email = u.email
+        WHERE l.status = 'active' {where}
+        ORDER BY l.created_at DESC, l.id DESC
+        LIMIT ?
+    ''', (*params, limit + 1))
+    return page_response([dict(row) for row in rows], limit)
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_NEARBY_RADIUS_KM = 10
+MAX_NEARBY_RADIUS_KM = 500
+
+def parse_coordinates(lat, lon):
+    """(lat, lon) as floats, or ValueError when either is missing or out of range"""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError('lat and lon must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat must be within ±90 and lon within ±180')
+    return lat, lon
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_boxes(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) boxes covering every point within
+    radius_km of (lat, lon); two boxes when the circle crosses the antimeridian."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle covers a pole: every longitude is in range
+        return [(max(min_lat, -90), min(max_lat, 90), -180, 180)]
+    dlon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180), (min_lat, max_lat, -180, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180), (min_lat, max_lat, -180, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+@app.route('/api/listings/nearby', methods=['GET'])
+def nearby_listings():
+    """Active listings within ?radius_km= of ?lat=&lon=, nearest first, each with
+    distance_km. The R*Tree narrows the candidates to a bounding box; exact
+    great-circle distance decides what is in range."""
+    try:
+        lat, lon = parse_coordinates(request.args.get('lat'), request.args.get('lon'))
+        try:
+            radius_km = float(request.args.get('radius_km', DEFAULT_NEARBY_RADIUS_KM))
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError('radius_km and limit must be numbers')
+        if not 0 < radius_km <= MAX_NEARBY_RADIUS_KM:
+            raise ValueError(f'radius_km must be between 0 and {MAX_NEARBY_RADIUS_KM}')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db_connection()
+    # Search growing circles (r/64, r/16, r/4, r) and stop at the first one
+    # holding `limit` listings: everything inside it is nearer than anything
+    # outside, so dense areas only read about `limit` rows
+    for search_km in [radius_km / 64, radius_km / 16, radius_km / 4, radius_km]:
+        distances = {}
+        for box in bounding_boxes(lat, lon, search_km):
+            # CROSS JOIN keeps the R*Tree as the outer loop, so only boxed rows are read
+            rows = conn.execute('''
+                SELECT l.id, l.latitude, l.longitude
+                FROM listings_geo g
+                CROSS JOIN listings l ON l.id = g.id
+                WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?
+                  AND l.status = 'active'
+            ''', box)
+            for row in rows:
+                distance = haversine_km(lat, lon, row['latitude'], row['longitude'])
+                if distance <= search_km:
+                    distances[row['id']] = distance
+        if len(distances) >= limit:
+            break
+    nearest = heapq.nsmallest(limit, distances, key=lambda listing_id: (distances[listing_id], listing_id))
+
+    items = []
+    if nearest:
+        placeholders = ','.join('?' * len(nearest))
+        rows = conn.execute(f'''
+            SELECT l.*, u.name AS owner_name, u.alias AS owner_alias
+            FROM listings l
+            JOIN users u ON l.user_email = u.email
+            WHERE l.id IN ({placeholders})
+        ''', nearest)
+        items = [{**dict(row), 'distance_km': round(distances[row['id']], 3)} for row in rows]
+        items.sort(key=lambda item: (distances[item['id']], item['id']))
+    return jsonify({'items': items})
+
 @app.route('/api/listings', methods=['POST'])
 def create_listing():
     user = get_current_user()
@@ -1003,20 +3883,27 @@ def create_listing():
     deposit = data.get('deposit')
     location = data.get('location')
     tenure = data.get('tenure')
+    latitude = data.get('latitude')
+    longitude = data.get('longitude')
     
     if not item_name:
         return jsonify({'error': 'Item name is required'}), 400
+    if latitude is not None or longitude is not None:
+        try:
+            latitude, longitude = parse_coordinates(latitude, longitude)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
     created_at = datetime.now().isoformat()
     
     conn = get_db_connection()
     c = conn.cursor()
     c.execute('''
-        INSERT INTO listings (user_email, item_name, description, charge, deposit, location, tenure, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (user['email'], item_name, description, charge, deposit, location, tenure, created_at))
+        INSERT INTO listings (user_email, item_name, description, charge, deposit, location, tenure,
+                              latitude, longitude, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user['email'], item_name, description, charge, deposit, location, tenure, latitude, longitude, created_at))
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True})
 
@@ -1030,30 +3917,127 @@ def delete_listing(listing_id):
     listing = conn.execute('SELECT * FROM listings WHERE id = ?', (listing_id,)).fetchone()
     
     if not listing:
-        conn.close()
         return jsonify({'error': 'Listing not found'}), 404
         
     if listing['user_email'] != user['email']:
-        conn.close()
         return jsonify({'error': 'You can only delete your own listings'}), 403
         
     c = conn.cursor()
     c.execute('DELETE FROM listings WHERE id = ?', (listing_id,))
     conn.commit()
-    conn.close()
     
     return jsonify({'success': True})
 
 
 # --- Static Files ---
+# At startup the front-end assets are fingerprinted (app.<hash>.js), written to
+# STATIC_BUILD_DIR with gzip and brotli variants, and index.html is rewritten
+# to point at them. Fingerprinted files never change, so they are cached for a
+# year; index.html is revalidated against its ETag. Everything is also kept in
+# memory, so serving an asset is a dict lookup.
+
+STATIC_BUILD_DIR = os.environ.get("LOANLINK_STATIC_BUILD", os.path.join(BASE_DIR, "build", "static"))
+STATIC_ASSETS = ['style.css', 'app.js']
+STATIC_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+    '.html': 'text/html; charset=utf-8',
+}
+STATIC_SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+def compress_variant(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return data
+
+def build_static_asset(name, data, build_dir, reuse=True):
+    """Asset record with every encoding of `data`, stored as build_dir/name(.gz|.br).
+    Fingerprinted names are reused from disk if another worker already built them."""
+    encodings = ['identity', 'gzip'] + (['br'] if brotli else [])
+    variants = {}
+    for encoding in encodings:
+        path = os.path.join(build_dir, name + STATIC_SUFFIXES[encoding])
+        if reuse and os.path.exists(path):
+            with open(path, 'rb') as f:
+                variants[encoding] = f.read()
+            continue
+        variants[encoding] = compress_variant(data, encoding)
+        try:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(variants[encoding])
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not write {path}: {e}", flush=True)
+    return {
+        'content_type': STATIC_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'),
+        'digest': hashlib.sha256(data).hexdigest()[:16],
+        'variants': variants,
+    }
+
+def build_static_assets(src_dir=BASE_DIR, build_dir=STATIC_BUILD_DIR):
+    """Fingerprint and precompress the front-end. Returns {name: asset record}."""
+    try:
+        os.makedirs(build_dir, exist_ok=True)
+    except OSError as e:
+        print(f"⚠️ Static build dir unavailable, serving from memory: {e}", flush=True)
+    assets = {}
+    with open(os.path.join(src_dir, 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+    for name in STATIC_ASSETS:
+        with open(os.path.join(src_dir, name), 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        hashed_name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        assets[hashed_name] = build_static_asset(hashed_name, data, build_dir)
+        html = html.replace(f'"{name}"', f'"/static/{hashed_name}"')
+    assets['index.html'] = build_static_asset('index.html', html.encode('utf-8'), build_dir, reuse=False)
+    return assets
+
+def static_response(asset, cache_control):
+    headers = {'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    # Strong ETag per encoding; any variant of the same content satisfies If-None-Match
+    tags = [asset['digest']] + [f"{asset['digest']}-{encoding}" for encoding in asset['variants'] if encoding != 'identity']
+    if any(request.if_none_match.contains_weak(tag) for tag in tags):
+        return Response(status=304, headers={**headers, 'ETag': f'"{asset["digest"]}"'})
+    variants = asset['variants']
+    encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in variants] + ['identity'],
+                                                   default='identity')
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    headers['ETag'] = f'"{asset["digest"]}"' if encoding == 'identity' else f'"{asset["digest"]}-{encoding}"'
+    return Response(variants[encoding], content_type=asset['content_type'], headers=headers)
+
+static_assets = build_static_assets()
+
+@app.route('/static/<name>')
+def serve_static_asset(name):
+    asset = static_assets.get(name)
+    if asset is None or name == 'index.html':
+        return jsonify({'error': 'Not found'}), 404
+    return static_response(asset, IMMUTABLE_CACHE)
 
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return static_response(static_assets['index.html'], 'no-cache')
+
+def start_worker():
+    """Start this process's background services. Called at import, or from
+    gunicorn's post_fork hook when the app is preloaded in the master."""
+    # Drop state inherited from the master while this is still the only thread
+    db_pool._check_pid()
+    password_hasher.start()
+    email_outbox.start()
+    metrics._check_pid()
 
 # Professional initialization
 init_db()
 print("✅ LoanLink Database Initialized.", flush=True)
+if not PRELOADED:
+    start_worker()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
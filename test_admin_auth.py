@@ -0,0 +1,52 @@
+import socket
+
+import pytest
+
+import server
+
+ADMIN_GETS = ['/api/admin/pool-stats', '/api/admin/session-cache-stats', '/api/admin/slow-queries',
+              '/api/admin/password-hash-stats', '/api/admin/outbox-stats', '/api/admin/mail-stats', '/metrics']
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', 'test-admin-token')
+    return 'test-admin-token'
+
+@pytest.mark.parametrize('path', ADMIN_GETS)
+def test_admin_endpoints_need_the_token(client, register, admin_token, path):
+    _, user_auth = register('user')
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers=user_auth).status_code == 403
+    assert client.get(path, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get(path, headers={'X-Admin-Token': admin_token}).status_code == 200
+    assert client.get(path, headers={'Authorization': f'Bearer {admin_token}'}).status_code == 200
+
+@pytest.mark.parametrize('path', ADMIN_GETS + ['/api/admin/nuke-database'])
+def test_admin_endpoints_are_off_without_a_configured_token(client, monkeypatch, path):
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', None)
+    assert client.get(path).status_code == 404
+    assert client.get(path, headers={'X-Admin-Token': ''}).status_code == 404
+
+def test_slow_query_reset_is_admin_only(client, admin_token, monkeypatch):
+    cleared = []
+    monkeypatch.setattr(server.slow_query_log, 'clear', lambda: cleared.append(1))
+    assert client.delete('/api/admin/slow-queries').status_code == 403
+    assert client.get('/api/admin/nuke-database').status_code == 403
+    assert cleared == []
+    assert client.delete('/api/admin/slow-queries', headers={'X-Admin-Token': admin_token}).status_code == 200
+    assert cleared == [1]
+
+def test_metrics_are_open_on_the_internal_listener(client, admin_token, monkeypatch):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    try:
+        monkeypatch.setattr(server, 'METRICS_PORT', listener.getsockname()[1])
+        internal = client.get('/metrics', environ_base={'gunicorn.socket': listener})
+        assert internal.status_code == 200 and b'loanlink_metrics_workers' in internal.data
+        # Only /metrics: the rest of the admin API still wants the token
+        assert client.get('/api/admin/pool-stats', environ_base={'gunicorn.socket': listener}).status_code == 403
+        # A Host header naming the internal port proves nothing
+        spoofed = f'localhost:{server.METRICS_PORT}'
+        assert client.get('/metrics', headers={'Host': spoofed}).status_code == 403
+    finally:
+        listener.close()
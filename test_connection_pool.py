@@ -0,0 +1,57 @@
+import time
+import threading
+
+import server
+
+def test_threads_racing_after_fork_reset_the_pool_once(tmp_path):
+    pool = server.ConnectionPool(str(tmp_path / 'pool.db'), max_size=4)
+    parent = pool.acquire()
+    pool.release(parent)
+    resets = []
+    reset = pool._reset
+
+    def slow_reset():
+        resets.append(1)
+        time.sleep(0.05)  # widen the window other threads could race into
+        reset()
+
+    pool._reset = slow_reset
+    pool._pid = -1  # as if this process had just been forked
+
+    barrier = threading.Barrier(16)
+    errors = []
+
+    def worker():
+        try:
+            barrier.wait()
+            for _ in range(20):
+                pool.release(pool.acquire())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == [] and resets == [1]
+    assert pool._inherited == [parent]
+    stats = pool.stats()
+    assert stats['in_use'] == 0 and stats['checkouts'] == 320
+    pool.close_all()
+
+def test_connections_checked_out_across_close_all_are_not_reused(tmp_path):
+    pool = server.ConnectionPool(str(tmp_path / 'pool.db'), max_size=4)
+    held = pool.acquire()
+    idle = pool.acquire()
+    pool.release(idle)
+
+    pool.close_all()
+    pool.release(held)
+
+    fresh = pool.acquire()
+    assert fresh is not held and fresh is not idle
+    pool.release(fresh)
+    assert pool.stats()['open'] == 1 and pool.stats()['in_use'] == 0
+    pool.close_all()
@@ -0,0 +1,79 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import server
+
+@pytest.fixture
+def ledger(client, register):
+    """A lender with one paid-into active loan and one pending loan; returns (lender auth, loan ids)"""
+    _, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+    ids = []
+    for amount in (1000, 250):
+        resp = client.post('/api/loans', json={'role': 'lender', 'counterpartyEmail': borrower, 'amount': amount,
+                                               'rate': 0, 'months': 1, 'interestType': 'simple'}, headers=lender_auth)
+        ids.append(resp.json['id'])
+    assert client.post(f'/api/loans/{ids[0]}/accept', headers=borrower_auth).status_code == 200
+    for amount in (100, 200):
+        resp = client.post(f'/api/loans/{ids[0]}/pay', json={'amount': amount, 'method': 'Cash'}, headers=borrower_auth)
+        assert resp.status_code == 200
+    return lender_auth, ids
+
+def test_csv_has_a_row_per_payment(client, ledger):
+    auth, (paid, pending) = ledger
+    resp = client.get('/api/export?format=csv', headers=auth)
+    assert resp.status_code == 200 and resp.is_streamed
+    assert resp.mimetype == 'text/csv'
+    assert 'loanlink-export.csv' in resp.headers['Content-Disposition']
+
+    header, *rows = list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+    assert header == server.EXPORT_LOAN_COLUMNS + server.EXPORT_PAYMENT_COLUMNS
+    rows = [dict(zip(header, row)) for row in rows]
+    assert [(r['id'], r['payment_amount']) for r in rows] == [(str(paid), '100.0'), (str(paid), '200.0'),
+                                                              (str(pending), '')]
+    assert {r['role'] for r in rows} == {'lender'}
+
+def test_ndjson_has_a_line_per_loan(client, ledger):
+    auth, (paid, pending) = ledger
+    resp = client.get('/api/export?format=ndjson', headers=auth)
+    assert resp.mimetype == 'application/x-ndjson'
+    loans = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [loan['id'] for loan in loans] == [paid, pending]
+    assert [p['amount'] for p in loans[0]['payments']] == [100, 200]
+    assert loans[1]['payments'] == [] and loans[1]['status'] == 'pending'
+
+def test_body_is_streamed_in_chunks(client, ledger, monkeypatch):
+    monkeypatch.setattr(server, 'EXPORT_FLUSH_BYTES', 1)
+    auth, _ = ledger
+    resp = client.get('/api/export?format=ndjson', headers=auth)
+    chunks = [chunk for chunk in resp.response if chunk]
+    assert len(chunks) == 2  # one per loan line
+
+@pytest.mark.parametrize('accept, query, compressed', [
+    ('gzip, deflate', '', True),
+    ('*', '', True),
+    ('', '&gzip=1', True),
+    ('gzip;q=0, deflate', '', False),
+    ('identity', '', False),
+    ('', '', False),
+])
+def test_gzip_follows_accept_encoding(client, ledger, accept, query, compressed):
+    auth, _ = ledger
+    plain = client.get('/api/export?format=csv', headers=auth).get_data()
+    resp = client.get(f'/api/export?format=csv{query}', headers={**auth, 'Accept-Encoding': accept})
+    assert resp.headers['Vary'] == 'Accept-Encoding'
+    if compressed:
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(resp.get_data()) == plain
+    else:
+        assert 'Content-Encoding' not in resp.headers
+        assert resp.get_data() == plain
+
+def test_export_needs_a_user_and_a_known_format(client, ledger):
+    auth, _ = ledger
+    assert client.get('/api/export').status_code == 401
+    assert client.get('/api/export?format=xml', headers=auth).status_code == 400
@@ -0,0 +1,120 @@
+import json
+import uuid
+import sqlite3
+
+import server
+
+def offline_email():
+    """A counterparty without an account, so imported loans with them may be active"""
+    return f"offline_{uuid.uuid4().hex[:8]}@example.com"
+
+def run_import(client, auth, records):
+    lines = [r if isinstance(r, str) else json.dumps(r) for r in records]
+    resp = client.post('/api/import', data='\n'.join(lines), headers=auth, content_type='application/x-ndjson')
+    assert resp.status_code == 200
+    return resp.json
+
+def loan_row(loan_id):
+    conn = server.db_pool.acquire()
+    try:
+        return conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
+    finally:
+        server.db_pool.release(conn)
+
+def pending_loan(client, lender_auth, borrower):
+    resp = client.post('/api/loans', json={'role': 'lender', 'counterpartyEmail': borrower, 'amount': 100,
+                                           'rate': 0, 'months': 1, 'interestType': 'simple'}, headers=lender_auth)
+    return resp.json['id']
+
+def test_errors_are_reported_per_row(client, register):
+    _, auth = register('importer')
+    report = run_import(client, auth, [
+        {'type': 'loan', 'counterpartyEmail': offline_email(), 'amount': 100, 'rate': 5, 'months': 2},
+        'not json',
+        {'type': 'refund'},
+        {'type': 'payment', 'loanRef': 'missing', 'amount': 5},
+        {'type': 'loan', 'counterpartyEmail': offline_email(), 'amount': 100, 'rate': 5, 'months': 2},
+    ])
+    assert report['rows'] == 5
+    assert report['imported'] == {'loans': 2, 'payments': 0}
+    assert not report['success'] and report['error_count'] == 3
+    assert [e['row'] for e in report['errors']] == [2, 3, 4]
+    assert 'Unknown record type' in report['errors'][1]['error']
+
+def test_refs_resolve_across_chunks(monkeypatch, client, register):
+    monkeypatch.setattr(server, 'IMPORT_CHUNK_SIZE', 2)
+    _, auth = register('importer')
+    report = run_import(client, auth, [
+        {'type': 'loan', 'ref': 'a', 'counterpartyEmail': offline_email(), 'amount': 100, 'rate': 0, 'months': 1},
+        {'type': 'loan', 'ref': 'b', 'counterpartyEmail': offline_email(), 'amount': 200, 'rate': 0, 'months': 1},
+        # Both loans were flushed with the first chunk
+        {'type': 'payment', 'loanRef': 'a', 'amount': 40},
+        {'type': 'payment', 'loanRef': 'b', 'amount': 50},
+        {'type': 'payment', 'loanRef': 'a', 'amount': 60},
+    ])
+    assert report['success'] and report['imported'] == {'loans': 2, 'payments': 3}
+
+    loans = {l['amount']: l for l in client.get('/api/loans', headers=auth).json}
+    assert loans[100]['paid_amount'] == 100 and loans[100]['status'] == 'completed'
+    assert loans[200]['paid_amount'] == 50 and loans[200]['status'] == 'active'
+    assert len(loans[100]['history']) == 2
+
+def test_payments_only_go_into_own_active_loans(client, register):
+    _, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+    _, stranger_auth = register('stranger')
+    rejected = pending_loan(client, lender_auth, borrower)
+    assert client.post(f'/api/loans/{rejected}/reject', headers=borrower_auth).status_code == 200
+    pending = pending_loan(client, lender_auth, borrower)
+    active = pending_loan(client, lender_auth, borrower)
+    assert client.post(f'/api/loans/{active}/accept', headers=borrower_auth).status_code == 200
+
+    report = run_import(client, lender_auth, [
+        {'type': 'payment', 'loanId': rejected, 'amount': 50},
+        {'type': 'payment', 'loanId': pending, 'amount': 50},
+        {'type': 'payment', 'loanId': active, 'amount': 30},
+    ])
+    assert report['imported']['payments'] == 1
+    assert [e['row'] for e in report['errors']] == [1, 2]
+    assert 'not active' in report['errors'][0]['error']
+    assert loan_row(rejected)['paid_amount'] in (None, 0)
+    assert loan_row(pending)['paid_amount'] in (None, 0)
+    assert loan_row(active)['paid_amount'] == 30
+
+    report = run_import(client, stranger_auth, [{'type': 'payment', 'loanId': active, 'amount': 30}])
+    assert report['errors'] == [{'row': 1, 'error': f'Loan {active} not found'}]
+    assert loan_row(active)['paid_amount'] == 30
+
+def test_loans_with_account_holders_need_their_accept(client, register):
+    _, auth = register('importer')
+    borrower, _ = register('borrower')
+    report = run_import(client, auth, [
+        {'type': 'loan', 'ref': 'p', 'counterpartyEmail': borrower, 'amount': 100, 'rate': 0, 'months': 1},
+        {'type': 'loan', 'counterpartyEmail': borrower, 'status': 'active', 'amount': 100, 'rate': 0, 'months': 1},
+        {'type': 'payment', 'loanRef': 'p', 'amount': 10},
+    ])
+    assert report['imported'] == {'loans': 1, 'payments': 0}
+    assert [e['row'] for e in report['errors']] == [2, 3]
+    assert [l['status'] for l in client.get('/api/loans', headers=auth).json] == ['pending']
+
+def test_failed_chunk_is_reported_and_earlier_chunks_kept(monkeypatch, client, register):
+    monkeypatch.setattr(server, 'IMPORT_CHUNK_SIZE', 2)
+    write_chunk = server.LoanImport._write_chunk
+    calls = []
+
+    def fail_second_chunk(self, conn):
+        calls.append(1)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError('disk I/O error')
+        return write_chunk(self, conn)
+
+    monkeypatch.setattr(server.LoanImport, '_write_chunk', fail_second_chunk)
+    _, auth = register('importer')
+    loan = lambda ref: {'type': 'loan', 'ref': ref, 'counterpartyEmail': offline_email(), 'amount': 100,
+                        'rate': 0, 'months': 1}
+    report = run_import(client, auth, [loan('a'), loan('b'), loan('c'), loan('d'), loan('e'),
+                                       {'type': 'payment', 'loanRef': 'c', 'amount': 10}])
+    assert report['imported'] == {'loans': 3, 'payments': 0}
+    assert report['errors'][0] == {'row': 3, 'error': 'Rows 3-4 were not imported: disk I/O error'}
+    assert report['errors'][1] == {'row': 6, 'error': 'Loan c was not imported'}
+    assert len(client.get('/api/loans', headers=auth).json) == 3
@@ -0,0 +1,76 @@
+import uuid
+
+import pytest
+
+@pytest.fixture
+def seller(client, register):
+    """(auth headers, tag): listings posted with `tag` in them match only this test's searches"""
+    _, auth = register('seller')
+    return auth, uuid.uuid4().hex[:10]
+
+def post_listing(client, auth, item_name, **fields):
+    resp = client.post('/api/listings', json={'itemName': item_name, **fields}, headers=auth)
+    assert resp.status_code == 200
+
+def search(client, **args):
+    resp = client.get('/api/listings/search', query_string=args)
+    assert resp.status_code == 200
+    return resp.json
+
+def names(page):
+    return [item['item_name'] for item in page['items']]
+
+def test_every_word_matches_as_a_prefix(client, seller):
+    auth, tag = seller
+    post_listing(client, auth, f'Cordless drill {tag}', description='18V with two batteries', location='Leeds')
+    post_listing(client, auth, f'Ladder {tag}', description='Aluminium, fits a drill holster', location='York')
+    post_listing(client, auth, f'Tent {tag}', description='Sleeps four', location='Leeds')
+
+    assert sorted(names(search(client, q=tag))) == sorted([f'Cordless drill {tag}', f'Ladder {tag}', f'Tent {tag}'])
+    assert names(search(client, q=f'{tag} leeds dri')) == [f'Cordless drill {tag}']
+    # A name match outranks the same word in a description
+    assert names(search(client, q=f'{tag} drill')) == [f'Cordless drill {tag}', f'Ladder {tag}']
+    assert names(search(client, q=f'{tag} kayak')) == []
+
+def test_operators_in_the_query_are_searched_literally(client, seller):
+    auth, tag = seller
+    post_listing(client, auth, f'Drill {tag}')
+    assert names(search(client, q=f'{tag} OR kayak')) == []
+    assert names(search(client, q=f'{tag}" NOT drill (')) == []
+    assert names(search(client, q=f'"{tag}" drill*')) == [f'Drill {tag}']
+
+def test_filters_combine_with_the_match(client, seller):
+    auth, tag = seller
+    post_listing(client, auth, f'Cheap drill {tag}', charge=5, deposit=20, tenure=3)
+    post_listing(client, auth, f'Pro drill {tag}', charge=25, deposit=100, tenure=14)
+
+    assert names(search(client, q=tag, max_charge=10)) == [f'Cheap drill {tag}']
+    assert names(search(client, q=tag, min_deposit=50, min_tenure=7)) == [f'Pro drill {tag}']
+    assert client.get('/api/listings/search', query_string={'q': tag, 'min_charge': 'lots'}).status_code == 400
+
+def test_ranked_pages_visit_every_match_once(client, seller):
+    auth, tag = seller
+    # Different lengths give different BM25 ranks; the duplicates tie on rank and are ordered by id
+    for i in range(7):
+        post_listing(client, auth, f'Lamp {tag}', description='bright ' * (i % 3))
+
+    seen, cursor = [], None
+    while True:
+        page = search(client, q=tag, limit=3, **({'cursor': cursor} if cursor else {}))
+        assert len(page['items']) <= 3 and all('rank' not in item for item in page['items'])
+        seen.extend(item['id'] for item in page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    everything = search(client, q=tag, limit=50)
+    assert seen == [item['id'] for item in everything['items']]
+    assert len(set(seen)) == 7 and everything['next_cursor'] is None
+
+def test_without_q_pages_newest_first(client, seller):
+    auth, tag = seller
+    for i in range(3):
+        post_listing(client, auth, f'Item {i} {tag}', charge=1000 + i)
+    first = search(client, min_charge=1000, max_charge=1002, limit=2)
+    assert names(first) == [f'Item 2 {tag}', f'Item 1 {tag}']
+    rest = search(client, min_charge=1000, max_charge=1002, limit=2, cursor=first['next_cursor'])
+    assert names(rest) == [f'Item 0 {tag}'] and rest['next_cursor'] is None
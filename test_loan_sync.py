@@ -0,0 +1,61 @@
+import server
+
+def propose(client, auth, borrower):
+    resp = client.post('/api/loans', json={'role': 'lender', 'counterpartyEmail': borrower, 'amount': 100,
+                                           'rate': 0, 'months': 1, 'interestType': 'simple'}, headers=auth)
+    return resp.json['id']
+
+def execute(sql, params=()):
+    conn = server.db_pool.acquire()
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        server.db_pool.release(conn)
+
+def test_delta_sync_revalidates_with_the_last_etag(client, register):
+    _, auth = register('lender')
+    borrower, _ = register('borrower')
+    kept = propose(client, auth, borrower)
+
+    first = client.get('/api/loans?since=0', headers=auth)
+    assert first.json['full'] and [l['id'] for l in first.json['loans']] == [kept]
+    etag, since = first.headers['ETag'], first.json['version']
+
+    unchanged = client.get(f'/api/loans?since={since}', headers={**auth, 'If-None-Match': etag})
+    assert unchanged.status_code == 304 and unchanged.data == b''
+    # Another tag for the same user never matches by accident
+    assert client.get(f'/api/loans?since={since}', headers={**auth, 'If-None-Match': etag + 'x'}).status_code == 200
+
+    dropped = propose(client, auth, borrower)
+    assert client.delete(f'/api/loans/{dropped}', headers=auth).status_code == 200
+    delta = client.get(f'/api/loans?since={since}', headers={**auth, 'If-None-Match': etag})
+    assert delta.status_code == 200 and delta.headers['ETag'] != etag
+    assert not delta.json['full'] and delta.json['deleted'] == [dropped]
+
+def test_old_tombstones_are_pruned_and_stale_clients_resync(client, register):
+    _, auth = register('lender')
+    borrower, _ = register('borrower')
+    kept = propose(client, auth, borrower)
+    since = client.get('/api/loans?since=0', headers=auth).json['version']
+
+    old = propose(client, auth, borrower)
+    assert client.delete(f'/api/loans/{old}', headers=auth).status_code == 200
+    # Age the tombstone past retention; the next delete prunes it
+    execute('UPDATE sync_tombstones SET created_at = 0 WHERE entity_id = ?', (old,))
+    recent = propose(client, auth, borrower)
+    assert client.delete(f'/api/loans/{recent}', headers=auth).status_code == 200
+
+    conn = server.db_pool.acquire()
+    try:
+        tombstones = {row[0] for row in conn.execute('SELECT entity_id FROM sync_tombstones WHERE entity_id IN (?, ?)',
+                                                     (old, recent))}
+    finally:
+        server.db_pool.release(conn)
+    assert tombstones == {recent}
+
+    # This client may have missed the pruned deletion, so it gets everything instead
+    resync = client.get(f'/api/loans?since={since}', headers=auth).json
+    assert resync['full'] and [l['id'] for l in resync['loans']] == [kept]
+    delta = client.get(f"/api/loans?since={resync['version']}", headers=auth).json
+    assert not delta['full'] and delta['loans'] == [] and delta['deleted'] == []
@@ -0,0 +1,22 @@
+import server
+
+def login(client, email, password):
+    return client.post('/api/login', json={'email': email, 'password': password})
+
+def test_unknown_emails_cost_a_password_check(client, register, capsys):
+    email, _ = register('user')
+    before = server.password_hasher.stats()['completed']
+    assert login(client, email, 'wrong password').status_code == 401
+    assert server.password_hasher.stats()['completed'] == before + 1
+
+    stranger = 'nobody_here@example.com'
+    assert login(client, stranger, 'wrong password').status_code == 401
+    assert server.password_hasher.stats()['completed'] == before + 2
+    # ...and nothing in the logs says which of the two failures was which
+    out = capsys.readouterr().out
+    assert email not in out and stranger not in out
+
+def test_the_dummy_hash_never_matches(client):
+    assert server.DUMMY_PASSWORD_HASH.startswith(('scrypt$', 'pbkdf2_sha256$'))
+    assert login(client, 'nobody_here@example.com', '').status_code == 401
+    assert login(client, 'nobody_here@example.com', 'password123').status_code == 401
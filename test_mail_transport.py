@@ -0,0 +1,109 @@
+import socket
+import smtplib
+from email.mime.text import MIMEText
+
+import pytest
+from aiosmtpd.controller import Controller  # requirements-dev.txt
+
+import server
+
+class RecordingHandler:
+    """Local SMTP stand-in that counts sessions and keeps delivered messages."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.messages = []
+
+    async def handle_EHLO(self, smtp, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, smtp, session, envelope):
+        self.messages.append(envelope)
+        return '250 OK'
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+def make_pool(controller, **kwargs):
+    return server.SMTPTransportPool(controller.hostname, controller.port, security='plain', **kwargs)
+
+def message(n):
+    msg = MIMEText(f"body {n}")
+    msg['Subject'] = f"Message {n}"
+    msg['From'] = 'loanlink@example.com'
+    msg['To'] = f"user{n}@example.com"
+    return msg
+
+def test_reuses_session_for_many_messages(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller, size=2)
+    for n in range(20):
+        pool.send(message(n))
+    pool.close_all()
+
+    assert len(handler.messages) == 20
+    assert pool.stats()['connects'] == 1
+    assert handler.sessions == 1
+
+def test_rotates_session_after_max_messages(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller, max_messages=5)
+    for n in range(12):
+        pool.send(message(n))
+    pool.close_all()
+
+    assert len(handler.messages) == 12
+    assert pool.stats()['connects'] == 3
+
+def test_reconnects_after_server_drops_session(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller)
+    pool.send(message(1))
+
+    # Simulate the server hanging up on the idle session
+    session = pool._idle.get_nowait()
+    session['server'].sock.shutdown(socket.SHUT_RDWR)
+    pool._idle.put(session)
+
+    pool.send(message(2))
+    pool.close_all()
+
+    assert [m.rcpt_tos for m in handler.messages] == [['user1@example.com'], ['user2@example.com']]
+    assert pool.stats()['reconnects'] == 1
+
+def test_send_email_uses_pool(smtp_server, monkeypatch):
+    controller, handler = smtp_server
+    pool = make_pool(controller)
+    monkeypatch.setattr(server, 'smtp_pool', pool)
+    monkeypatch.setattr(server, 'SENDER_PASSWORD', 'configured')
+    monkeypatch.setattr(server, 'RESEND_API_KEY', '')
+
+    for n in range(3):
+        ok, msg = server.send_email(f"user{n}@example.com", "Hello", "<p>Hi</p>", "Hi")
+        assert ok, msg
+    pool.close_all()
+
+    assert len(handler.messages) == 3
+    assert handler.sessions == 1
+
+def test_starttls_never_logs_in_without_tls(smtp_server):
+    controller, handler = smtp_server
+    # The local server doesn't offer STARTTLS, so the password must not be sent
+    pool = server.SMTPTransportPool(controller.hostname, controller.port, 'loanlink@example.com', 'secret',
+                                    security='starttls')
+    with pytest.raises(smtplib.SMTPNotSupportedError):
+        pool.send(message(1))
+    assert handler.messages == []
+    assert pool.stats()['connects'] == 0
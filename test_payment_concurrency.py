@@ -0,0 +1,98 @@
+import json
+import time
+import threading
+
+import server
+
+THREADS = 16
+PAYMENTS_PER_THREAD = 25
+
+def active_loan(client, register, amount):
+    """An accepted zero-interest loan; returns (loan_id, borrower auth headers)"""
+    _, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+    resp = client.post('/api/loans', json={'role': 'lender', 'counterpartyEmail': borrower, 'amount': amount,
+                                           'rate': 0, 'months': 1, 'interestType': 'simple'}, headers=lender_auth)
+    loan_id = resp.json['id']
+    assert client.post(f'/api/loans/{loan_id}/accept', headers=borrower_auth).status_code == 200
+    return loan_id, borrower_auth
+
+def loan_row(loan_id):
+    conn = server.db_pool.acquire()
+    try:
+        loan = conn.execute('SELECT * FROM loans WHERE id = ?', (loan_id,)).fetchone()
+        payments = conn.execute('SELECT COUNT(*), SUM(amount) FROM payments WHERE loan_id = ?', (loan_id,)).fetchone()
+        return loan, payments[0], payments[1] or 0
+    finally:
+        server.db_pool.release(conn)
+
+def pay_concurrently(loan_id, auth, threads, payments_per_thread, amount):
+    statuses = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker():
+        client = server.app.test_client()
+        start.wait()
+        for _ in range(payments_per_thread):
+            resp = client.post(f'/api/loans/{loan_id}/pay', json={'amount': amount, 'method': 'Cash'}, headers=auth)
+            with lock:
+                statuses.append(resp.status_code)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return statuses, time.perf_counter() - t0
+
+def test_concurrent_payments_are_not_lost(client, register):
+    total = THREADS * PAYMENTS_PER_THREAD
+    loan_id, auth = active_loan(client, register, 10 * total)
+
+    statuses, elapsed = pay_concurrently(loan_id, auth, THREADS, PAYMENTS_PER_THREAD, 1.0)
+
+    assert statuses == [200] * total
+    loan, count, paid = loan_row(loan_id)
+    assert loan['paid_amount'] == total == paid
+    assert count == total
+    assert loan['version'] == total + 1  # accept + one bump per payment
+    print(f"{total / elapsed:.0f} payments/s across {THREADS} threads")
+    # Short transactions: nobody should be stuck behind the busy timeout
+    assert elapsed < 30
+
+def test_completing_payment_closes_the_loan_for_the_rest(client, register):
+    loan_id, auth = active_loan(client, register, 100)
+
+    statuses, _ = pay_concurrently(loan_id, auth, 8, 1, 20.0)
+
+    assert sorted(statuses) == [200] * 5 + [409] * 3
+    loan, count, paid = loan_row(loan_id)
+    assert loan['status'] == 'completed'
+    assert loan['paid_amount'] == 100 == paid
+    assert count == 5
+
+def test_stale_version_is_rejected(client, register):
+    loan_id, auth = active_loan(client, register, 100)
+    version = loan_row(loan_id)[0]['version']
+
+    first = client.post(f'/api/loans/{loan_id}/pay', json={'amount': 10, 'version': version}, headers=auth)
+    assert first.status_code == 200 and first.json['version'] == version + 1
+
+    stale = client.post(f'/api/loans/{loan_id}/pay', json={'amount': 10, 'version': version}, headers=auth)
+    assert stale.status_code == 409
+    assert stale.json['version'] == version + 1
+    assert loan_row(loan_id)[0]['paid_amount'] == 10
+
+def test_non_finite_amounts_are_rejected(client, register):
+    loan_id, auth = active_loan(client, register, 100)
+
+    for amount in ('inf', '-inf', 'nan', 'Infinity'):
+        resp = client.post(f'/api/loans/{loan_id}/pay', json={'amount': amount}, headers=auth)
+        assert resp.status_code == 400
+        resp = client.post('/api/import', data=json.dumps({'type': 'payment', 'loanId': loan_id, 'amount': amount}),
+                           headers=auth, content_type='application/x-ndjson')
+        assert resp.json['errors'] == [{'row': 1, 'error': 'amount must be a number'}]
+    loan, count, _ = loan_row(loan_id)
+    assert loan['status'] == 'active' and loan['paid_amount'] == 0 and count == 0
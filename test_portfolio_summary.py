@@ -0,0 +1,112 @@
+import pytest
+
+import server
+
+def query(sql, params=()):
+    conn = server.db_pool.acquire()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        server.db_pool.release(conn)
+
+def stored_summary(email):
+    return {(row['role'], row['status']): (row['loan_count'], pytest.approx(row['outstanding']),
+                                           pytest.approx(row['next_due']))
+            for row in query('SELECT * FROM portfolio_summary WHERE email = ? AND loan_count != 0', (email,))}
+
+def recomputed_summary(email):
+    """The same per-(role, status) totals, straight from the loans table"""
+    summary = {}
+    for loan in query('SELECT * FROM loans WHERE lender_email = ? OR borrower_email = ?', (email, email)):
+        role = 'lender' if loan['lender_email'] == email else 'borrower'
+        outstanding = max((loan['total_repayment'] or 0) - (loan['paid_amount'] or 0), 0)
+        next_due = min(loan['monthly_payment'] or 0, outstanding)
+        count, total, due = summary.get((role, loan['status']), (0, 0.0, 0.0))
+        summary[(role, loan['status'])] = (count + 1, total + outstanding, due + next_due)
+    return summary
+
+def assert_consistent(*emails):
+    for email in emails:
+        assert stored_summary(email) == recomputed_summary(email)
+
+def propose(client, auth, borrower, amount=1000):
+    resp = client.post('/api/loans', json={'role': 'lender', 'counterpartyEmail': borrower, 'amount': amount,
+                                           'rate': 0, 'months': 4, 'interestType': 'simple'}, headers=auth)
+    assert resp.status_code == 200
+    return resp.json['id']
+
+def pay(client, loan_id, auth, amount):
+    resp = client.post(f'/api/loans/{loan_id}/pay', json={'amount': amount, 'method': 'Cash'}, headers=auth)
+    assert resp.status_code == 200
+
+def test_summary_follows_the_loan_lifecycle(client, register):
+    lender, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+
+    paid_off = propose(client, lender_auth, borrower)
+    declined = propose(client, lender_auth, borrower, amount=400)
+    assert_consistent(lender, borrower)
+    assert stored_summary(lender)[('lender', 'pending')][0] == 2
+
+    assert client.post(f'/api/loans/{paid_off}/accept', headers=borrower_auth).status_code == 200
+    assert_consistent(lender, borrower)
+
+    pay(client, paid_off, borrower_auth, 100)
+    assert_consistent(lender, borrower)
+    assert stored_summary(borrower)[('borrower', 'active')] == (1, pytest.approx(900), pytest.approx(250))
+
+    # Less than one installment left: next_due is capped at what is owed
+    pay(client, paid_off, borrower_auth, 800)
+    assert_consistent(lender, borrower)
+    assert stored_summary(borrower)[('borrower', 'active')] == (1, pytest.approx(100), pytest.approx(100))
+    summary = client.get('/api/portfolio/summary', headers=borrower_auth).json
+    assert summary['total_owed'] == 100 and summary['next_due_owed'] == 100
+
+    pay(client, paid_off, borrower_auth, 100)
+    assert_consistent(lender, borrower)
+    assert ('borrower', 'active') not in stored_summary(borrower)
+    assert stored_summary(borrower)[('borrower', 'completed')][0] == 1
+
+    assert client.post(f'/api/loans/{declined}/reject', headers=borrower_auth).status_code == 200
+    assert_consistent(lender, borrower)
+    assert stored_summary(lender)[('lender', 'rejected')] == (1, pytest.approx(400), pytest.approx(100))
+
+    assert client.delete(f'/api/loans/{declined}', headers=lender_auth).status_code == 200
+    assert_consistent(lender, borrower)
+    summary = client.get('/api/portfolio/summary', headers=lender_auth).json
+    assert summary['counts'] == {'completed': 1} and summary['total_lent'] == 0
+
+def test_summary_matches_a_full_rebuild(client, register):
+    _, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+    loan_id = propose(client, lender_auth, borrower)
+    client.post(f'/api/loans/{loan_id}/accept', headers=borrower_auth)
+    pay(client, loan_id, borrower_auth, 300)
+
+    before = query('SELECT * FROM portfolio_summary WHERE loan_count != 0 ORDER BY email, role, status')
+    conn = server.db_pool.acquire()
+    try:
+        server.rebuild_portfolio_summary(conn)
+        after = conn.execute('SELECT * FROM portfolio_summary WHERE loan_count != 0 ORDER BY email, role, status').fetchall()
+        conn.rollback()
+    finally:
+        server.db_pool.release(conn)
+    assert [tuple(row)[:4] for row in before] == [tuple(row)[:4] for row in after]
+    assert [row['outstanding'] for row in before] == pytest.approx([row['outstanding'] for row in after])
+    assert [row['next_due'] for row in before] == pytest.approx([row['next_due'] for row in after])
+
+def test_only_participants_reject_pending_proposals(client, register):
+    lender, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+    _, stranger_auth = register('stranger')
+    pending = propose(client, lender_auth, borrower)
+    active = propose(client, lender_auth, borrower)
+    client.post(f'/api/loans/{active}/accept', headers=borrower_auth)
+    before = stored_summary(lender), stored_summary(borrower)
+
+    assert client.post(f'/api/loans/{pending}/reject', headers=stranger_auth).status_code == 403
+    assert client.post('/api/loans/999999999/reject', headers=stranger_auth).status_code == 404
+    assert client.post(f'/api/loans/{active}/reject', headers=borrower_auth).status_code == 409
+    assert (stored_summary(lender), stored_summary(borrower)) == before
+    assert [row['status'] for row in query('SELECT status FROM loans WHERE id IN (?, ?) ORDER BY id',
+                                           (pending, active))] == ['pending', 'active']
@@ -0,0 +1,136 @@
+import io
+import json
+import smtplib
+
+import pytest
+
+import server
+
+# Statements that are allowed to read a whole table on purpose
+ALLOWED_SCANS = [
+    "SELECT email FROM users",  # /api/debug-users
+    "SELECT MAX(COALESCE((SELECT MAX(id) FROM loans)",  # /api/import id block; sqlite_sequence has a row per table
+    "SELECT k, v FROM 'main'.'listings_fts_config'",  # FTS5 reading its own few-row settings table
+]
+
+def exercise_app(client, register):
+    """Drive every endpoint that touches the database at least once."""
+    lender, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+
+    lender_auth = {'Authorization': f"Bearer {client.post('/api/login', json={'email': lender, 'password': 'password123'}).json['token']}"}
+    client.get('/api/profile', headers=lender_auth)
+    client.put('/api/profile', json={'name': 'Lender', 'alias': 'L'}, headers=lender_auth)
+    client.post('/api/change-password', json={'old_password': 'password123', 'new_password': 'password123'}, headers=lender_auth)
+    client.post('/api/forgot-password', json={'email': borrower})
+    token = server.get_db_connection().execute('SELECT token FROM reset_tokens WHERE email = ?', (borrower,)).fetchone()
+    client.post('/api/reset-password', json={'token': token['token'] if token else 'missing', 'password': 'password123'})
+
+    loan = {'role': 'lender', 'counterpartyEmail': borrower, 'amount': 1000, 'rate': 5, 'months': 12,
+            'interestType': 'simple', 'monthly': 87.5, 'total': 1050}
+    client.post('/api/loans', json=loan, headers=lender_auth)
+    client.post('/api/loans', json=loan, headers=lender_auth)
+    loans = client.get('/api/loans', headers=lender_auth).json
+    first, second = loans[0]['id'], loans[1]['id']
+
+    client.put(f'/api/loans/{first}', json={**loan, 'amount': 900}, headers=lender_auth)
+    client.post(f'/api/loans/{first}/accept', headers=borrower_auth)
+    client.post('/api/schedules', json={'loans': [loan], 'loanIds': [first, second]}, headers=lender_auth)
+    records = [{'type': 'loan', 'ref': 'r1', 'counterpartyEmail': 'offline@example.com', 'amount': 100, 'rate': 5, 'months': 2},
+               {'type': 'payment', 'loanRef': 'r1', 'amount': 10},
+               {'type': 'payment', 'loanId': first, 'amount': 1}]
+    client.post('/api/import', data='\n'.join(json.dumps(r) for r in records), headers=lender_auth,
+                content_type='application/x-ndjson')
+    client.post(f'/api/loans/{first}/pay', json={'amount': 100, 'method': 'Cash'}, headers=borrower_auth)
+    client.post(f'/api/loans/{first}/pay', data={'amount': '50', 'method': 'Card',
+                                                 'proof': (io.BytesIO(b'\x89PNG\r\n\x1a\nproof'), 'proof.png')},
+                headers=borrower_auth, content_type='multipart/form-data')
+    client.get('/api/loans', headers=borrower_auth)
+    client.get('/api/portfolio/summary', headers=borrower_auth)
+    proof = next(p['proof_image'] for l in client.get('/api/loans', headers=lender_auth).json
+                 for p in l['history'] if p['proof_image'])
+    client.get(proof.split('?')[0], headers=lender_auth)
+    page = client.get('/api/loans?limit=1', headers=lender_auth).json
+    client.get(f"/api/loans?limit=1&cursor={page['next_cursor']}", headers=lender_auth)
+    client.get('/api/loans?limit=5&status=active&role=lender&asset_type=currency', headers=lender_auth)
+    client.get('/api/loans?limit=5&status=pending', headers=borrower_auth)
+    client.get('/api/loans?since=0', headers=lender_auth)
+    client.get('/api/loans', headers={**lender_auth, 'If-None-Match': 'W/"0-stale"'})
+    client.get('/api/export?format=csv', headers=lender_auth).get_data()
+    client.get('/api/export?format=ndjson', headers={**borrower_auth, 'Accept-Encoding': 'gzip'}).get_data()
+    client.post(f'/api/loans/{second}/reject', headers=borrower_auth)
+    client.delete(f'/api/loans/{second}', headers=lender_auth)
+
+    client.post('/api/listings', json={'itemName': 'Drill', 'charge': 5, 'deposit': 20, 'location': 'Town', 'tenure': 7,
+                                       'latitude': 51.5, 'longitude': -0.12}, headers=lender_auth)
+    listings = client.get('/api/listings').json
+    found = client.get('/api/listings/search?q=dri&max_charge=10&limit=1').json
+    client.get(f"/api/listings/search?q=dri&limit=1&cursor={found['next_cursor'] or ''}")
+    client.get('/api/listings/search?min_tenure=1&max_deposit=50')
+    client.get('/api/listings/nearby?lat=51.5&lon=-0.1&radius_km=5')
+    client.get(f"/api/listings?limit=1&cursor={client.get('/api/listings?limit=1').json['next_cursor'] or ''}")
+    client.delete(f"/api/listings/{listings[0]['id']}", headers=lender_auth)
+    client.get('/api/debug-users')
+
+@pytest.fixture(scope='module')
+def production_statements(monkeypatch_module, register):
+    statements = []
+    server.db_pool.close_all()
+    original_connect = server.db_pool._connect
+
+    def traced_connect():
+        conn = original_connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch_module.setattr(server.db_pool, '_connect', traced_connect)
+    with server.app.test_request_context():
+        exercise_app(server.app.test_client(), register)
+
+    server.db_pool.close_all()
+    return [s for s in statements if s.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+
+@pytest.fixture(scope='module')
+def monkeypatch_module():
+    mp = pytest.MonkeyPatch()
+    # Never reach a real mail server from the test suite
+    mp.setattr(smtplib, 'SMTP_SSL', lambda *a, **kw: (_ for _ in ()).throw(OSError('mail disabled in tests')))
+    yield mp
+    mp.undo()
+
+def query_plan(sql):
+    conn = server.db_pool.acquire()
+    try:
+        return [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+    finally:
+        server.db_pool.release(conn)
+
+def test_every_endpoint_issued_queries(production_statements):
+    joined = '\n'.join(production_statements)
+    for fragment in ['FROM users WHERE token', 'FROM loans', 'FROM payments', 'FROM listings', 'FROM reset_tokens']:
+        assert fragment in joined
+
+def test_no_full_table_scans(production_statements):
+    offenders = []
+    for sql in set(production_statements):
+        if any(sql.strip().startswith(allowed) for allowed in ALLOWED_SCANS):
+            continue
+        # Scanning a LIMITed subquery's result or a constant row is fine; scanning a table isn't.
+        # A virtual table "scan" with constraints (e.g. an FTS MATCH) is an index lookup.
+        scans = [step for step in query_plan(sql)
+                 if step.startswith('SCAN') and not step.startswith(('SCAN (subquery', 'SCAN CONSTANT ROW'))
+                 and not ('VIRTUAL TABLE INDEX' in step and not step.endswith(':'))]
+        if scans:
+            offenders.append(f"{' '.join(sql.split())}\n    -> {scans}")
+    assert not offenders, "Full scans in production queries:\n" + '\n'.join(offenders)
+
+@pytest.mark.parametrize('sql, index', [
+    ("SELECT * FROM users WHERE token = 'x'", 'idx_users_token'),
+    ("SELECT * FROM users WHERE email = 'x' COLLATE NOCASE", 'idx_users_email_nocase'),
+    ("SELECT * FROM loans WHERE lender_email = 'x' OR borrower_email = 'x' ORDER BY created_at DESC", 'idx_loans_lender'),
+    ("SELECT * FROM loans WHERE lender_email = 'x' OR borrower_email = 'x' ORDER BY created_at DESC", 'idx_loans_borrower'),
+    ("SELECT * FROM payments WHERE loan_id = 1 ORDER BY date", 'idx_payments_loan'),
+    ("SELECT * FROM listings WHERE status = 'active' ORDER BY created_at DESC", 'idx_listings_status_created'),
+])
+def test_hot_lookups_use_index(sql, index):
+    assert any(index in step for step in query_plan(sql))
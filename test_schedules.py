@@ -0,0 +1,135 @@
+import math
+
+import pytest
+
+import server
+
+FREQUENCIES = ['Monthly', 'Bi-Weekly', 'Weekly', 'Daily']
+
+def preview(amount, rate, episodes, interest_type, frequency):
+    """(installment, total) exactly as app.js updatePreview computes them"""
+    if frequency == 'One Time':
+        years = episodes / 365
+        if interest_type == 'simple':
+            total = amount + amount * (rate / 100) * years
+        else:
+            total = amount * math.exp(rate / 100 * years)
+        return total, total
+    periods_per_year = {'Monthly': 12, 'Weekly': 52, 'Bi-Weekly': 26, 'Daily': 365}[frequency]
+    if interest_type == 'simple':
+        total = amount + amount * (rate / 100) * (episodes / periods_per_year)
+        return total / episodes, total
+    i = rate / 100 / periods_per_year
+    if i == 0:
+        return amount / episodes, amount
+    installment = amount * (i * (1 + i) ** episodes) / ((1 + i) ** episodes - 1)
+    return installment, installment * episodes
+
+def schedule(amount=1200, rate=12, periods=12, interest_type='simple', frequency='Monthly',
+             loan_date='2024-01-15', repayment_start_date=None):
+    terms = server.schedule_terms(amount, rate, periods, interest_type, frequency, loan_date, repayment_start_date)
+    [result] = server.compute_schedules([terms])
+    return result
+
+@pytest.mark.parametrize('frequency', FREQUENCIES + ['One Time'])
+@pytest.mark.parametrize('interest_type', server.INTEREST_TYPES)
+@pytest.mark.parametrize('rate', [0, 7.5, 36])
+def test_totals_match_the_app_preview(frequency, interest_type, rate):
+    installment, total = preview(2500, rate, 18, interest_type, frequency)
+    result = schedule(2500, rate, 18, interest_type, frequency)
+    assert result['installment'] == pytest.approx(installment, abs=0.01)
+    assert result['total'] == pytest.approx(total, abs=0.01)
+    assert result['interest'] == pytest.approx(total - 2500, abs=0.01)
+
+@pytest.mark.parametrize('frequency', FREQUENCIES)
+@pytest.mark.parametrize('interest_type', server.INTEREST_TYPES)
+def test_schedule_pays_off_the_principal(frequency, interest_type):
+    result = schedule(1000, 9, 10, interest_type, frequency)
+    rows = result['schedule']
+    assert result['periods'] == 10 and len(rows['due_date']) == 10
+    assert sum(rows['principal']) == pytest.approx(1000, abs=0.05)
+    assert sum(rows['payment']) == pytest.approx(result['total'], abs=0.05)
+    assert rows['balance'][-1] == 0
+    assert rows['balance'] == sorted(rows['balance'], reverse=True)
+
+def test_amortized_interest_is_charged_on_the_remaining_balance():
+    rows = schedule(1000, 12, 6, 'compound')['schedule']
+    balance = 1000
+    for interest, principal in zip(rows['interest'], rows['principal']):
+        assert interest == pytest.approx(balance * 0.01, abs=0.01)
+        balance -= principal
+
+def test_simple_interest_is_spread_evenly():
+    rows = schedule(1200, 10, 12, 'simple')['schedule']
+    assert set(rows['interest']) == {10.0}
+    assert set(rows['principal']) == {100.0}
+
+@pytest.mark.parametrize('frequency, first_due', [
+    ('Monthly', '2024-02-15'), ('Bi-Weekly', '2024-01-29'), ('Weekly', '2024-01-22'), ('Daily', '2024-01-16'),
+])
+def test_first_payment_is_one_period_after_the_loan_date(frequency, first_due):
+    dates = schedule(frequency=frequency, loan_date='2024-01-15', periods=3)['schedule']['due_date']
+    assert dates[0] == first_due
+
+def test_given_first_due_date_is_period_one():
+    weekly = schedule(frequency='Weekly', periods=3, repayment_start_date='2024-03-10')['schedule']['due_date']
+    assert weekly == ['2024-03-10', '2024-03-17', '2024-03-24']
+    monthly = schedule(periods=3, repayment_start_date='2024-03-10')['schedule']['due_date']
+    assert monthly == ['2024-03-10', '2024-04-10', '2024-05-10']
+
+def test_monthly_dates_clamp_to_the_end_of_short_months():
+    dates = schedule(periods=4, loan_date='2024-01-31')['schedule']['due_date']
+    assert dates == ['2024-02-29', '2024-03-31', '2024-04-30', '2024-05-31']
+    dates = schedule(periods=3, repayment_start_date='2023-01-31')['schedule']['due_date']
+    assert dates == ['2023-01-31', '2023-02-28', '2023-03-31']
+
+def test_one_time_loan_is_a_single_payment_after_its_days():
+    result = schedule(500, 10, 30, 'simple', 'One Time', loan_date='2024-01-15')
+    assert result['periods'] == 1
+    assert result['schedule']['due_date'] == ['2024-02-14']
+    assert result['schedule']['payment'] == [result['total']]
+    assert result['schedule']['balance'] == [0]
+    given = schedule(500, 10, 30, 'simple', 'One Time', loan_date='2024-01-15', repayment_start_date='2024-03-01')
+    assert given['schedule']['due_date'] == ['2024-03-01']
+
+def test_batches_mix_terms_without_crosstalk():
+    terms = [server.schedule_terms(1000, 5, 12, 'compound', 'Monthly', '2024-01-01'),
+             server.schedule_terms(200, 0, 1, 'simple', 'One Time', '2024-01-01'),
+             server.schedule_terms(300, 20, 4, 'simple', 'Weekly', '2024-01-01')]
+    batch = server.compute_schedules(terms)
+    assert batch == [server.compute_schedules([t])[0] for t in terms]
+    assert [r['periods'] for r in batch] == [12, 1, 4]
+
+@pytest.mark.parametrize('args, message', [
+    ((100, 5, 0), 'months must be between'),
+    ((-1, 5, 12), 'amount must be positive'),
+    ((100, 5, 12, 'daily'), 'Unknown interest type'),
+    ((100, 5, 12, 'simple', 'Yearly'), 'Unknown payment frequency'),
+    ((100, 5, 12, 'simple', 'Monthly', '15/01/2024'), 'YYYY-MM-DD'),
+])
+def test_invalid_terms_are_rejected(args, message):
+    with pytest.raises(ValueError, match=message):
+        server.schedule_terms(*args)
+
+def test_schedules_endpoint(client, register):
+    lender, auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+    loan = {'role': 'lender', 'counterpartyEmail': borrower, 'amount': 1200, 'rate': 12, 'months': 12,
+            'interestType': 'compound', 'paymentFrequency': 'Monthly', 'loanDate': '2024-01-15'}
+    loan_id = client.post('/api/loans', json=loan, headers=auth).json['id']
+    _, stranger_auth = register('stranger')
+
+    assert client.post('/api/schedules', json={'loans': [loan]}).status_code == 401
+    resp = client.post('/api/schedules', json={'loans': [loan], 'loanIds': [loan_id]}, headers=borrower_auth)
+    assert resp.status_code == 200
+    submitted, stored = resp.json['schedules']
+    assert stored['id'] == loan_id
+    assert {k: v for k, v in stored.items() if k != 'id'} == submitted
+    assert submitted['installment'] == pytest.approx(preview(1200, 12, 12, 'compound', 'Monthly')[0], abs=0.01)
+
+    totals = client.post('/api/schedules', json={'loans': [loan], 'includeSchedule': False}, headers=auth).json
+    assert 'schedule' not in totals['schedules'][0]
+    # Other people's loans are left out
+    assert client.post('/api/schedules', json={'loanIds': [loan_id]}, headers=stranger_auth).json == {'schedules': []}
+    resp = client.post('/api/schedules', json={'loans': [loan, {**loan, 'paymentFrequency': 'Yearly'}]}, headers=auth)
+    assert resp.status_code == 400 and resp.json['error'].startswith('loans[1]:')
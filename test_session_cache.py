@@ -0,0 +1,20 @@
+import uuid
+
+import server
+
+def test_row_read_before_an_invalidation_is_not_cached():
+    client = server.app.test_client()
+    email = f"user_{uuid.uuid4().hex[:8]}@example.com"
+    old_token = client.post('/api/register', json={'email': email, 'password': 'password123', 'name': 'U'}).json['token']
+    conn = server.db_pool.acquire()
+    try:
+        # A request thread misses the cache and reads the user row...
+        generation = server.session_cache.generation()
+        stale = conn.execute('SELECT * FROM users WHERE token = ?', (old_token,)).fetchone()
+    finally:
+        server.db_pool.release(conn)
+    # ...while a login rotates the token and commits
+    assert client.post('/api/login', json={'email': email, 'password': 'password123'}).status_code == 200
+    server.session_cache.put(old_token, stale, generation)
+
+    assert client.get('/api/profile', headers={'Authorization': f"Bearer {old_token}"}).status_code == 401
@@ -0,0 +1,81 @@
+import gc
+import sqlite3
+import threading
+
+import server
+
+SECRET = 'needle-7f3a'
+
+def scan_table(rows=200000):
+    conn = sqlite3.connect(':memory:', factory=server.InstrumentedConnection)
+    sqlite3.Connection.execute(conn, 'CREATE TABLE t (id INTEGER PRIMARY KEY, body TEXT)')
+    sqlite3.Connection.executemany(conn, 'INSERT INTO t (body) VALUES (?)',
+                                   ((f'row {i} {SECRET if i % 1000 == 0 else ""}',) for i in range(rows)))
+    return conn
+
+def test_slow_scan_is_timed_through_the_fetch(monkeypatch, capsys):
+    log = server.SlowQueryLog(threshold_ms='5')
+    monkeypatch.setattr(server, 'slow_query_log', log)
+    conn = scan_table()
+
+    # The first match is row 0, so execute() returns at once; the scan runs in fetchall()
+    cursor = conn.execute('SELECT id FROM t WHERE body LIKE ?', (f'%{SECRET}%',))
+    assert len(cursor.fetchall()) == 200
+
+    [entry] = [e for e in log.top() if e['sql'].startswith('SELECT id FROM t')]
+    assert entry['calls'] == 1 and entry['slow_calls'] == 1
+    assert entry['max_ms'] >= 5
+    assert any('SCAN t' in step for step in entry['plan'])
+    out = capsys.readouterr().out
+    assert "🐢 Slow SQL" in out and "params=['str']" in out
+    assert SECRET not in out
+
+def test_iterated_rows_count_toward_request_sql_time(monkeypatch):
+    monkeypatch.setattr(server, 'slow_query_log', server.SlowQueryLog(threshold_ms='5'))
+    conn = scan_table()
+    server.request_sql.active, server.request_sql.count, server.request_sql.seconds = True, 0, 0.0
+    try:
+        cursor = conn.execute('SELECT id FROM t WHERE body LIKE ?', (f'%{SECRET}%',))
+        started_at = server.request_sql.seconds
+        assert sum(1 for _ in cursor) == 200
+        assert server.request_sql.count == 1
+        assert server.request_sql.seconds > started_at
+        assert server.slow_query_log.top()[0]['slow_calls'] == 1
+    finally:
+        server.request_sql.active = False
+
+def test_half_read_statements_are_logged_by_their_owner_on_release(monkeypatch, tmp_path):
+    log = server.SlowQueryLog(threshold_ms='0')
+    monkeypatch.setattr(server, 'slow_query_log', log)
+    explained_on = []
+    record = log.record
+    monkeypatch.setattr(log, 'record', lambda conn, *args, **kw: (explained_on.append(threading.get_ident()),
+                                                                   record(conn, *args, **kw)))
+    pool = server.ConnectionPool(str(tmp_path / 'trace.db'), max_size=1)
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+    conn.executemany('INSERT INTO t (id) VALUES (?)', [(i,) for i in range(10)])
+    conn.finish_statements()  # the PRAGMAs run when the pool opens the connection
+    explained_on.clear()
+
+    assert conn.execute('SELECT id FROM t ORDER BY id').fetchone()[0] == 0
+    gc.collect()  # the cursor is gone, but its statement isn't logged from __del__
+    assert explained_on == [] and len(conn.open_statements) == 1
+
+    pool.release(conn)
+    assert explained_on == [threading.get_ident()] and conn.open_statements == {}
+    [entry] = [e for e in log.top() if e['sql'].startswith('SELECT id FROM t')]
+    assert entry['calls'] == 1 and entry['plan']
+    pool.close_all()
+
+def test_exhausted_and_closed_cursors_are_logged_once(monkeypatch):
+    log = server.SlowQueryLog(threshold_ms='1000')
+    monkeypatch.setattr(server, 'slow_query_log', log)
+    conn = scan_table(100)
+    conn.execute('SELECT id FROM t').fetchall()
+    cursor = conn.execute('SELECT body FROM t')
+    cursor.fetchmany(10)
+    cursor.close()
+    conn.finish_statements()
+    assert conn.open_statements == {}
+    assert {e['sql']: e['calls'] for e in log.top()} == {'SELECT id FROM t': 1, 'SELECT body FROM t': 1}
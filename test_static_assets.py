@@ -0,0 +1,33 @@
+import pytest
+
+import server
+
+def test_only_the_built_front_end_is_served(client):
+    assert client.get('/').status_code == 200
+    for path in ('/server.py', '/loanlink.db', '/requests.jsonl', '/app.js', '/static/server.py',
+                 '/static/index.html'):
+        # The catch-all error handler turns the 404 into a 500, but nothing is served
+        assert client.get(path).status_code != 200, path
+
+def test_index_links_fingerprinted_assets(client):
+    html = client.get('/').get_data(as_text=True)
+    names = [name for name in server.static_assets if name != 'index.html']
+    assert len(names) == len(server.STATIC_ASSETS)
+    for name in names:
+        assert f'"/static/{name}"' in html
+        resp = client.get(f'/static/{name}')
+        assert resp.status_code == 200 and resp.headers['Cache-Control'] == server.IMMUTABLE_CACHE
+
+@pytest.mark.parametrize('accept', ['identity', 'gzip'])
+def test_any_variant_etag_revalidates(client, accept):
+    etag = client.get('/', headers={'Accept-Encoding': accept}).headers['ETag']
+    for encoding in ('identity', 'gzip'):
+        resp = client.get('/', headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+        assert resp.status_code == 304 and resp.data == b''
+    assert client.get('/', headers={'If-None-Match': f'"other", {etag}'}).status_code == 304
+    assert client.get('/', headers={'If-None-Match': '*'}).status_code == 304
+
+def test_etags_must_match_exactly(client):
+    digest = server.static_assets['index.html']['digest']
+    for tag in (f'"{digest}x"', f'"{digest}-zstd"', f'"{digest[:8]}"'):
+        assert client.get('/', headers={'If-None-Match': tag}).status_code == 200, tag
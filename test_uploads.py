@@ -0,0 +1,171 @@
+import io
+import os
+import uuid
+
+import pytest
+from werkzeug.exceptions import UnsupportedMediaType
+
+import server
+
+def active_loan(client, register):
+    """An accepted loan; returns (loan_id, lender auth headers, borrower auth headers)"""
+    _, lender_auth = register('lender')
+    borrower, borrower_auth = register('borrower')
+    resp = client.post('/api/loans', json={'role': 'lender', 'counterpartyEmail': borrower, 'amount': 1000,
+                                           'rate': 0, 'months': 1, 'interestType': 'simple'}, headers=lender_auth)
+    loan_id = resp.json['id']
+    assert client.post(f'/api/loans/{loan_id}/accept', headers=borrower_auth).status_code == 200
+    return loan_id, lender_auth, borrower_auth
+
+def png():
+    """PNG bytes unique to the calling test, so dedupe doesn't reach across tests"""
+    return b'\x89PNG\r\n\x1a\n' + uuid.uuid4().bytes * 64
+
+def pay_with_proof(client, loan_id, auth, data, filename='proof.png', content_type='image/png'):
+    return client.post(f'/api/loans/{loan_id}/pay',
+                       data={'amount': '10', 'method': 'Card', 'proof': (io.BytesIO(data), filename, content_type)},
+                       headers=auth, content_type='multipart/form-data')
+
+def query(sql, params=()):
+    conn = server.db_pool.acquire()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        server.db_pool.release(conn)
+
+def test_same_proof_is_stored_once_and_collected_when_unreferenced(client, register):
+    loan_id, _, auth = active_loan(client, register)
+    data = png()
+    assert pay_with_proof(client, loan_id, auth, data).status_code == 200
+    assert pay_with_proof(client, loan_id, auth, data, filename='again.png').status_code == 200
+
+    [upload] = query('SELECT * FROM uploads WHERE size = ? AND hash IN (SELECT proof_hash FROM payments WHERE loan_id = ?)',
+                     (len(data), loan_id))
+    assert upload['refcount'] == 2
+    path = os.path.join(server.UPLOADS_DIR, upload['path'])
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    proofs = {row['proof_image'] for row in query('SELECT proof_image FROM payments WHERE loan_id = ?', (loan_id,))}
+    assert proofs == {f"/uploads/{upload['path']}"}
+
+    # No API path deletes a loan with payments today (only pending, rejected or
+    # cancelled loans can be deleted), so drop the payments directly
+    conn = server.db_pool.acquire()
+    try:
+        first, second = [row['id'] for row in conn.execute('SELECT id FROM payments WHERE loan_id = ?', (loan_id,))]
+        conn.execute('DELETE FROM payments WHERE id = ?', (first,))
+        assert server.remove_orphan_uploads(conn) == []
+        conn.commit()
+        conn.execute('DELETE FROM payments WHERE id = ?', (second,))
+        orphans = server.remove_orphan_uploads(conn)
+        assert orphans == [(upload['hash'], upload['path'])]
+        # Nothing is deleted before the commit, so a rollback loses nothing
+        assert os.path.exists(path)
+        conn.commit()
+        server.delete_upload_files(conn, orphans)
+    finally:
+        server.db_pool.release(conn)
+    assert not os.path.exists(path)
+    assert query('SELECT 1 FROM uploads WHERE hash = ?', (upload['hash'],)) == []
+
+def test_rolled_back_collection_keeps_the_file(client, register):
+    loan_id, _, auth = active_loan(client, register)
+    assert pay_with_proof(client, loan_id, auth, png()).status_code == 200
+    [upload] = query('SELECT u.* FROM uploads u JOIN payments p ON p.proof_hash = u.hash WHERE p.loan_id = ?', (loan_id,))
+
+    conn = server.db_pool.acquire()
+    try:
+        conn.execute('DELETE FROM payments WHERE loan_id = ?', (loan_id,))
+        assert server.remove_orphan_uploads(conn) == [(upload['hash'], upload['path'])]
+        conn.rollback()
+    finally:
+        server.db_pool.release(conn)
+    assert os.path.exists(os.path.join(server.UPLOADS_DIR, upload['path']))
+    assert query('SELECT refcount FROM uploads WHERE hash = ?', (upload['hash'],))[0][0] == 1
+
+def test_files_re_uploaded_before_deletion_are_kept(client, register):
+    loan_id, _, auth = active_loan(client, register)
+    data = png()
+    assert pay_with_proof(client, loan_id, auth, data).status_code == 200
+    conn = server.db_pool.acquire()
+    try:
+        conn.execute('DELETE FROM payments WHERE loan_id = ?', (loan_id,))
+        orphans = server.remove_orphan_uploads(conn)
+        conn.commit()
+    finally:
+        server.db_pool.release(conn)
+    # The same proof comes back between the commit and the file deletion
+    assert pay_with_proof(client, loan_id, auth, data).status_code == 200
+    conn = server.db_pool.acquire()
+    try:
+        server.delete_upload_files(conn, orphans)
+    finally:
+        server.db_pool.release(conn)
+    with open(os.path.join(server.UPLOADS_DIR, orphans[0][1]), 'rb') as f:
+        assert f.read() == data
+
+def test_oversized_proof_is_rejected_with_413(monkeypatch, client, register):
+    monkeypatch.setattr(server, 'UPLOAD_MAX_BYTES', 1024)
+    loan_id, _, auth = active_loan(client, register)
+
+    resp = pay_with_proof(client, loan_id, auth, png())
+    assert resp.status_code == 413
+    assert query('SELECT COUNT(*) FROM payments WHERE loan_id = ?', (loan_id,))[0][0] == 0
+    assert os.listdir(server.UPLOAD_TMP_DIR) == []
+
+def test_non_image_proof_is_rejected_with_415(client, register):
+    loan_id, _, auth = active_loan(client, register)
+
+    # Declared as text
+    assert pay_with_proof(client, loan_id, auth, b'hello', 'notes.txt', 'text/plain').status_code == 415
+    # Declared as an image, but the bytes aren't one
+    assert pay_with_proof(client, loan_id, auth, b'<html>' * 100, 'fake.png', 'image/png').status_code == 415
+    assert query('SELECT COUNT(*) FROM payments WHERE loan_id = ?', (loan_id,))[0][0] == 0
+
+def test_upload_limits_only_apply_to_payment_proofs(monkeypatch):
+    monkeypatch.setattr(server, 'UPLOAD_MAX_BYTES', 4)
+    form = lambda: {'notes': (io.BytesIO(b'plain text notes'), 'notes.txt', 'text/plain')}
+    with server.app.test_request_context('/api/listings', method='POST', data=form()):
+        assert server.request.files['notes'].read() == b'plain text notes'
+    with server.app.test_request_context('/api/listings', method='POST', data=form()):
+        server.request.accept_proof_upload()
+        with pytest.raises(UnsupportedMediaType):
+            server.request.files
+
+def proof_url(client, loan_id, auth):
+    """The signed proof_image URL the API hands out for the loan's first payment"""
+    [loan] = [l for l in client.get('/api/loans', headers=auth).json if l['id'] == loan_id]
+    return loan['history'][0]['proof_image']
+
+def test_proofs_need_a_signature_or_a_participant(client, register):
+    loan_id, lender_auth, borrower_auth = active_loan(client, register)
+    data = png()
+    assert pay_with_proof(client, loan_id, borrower_auth, data).status_code == 200
+    signed = proof_url(client, loan_id, lender_auth)
+    unsigned = signed.split('?')[0]
+    _, stranger_auth = register('stranger')
+
+    resp = client.get(signed)
+    assert resp.status_code == 200 and resp.data == data
+    assert client.get(unsigned).status_code == 404
+    assert client.get(unsigned, headers=stranger_auth).status_code == 404
+    assert client.get(unsigned, headers=lender_auth).status_code == 200
+    assert client.get(signed.rsplit('sig=', 1)[0] + 'sig=' + 'x' * 32).status_code == 404
+    expired = unsigned + '?expires=1&sig=' + server.upload_signature(unsigned[len('/uploads/'):], 1)
+    assert client.get(expired).status_code == 404
+    assert client.get('/uploads/tmp/anything', headers=lender_auth).status_code == 404
+
+def test_proofs_answer_range_and_conditional_requests(client, register):
+    loan_id, _, auth = active_loan(client, register)
+    data = png()
+    assert pay_with_proof(client, loan_id, auth, data).status_code == 200
+    signed = proof_url(client, loan_id, auth)
+
+    resp = client.get(signed, headers={'Range': 'bytes=0-7'})
+    assert resp.status_code == 206 and resp.data == data[:8]
+    assert resp.headers['Content-Range'] == f'bytes 0-7/{len(data)}'
+
+    etag = client.get(signed).headers['ETag']
+    assert etag.strip('"') in signed  # the content hash
+    resp = client.get(signed, headers={'If-None-Match': etag})
+    assert resp.status_code == 304 and resp.data == b''